@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from synthetic_corpus import generate_corpus
+
+DEFAULT_OUTPUT_DIR = "backend/data/benchmarks"
+
+# Metric compared against a baseline run, per stage, in order of preference
+RATE_METRICS = ('mb_per_s', 'items_per_s')
+
+
+class NullChunkWriter:
+    """Counts rows instead of storing them, for end-to-end runs without a vector store."""
+
+    def __init__(self):
+        self.rows = 0
+
+    def write_chunks(self, records, embeddings) -> int:
+        self.rows += len(records)
+        return len(records)
+
+    def delete_chunks(self, row_ids):
+        pass
+
+
+def stage_result(seconds: float, items: int, size_bytes: Optional[int] = None, **extra) -> Dict:
+    result = {'seconds': round(seconds, 4), 'items': items,
+              'items_per_s': round(items / seconds, 2) if seconds else None}
+    if size_bytes is not None:
+        result['bytes'] = size_bytes
+        result['mb_per_s'] = round(size_bytes / seconds / 1e6, 3) if seconds else None
+    result.update(extra)
+    return result
+
+
+def timed(function: Callable, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def chroma_collection(directory: str, name: str):
+    """Fresh collection for a benchmark, or None when chromadb is not installed."""
+    try:
+        import chromadb
+    except ImportError:
+        return None
+    client = chromadb.PersistentClient(path=directory)
+    return client.create_collection(name=name)
+
+
+def make_records(chunks: List[str], document_id: str) -> List:
+    from ingest_pipeline import ChunkRecord
+    from source_manifest import chunk_hash
+
+    return [ChunkRecord('file', 'benchmark', document_id, position, chunk_hash(chunk), chunk)
+            for position, chunk in enumerate(chunks)]
+
+
+def bench_write(writer, records: List, embeddings: List[List[float]], batch_size: int) -> Dict:
+    started = time.perf_counter()
+    for start in range(0, len(records), batch_size):
+        writer.write_chunks(records[start:start + batch_size], embeddings[start:start + batch_size])
+    result = stage_result(time.perf_counter() - started, len(records), batch_size=batch_size)
+    writer.delete_chunks([record.row_id for record in records])
+    return result
+
+
+def run_benchmarks(args, workdir: str) -> Dict:
+    from fake_embedding_server import create_server
+
+    server = create_server(port=0, dimension=args.dimension, throttle_rate=args.throttle_rate,
+                           latency=args.latency, error_rate=args.error_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    # The indexer reads its configuration from the environment on first use
+    os.environ.update({
+        'GEMINI_API_KEY': 'benchmark',
+        'GEMINI_API_BASE': f"http://127.0.0.1:{server.server_address[1]}",
+        'EMBEDDING_BACKEND': 'gemini',
+        'EMBEDDING_DIMENSION': str(args.dimension),
+        'EMBEDDING_RPS': str(args.rps),
+        'EMBEDDING_CACHE_PATH': os.path.join(workdir, 'embedding_cache.sqlite3'),
+        'RAG_SNAPSHOT_DIR': os.path.join(workdir, 'snapshots'),
+    })
+    import ingest_runtime
+    from embedding_backends import HashedNgramEmbedder
+    from embedding_cache import EmbeddingCache, embed_with_cache
+    from ingest_pipeline import IngestPipeline
+    from rag_indexer import ChromaChunkWriter
+    from source_manifest import SourceManifest
+    from sqlalchemy import create_engine
+
+    try:
+        formats = args.formats.split(',')
+        print(f"Generating {args.size_mb} MB per format ({', '.join(formats)})...")
+        corpus, corpus_seconds = timed(generate_corpus, os.path.join(workdir, 'corpus'), args.size_mb, formats,
+                                       args.files)
+        stages = {}
+
+        # load_document, serial, per format
+        texts = []
+        for extension, paths in corpus.items():
+            loaded, seconds = timed(lambda: [ingest_runtime.load_document(path) for path in paths])
+            size = sum(len(text.encode('utf-8')) for text in loaded)
+            stages[f'load_{extension}'] = stage_result(seconds, len(paths), size)
+            texts.extend(loaded)
+            if extension in ('pdf', 'docx'):
+                pool = ingest_runtime.get_extraction_pool()
+                # Start the worker processes outside the measurement
+                list(pool.executor.map(abs, range(pool.workers)))
+                pages, seconds = timed(
+                    lambda: [page for path in paths for page in ingest_runtime.load_source_pages('file', path)])
+                stages[f'load_{extension}_parallel'] = stage_result(
+                    seconds, len(paths), sum(len(page.encode('utf-8')) for page in pages), workers=pool.workers)
+
+        # split_text_into_chunks
+        text = "\n\n".join(texts)
+        chunks, seconds = timed(ingest_runtime.split_text_into_chunks, text)
+        stages['split'] = stage_result(seconds, len(chunks), len(text.encode('utf-8')))
+
+        # generate_embeddings: cold cache through the fake API, then fully cached
+        sample = list(dict.fromkeys(chunks))[:args.embed_chunks]
+        engine = ingest_runtime.get_embedding_engine()
+        requests_before = server.request_count
+        embeddings, seconds = timed(ingest_runtime.generate_embeddings, sample)
+        stages['embed'] = stage_result(
+            seconds, len(sample), failed=sum(embedding is None for embedding in embeddings),
+            api_requests=server.request_count - requests_before, server_errors=server.error_count,
+            throttles=engine.rate_limiter.throttle_count, concurrency=engine.concurrency, batch_size=engine.batch_size)
+        _, seconds = timed(ingest_runtime.generate_embeddings, sample)
+        stages['embed_cached'] = stage_result(seconds, len(sample))
+        # The offline backend, for comparison with the API round trips above
+        local = HashedNgramEmbedder(dimension=args.dimension)
+        _, seconds = timed(local.embed, sample)
+        stages['embed_local'] = stage_result(seconds, len(sample), sum(len(chunk.encode('utf-8')) for chunk in sample))
+
+        # Vector store writes
+        records = make_records(sample, 'benchmark')
+        ok = [(record, embedding) for record, embedding in zip(records, embeddings) if embedding is not None]
+        records, embeddings = [record for record, _ in ok], [embedding for _, embedding in ok]
+        write_batch = engine.batch_size * engine.concurrency
+        collection = chroma_collection(os.path.join(workdir, 'chromadb'), 'benchmark_write')
+        if collection is not None:
+            stages['write_chroma'] = bench_write(ChromaChunkWriter(collection), records, embeddings,
+                                                 write_batch)
+        else:
+            stages['write_chroma'] = {'skipped': 'chromadb is not installed'}
+        if args.postgres_user_id is not None and os.getenv('DATABASE_URL'):
+            import rag_indexer_postgres
+            from pg_bulk_writer import BulkChunkWriter
+
+            writer = BulkChunkWriter(rag_indexer_postgres.get_engine(), args.postgres_user_id)
+            pg_records = make_records([record.text for record in records], f"benchmark_{os.getpid()}")
+            stages['write_postgres'] = bench_write(writer, pg_records, embeddings, write_batch)
+        else:
+            stages['write_postgres'] = {'skipped': 'needs DATABASE_URL and --postgres-user-id'}
+
+        # End to end through the ingestion pipeline, with a cold cache of its own
+        e2e_collection = chroma_collection(os.path.join(workdir, 'chromadb'), 'benchmark_end_to_end')
+        writer = ChromaChunkWriter(e2e_collection) if e2e_collection is not None else NullChunkWriter()
+        e2e_cache = EmbeddingCache(os.path.join(workdir, 'e2e_cache.sqlite3'))
+        pipeline = IngestPipeline(
+            manifest=SourceManifest(create_engine(f"sqlite:///{os.path.join(workdir, 'manifest.sqlite3')}"),
+                                    'benchmark'),
+            writer=writer,
+            embed=lambda batch: embed_with_cache(engine, e2e_cache, batch),
+            split=ingest_runtime.split_text_into_chunks,
+            load_pages=ingest_runtime.load_source_pages,
+            chunker_params=ingest_runtime.CHUNKER_PARAMS,
+            batch_size=write_batch,
+            lookahead=ingest_runtime.get_extraction_pool().workers,
+            log=lambda message: None,
+        )
+        sources = [{'type': 'file', 'path': path} for paths in corpus.values() for path in paths]
+        size = sum(os.path.getsize(source['path']) for source in sources)
+        stats, seconds = timed(pipeline.run, sources)
+        stages['end_to_end'] = stage_result(seconds, stats['chunks_indexed'], size,
+                                            writer='chroma' if e2e_collection is not None else 'null', **stats)
+    finally:
+        ingest_runtime.shutdown_extraction_pool()
+        server.shutdown()
+
+    return {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {
+            'size_mb': args.size_mb, 'formats': formats, 'files_per_format': args.files,
+            'embed_chunks': args.embed_chunks, 'latency': args.latency, 'error_rate': args.error_rate,
+            'throttle_rate': args.throttle_rate, 'rps': args.rps, 'dimension': args.dimension,
+        },
+        'corpus_seconds': round(corpus_seconds, 3),
+        'stages': stages,
+    }
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    List stages whose throughput fell more than ``tolerance`` below the baseline.
+
+    Returns:
+        List[str]: One message per regressed stage
+    """
+    regressions = []
+    for name, stage in current['stages'].items():
+        previous = baseline.get('stages', {}).get(name, {})
+        for metric in RATE_METRICS:
+            if stage.get(metric) and previous.get(metric):
+                if stage[metric] < previous[metric] * (1 - tolerance):
+                    regressions.append(f"{name}: {metric} {stage[metric]} < baseline {previous[metric]}")
+                break
+    return regressions
+
+
+def print_summary(report: Dict):
+    print(f"{'stage':<22}{'seconds':>10}{'items/s':>12}{'MB/s':>10}")
+    for name, stage in report['stages'].items():
+        if 'skipped' in stage:
+            print(f"{name:<22}  skipped: {stage['skipped']}")
+            continue
+        print(f"{name:<22}{stage['seconds']:>10.3f}{stage['items_per_s'] or 0:>12.1f}"
+              f"{stage.get('mb_per_s') or 0:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stage-level benchmarks for the RAG indexer")
+    parser.add_argument('--size-mb', type=float, default=2.0, help="Synthetic text per format")
+    parser.add_argument('--formats', default='txt,pdf,docx')
+    parser.add_argument('--files', type=int, default=2, help="Files per format")
+    parser.add_argument('--embed-chunks', type=int, default=2000, help="Chunks sent through generate_embeddings")
+    parser.add_argument('--latency', type=float, default=0.05, help="Fake API latency per request, in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of fake API requests failing with 500")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Fraction answered with 429")
+    parser.add_argument('--rps', type=float, default=50.0, help="EMBEDDING_RPS for the embedding engine")
+    parser.add_argument('--dimension', type=int, default=768)
+    parser.add_argument('--postgres-user-id', type=int,
+                        help="Also benchmark COPY into rag_chunks (DATABASE_URL) as this user; rows are removed after")
+    parser.add_argument('--output', help=f"Result file (default: {DEFAULT_OUTPUT_DIR}/<timestamp>.json)")
+    parser.add_argument('--baseline', help="Earlier result file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help="Allowed throughput drop against the baseline before failing")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='rag-benchmark-') as workdir:
+        report = run_benchmarks(args, workdir)
+
+    output = args.output or os.path.join(DEFAULT_OUTPUT_DIR, time.strftime('%Y%m%dT%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print_summary(report)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"Regression: {message}")
+        sys.exit(1 if regressions else 0)
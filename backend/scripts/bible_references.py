@@ -0,0 +1,399 @@
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from ingest_pipeline import ChunkRecord, ChunkWriter
+from lexical_index import doc_key, fold_accents
+
+# Canonical verse ids are book * BOOK_STRIDE + chapter * CHAPTER_STRIDE + verse,
+# so a passage is a contiguous integer interval and ids sort in canonical order
+BOOK_STRIDE = 1_000_000
+CHAPTER_STRIDE = 1000
+# Verse range given to a reference to a whole chapter ("Salmos 23")
+LAST_VERSE = CHAPTER_STRIDE - 1
+
+# (OSIS id, Portuguese name, other names, abbreviations), in canonical order
+BOOKS = (
+    ('Gen', 'Gênesis', (), ('Gn',)),
+    ('Exod', 'Êxodo', (), ('Êx', 'Ex')),
+    ('Lev', 'Levítico', (), ('Lv',)),
+    ('Num', 'Números', (), ('Nm',)),
+    ('Deut', 'Deuteronômio', (), ('Dt',)),
+    ('Josh', 'Josué', (), ('Js',)),
+    ('Judg', 'Juízes', (), ('Jz',)),
+    ('Ruth', 'Rute', (), ('Rt',)),
+    ('1Sam', '1 Samuel', (), ('1Sm',)),
+    ('2Sam', '2 Samuel', (), ('2Sm',)),
+    ('1Kgs', '1 Reis', (), ('1Rs',)),
+    ('2Kgs', '2 Reis', (), ('2Rs',)),
+    ('1Chr', '1 Crônicas', (), ('1Cr',)),
+    ('2Chr', '2 Crônicas', (), ('2Cr',)),
+    ('Ezra', 'Esdras', (), ('Ed', 'Esd')),
+    ('Neh', 'Neemias', (), ('Ne',)),
+    ('Esth', 'Ester', (), ('Et',)),
+    ('Job', 'Jó', (), ('Jó',)),
+    ('Ps', 'Salmos', ('Salmo',), ('Sl',)),
+    ('Prov', 'Provérbios', (), ('Pv',)),
+    ('Eccl', 'Eclesiastes', (), ('Ec',)),
+    ('Song', 'Cantares', ('Cânticos', 'Cântico'), ('Ct',)),
+    ('Isa', 'Isaías', (), ('Is',)),
+    ('Jer', 'Jeremias', (), ('Jr',)),
+    ('Lam', 'Lamentações', (), ('Lm',)),
+    ('Ezek', 'Ezequiel', (), ('Ez',)),
+    ('Dan', 'Daniel', (), ('Dn',)),
+    ('Hos', 'Oséias', ('Oseias',), ('Os',)),
+    ('Joel', 'Joel', (), ('Jl',)),
+    ('Amos', 'Amós', (), ('Am',)),
+    ('Obad', 'Obadias', (), ('Ob',)),
+    ('Jonah', 'Jonas', (), ('Jn',)),
+    ('Mic', 'Miquéias', ('Miqueias',), ('Mq',)),
+    ('Nah', 'Naum', (), ('Na',)),
+    ('Hab', 'Habacuque', (), ('Hc',)),
+    ('Zeph', 'Sofonias', (), ('Sf',)),
+    ('Hag', 'Ageu', (), ('Ag',)),
+    ('Zech', 'Zacarias', (), ('Zc',)),
+    ('Mal', 'Malaquias', (), ('Ml',)),
+    ('Matt', 'Mateus', (), ('Mt',)),
+    ('Mark', 'Marcos', (), ('Mc',)),
+    ('Luke', 'Lucas', (), ('Lc',)),
+    ('John', 'João', (), ('Jo',)),
+    ('Acts', 'Atos', (), ('At',)),
+    ('Rom', 'Romanos', (), ('Rm',)),
+    ('1Cor', '1 Coríntios', (), ('1Co',)),
+    ('2Cor', '2 Coríntios', (), ('2Co',)),
+    ('Gal', 'Gálatas', (), ('Gl',)),
+    ('Eph', 'Efésios', (), ('Ef',)),
+    ('Phil', 'Filipenses', (), ('Fp',)),
+    ('Col', 'Colossenses', (), ('Cl',)),
+    ('1Thess', '1 Tessalonicenses', (), ('1Ts',)),
+    ('2Thess', '2 Tessalonicenses', (), ('2Ts',)),
+    ('1Tim', '1 Timóteo', (), ('1Tm',)),
+    ('2Tim', '2 Timóteo', (), ('2Tm',)),
+    ('Titus', 'Tito', (), ('Tt',)),
+    ('Phlm', 'Filemom', ('Filemon',), ('Fm',)),
+    ('Heb', 'Hebreus', (), ('Hb',)),
+    ('Jas', 'Tiago', (), ('Tg',)),
+    ('1Pet', '1 Pedro', (), ('1Pe',)),
+    ('2Pet', '2 Pedro', (), ('2Pe',)),
+    ('1John', '1 João', (), ('1Jo',)),
+    ('2John', '2 João', (), ('2Jo',)),
+    ('3John', '3 João', (), ('3Jo',)),
+    ('Jude', 'Judas', (), ('Jd',)),
+    ('Rev', 'Apocalipse', (), ('Ap',)),
+)
+
+
+def _alias_key(name: str) -> str:
+    return re.sub(r'[\s.ªº]', '', name.lower())
+
+
+def _build_aliases() -> Dict[str, Tuple[int, bool]]:
+    """Lookup key -> (book number, is abbreviation); exact spellings win over accent-folded ones."""
+    exact, folded = {}, {}
+    for number, (_, name, other_names, abbreviations) in enumerate(BOOKS, start=1):
+        for alias, is_abbreviation in [(name, False)] + [(n, False) for n in other_names] + \
+                                      [(a, True) for a in abbreviations]:
+            exact[_alias_key(alias)] = (number, is_abbreviation)
+            folded.setdefault(fold_accents(_alias_key(alias)), (number, is_abbreviation))
+    return {**folded, **exact}
+
+
+BOOK_ALIASES = _build_aliases()
+
+# Abbreviations that are also common Portuguese words; these need a verse
+# ("Os 2:19") before they count as a reference, others only a chapter ("Ap 21")
+AMBIGUOUS_ABBREVIATIONS = frozenset(('os', 'is', 'at', 'am', 'na', 'ne', 'ed', 'et', 'ex'))
+
+# "1 Coríntios 13:4-7", "Jo 3.16", "Rm 8:28-30", "Gn 1:1-2:3", "Salmos 23", "1Co 13"
+REFERENCE_PATTERN = re.compile(r"""
+    (?<![\w])
+    (?:(?P<ordinal>[123])\s*[ªº]?\s*)?
+    (?P<book>[^\W\d_]+)\.?\s*
+    (?P<chapter>\d{1,3})
+    (?:\s*[:.,]\s*(?P<verse>\d{1,3}))?
+    (?:\s*[-–]\s*(?P<to>\d{1,3})(?:\s*[:.]\s*(?P<to_verse>\d{1,3}))?)?
+    (?![\d\w])
+""", re.VERBOSE)
+
+
+def verse_id(book: int, chapter: int, verse: int) -> int:
+    return book * BOOK_STRIDE + chapter * CHAPTER_STRIDE + verse
+
+
+class PassageRange:
+    """An inclusive interval of canonical verse ids within one book."""
+
+    def __init__(self, start: int, end: int):
+        self.start = start
+        self.end = end
+
+    @property
+    def book(self) -> int:
+        return self.start // BOOK_STRIDE
+
+    @property
+    def osis(self) -> str:
+        """OSIS form, e.g. "Rom.8.28-Rom.8.30" or "Ps.23" for a whole chapter."""
+        def label(verse: int, whole_chapter: bool) -> str:
+            code = BOOKS[verse // BOOK_STRIDE - 1][0]
+            chapter = verse % BOOK_STRIDE // CHAPTER_STRIDE
+            return f"{code}.{chapter}" if whole_chapter else f"{code}.{chapter}.{verse % CHAPTER_STRIDE}"
+
+        whole = self.start % CHAPTER_STRIDE == 1 and self.end % CHAPTER_STRIDE == LAST_VERSE
+        first, last = label(self.start, whole), label(self.end, whole)
+        return first if first == last else f"{first}-{last}"
+
+    def chapters(self) -> List['PassageRange']:
+        """Split into per-chapter ranges, the unit the verse index stores."""
+        parts = []
+        start = self.start
+        while start <= self.end:
+            chapter_end = start - start % CHAPTER_STRIDE + LAST_VERSE
+            parts.append(PassageRange(start, min(self.end, chapter_end)))
+            start = chapter_end + 2
+        return parts
+
+    def overlap(self, other: 'PassageRange') -> int:
+        return max(0, min(self.end, other.end) - max(self.start, other.start) + 1)
+
+    def __len__(self) -> int:
+        return self.end - self.start + 1
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, PassageRange) and (self.start, self.end) == (other.start, other.end)
+
+    def __hash__(self) -> int:
+        return hash((self.start, self.end))
+
+    def __repr__(self) -> str:
+        return f"PassageRange({self.osis})"
+
+
+def _range_from_match(match) -> Optional[PassageRange]:
+    key = _alias_key((match.group('ordinal') or '') + match.group('book'))
+    found = BOOK_ALIASES.get(key) or BOOK_ALIASES.get(fold_accents(key))
+    if found is None:
+        return None
+    book, is_abbreviation = found
+    verse = match.group('verse')
+    # Short abbreviations collide with ordinary words ("os 12 apóstolos"), so
+    # they only count when capitalized
+    if is_abbreviation and (not match.group('book')[0].isupper()
+                            or verse is None and fold_accents(key) in AMBIGUOUS_ABBREVIATIONS):
+        return None
+
+    chapter = int(match.group('chapter'))
+    to, to_verse = match.group('to'), match.group('to_verse')
+    if verse is None:
+        # "Gn 1" or the chapter range "Gn 1-3"
+        start = verse_id(book, chapter, 1)
+        end = verse_id(book, int(to) if to else chapter, LAST_VERSE)
+    elif to_verse is not None:
+        # "Gn 1:1-2:3"
+        start = verse_id(book, chapter, int(verse))
+        end = verse_id(book, int(to), int(to_verse))
+    else:
+        # "Rm 8:28" or "Rm 8:28-30"
+        start = verse_id(book, chapter, int(verse))
+        end = verse_id(book, chapter, int(to) if to else int(verse))
+    if chapter == 0 or start % CHAPTER_STRIDE == 0 or end < start:
+        return None
+    return PassageRange(start, end)
+
+
+def extract_references(text: str) -> List[PassageRange]:
+    """
+    Find Bible references in Portuguese text.
+
+    Recognizes full book names and the usual abbreviations, with or without
+    accents, followed by a chapter, a chapter:verse (":", "." or ","), a verse
+    range or a range across chapters: "Gênesis 1:1", "Jo 3.16",
+    "Rm 8:28-30", "1 Coríntios 13", "Gn 1:1-2:3", "Salmos 23".
+
+    Args:
+        text (str): Text to scan
+
+    Returns:
+        List[PassageRange]: Distinct references in order of appearance
+    """
+    found = []
+    for match in REFERENCE_PATTERN.finditer(text):
+        passage = _range_from_match(match)
+        if passage is not None and passage not in found:
+            found.append(passage)
+    return found
+
+
+class VerseIndex:
+    """
+    Interval index from canonical verse ids to the chunks that cite them.
+
+    References found at ingest time are split per chapter and stored as
+    ``(start, end)`` rows in ``rag_verse_refs``, beside the source manifest
+    like ``LexicalIndex``. Because a row never spans chapters, every row
+    overlapping a passage starts between the first verse of the passage's
+    first chapter and the passage's end, so a lookup is one range scan on
+    the ``(scope, start_verse)`` B-tree instead of an embedding call and a
+    full scan.
+    """
+
+    def __init__(self, engine, scope: str):
+        from sqlalchemy import text
+
+        self.engine = engine
+        self.scope = scope
+        with engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS rag_verse_refs (
+                    scope VARCHAR(255) NOT NULL,
+                    doc_key BIGINT NOT NULL,
+                    chunk_id VARCHAR(255) NOT NULL,
+                    start_verse INTEGER NOT NULL,
+                    end_verse INTEGER NOT NULL,
+                    mentions INTEGER NOT NULL,
+                    PRIMARY KEY (scope, doc_key, start_verse, end_verse)
+                )
+            """))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_rag_verse_refs_start ON rag_verse_refs (scope, start_verse)"
+            ))
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS rag_verse_docs (
+                    scope VARCHAR(255) NOT NULL,
+                    doc_key BIGINT NOT NULL,
+                    PRIMARY KEY (scope, doc_key)
+                )
+            """))
+
+    def add(self, chunks: Iterable[Tuple[str, str]]):
+        """
+        Index (or re-index) the references of chunks.
+
+        Args:
+            chunks (Iterable[Tuple[str, str]]): (chunk id, text) pairs
+        """
+        from sqlalchemy import text
+
+        keys, rows = {}, []
+        for chunk_id, chunk_text in chunks:
+            key = doc_key(chunk_id)
+            if key in keys:
+                continue
+            keys[key] = {'scope': self.scope, 'doc_key': key}
+            mentions = Counter(part for passage in self._mentions(chunk_text) for part in passage.chapters())
+            rows.extend({'scope': self.scope, 'doc_key': key, 'chunk_id': chunk_id, 'start_verse': part.start,
+                         'end_verse': part.end, 'mentions': count}
+                        for part, count in mentions.items())
+        if not keys:
+            return
+        with self.engine.begin() as conn:
+            self._delete_keys(conn, list(keys))
+            # Chunks without references are recorded too, so a backfill is not rerun for them
+            conn.execute(text("INSERT INTO rag_verse_docs (scope, doc_key) VALUES (:scope, :doc_key)"),
+                         list(keys.values()))
+            if rows:
+                conn.execute(text(
+                    "INSERT INTO rag_verse_refs (scope, doc_key, chunk_id, start_verse, end_verse, mentions) "
+                    "VALUES (:scope, :doc_key, :chunk_id, :start_verse, :end_verse, :mentions)"
+                ), rows)
+
+    @staticmethod
+    def _mentions(chunk_text: str) -> List[PassageRange]:
+        """Every reference in the text, repeats included, so often-cited passages weigh more."""
+        return [passage for passage in map(_range_from_match, REFERENCE_PATTERN.finditer(chunk_text))
+                if passage is not None]
+
+    def remove(self, chunk_ids: Sequence[str]):
+        if not chunk_ids:
+            return
+        with self.engine.begin() as conn:
+            self._delete_keys(conn, [doc_key(chunk_id) for chunk_id in chunk_ids])
+
+    def _delete_keys(self, conn, keys: List[int]):
+        from sqlalchemy import bindparam, text
+
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            for table in ('rag_verse_refs', 'rag_verse_docs'):
+                conn.execute(text(f"DELETE FROM {table} WHERE scope = :scope AND doc_key IN :keys")
+                             .bindparams(bindparam('keys', expanding=True)), {'scope': self.scope, 'keys': part})
+
+    def count(self) -> int:
+        from sqlalchemy import text
+
+        with self.engine.connect() as conn:
+            return conn.execute(text("SELECT COUNT(*) FROM rag_verse_docs WHERE scope = :scope"),
+                                {'scope': self.scope}).scalar()
+
+    def lookup(self, passage: str, limit: int = 10) -> List[Tuple[str, float]]:
+        """
+        Chunks citing a passage.
+
+        A chunk scores, for each stored reference overlapping the passage,
+        ``mentions * overlap / max(len(reference), len(passage))``: citing
+        exactly the passage scores 1, citing one verse of a long passage or
+        a whole chapter for one verse scores little.
+
+        Args:
+            passage (str): Text with one or more references, e.g. "Rm 8:28-30"
+            limit (int): Maximum number of results
+
+        Returns:
+            List[Tuple[str, float]]: (chunk id, score) pairs, best first
+        """
+        from sqlalchemy import text
+
+        query = text("""
+            SELECT chunk_id, start_verse, end_verse, mentions FROM rag_verse_refs
+            WHERE scope = :scope AND start_verse BETWEEN :floor AND :end AND end_verse >= :start
+        """)
+        scores: Dict[str, float] = {}
+        with self.engine.connect() as conn:
+            for wanted in extract_references(passage):
+                floor = wanted.start - wanted.start % CHAPTER_STRIDE
+                rows = conn.execute(query, {'scope': self.scope, 'floor': floor, 'start': wanted.start,
+                                            'end': wanted.end}).fetchall()
+                for chunk_id, start, end, mentions in rows:
+                    cited = PassageRange(start, end)
+                    score = mentions * cited.overlap(wanted) / max(len(cited), len(wanted))
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + score
+        return sorted(scores.items(), key=lambda item: -item[1])[:limit]
+
+
+class VerseChunkWriter(ChunkWriter):
+    """Wraps a vector store writer and keeps a ``VerseIndex`` in step with it."""
+
+    def __init__(self, inner: ChunkWriter, verses: VerseIndex):
+        self.inner = inner
+        self.verses = verses
+
+    def write_chunks(self, records: List[ChunkRecord], embeddings: List[List[float]]) -> int:
+        written = self.inner.write_chunks(records, embeddings)
+        self.verses.add((record.row_id, record.text) for record in records)
+        return written
+
+    def delete_chunks(self, row_ids: List[str]):
+        self.inner.delete_chunks(row_ids)
+        self.verses.remove(row_ids)
+
+
+def ensure_verse_index(verses: VerseIndex, batches: Iterable[Tuple[List[Dict], List]], log=print) -> int:
+    """
+    Build the verse index from the vector store when it is empty.
+
+    Args:
+        verses (VerseIndex): Index to fill
+        batches: (rows, embeddings) pages of the store, rows with 'id' and 'text'
+
+    Returns:
+        int: Number of chunks scanned
+    """
+    if verses.count():
+        return 0
+    added = 0
+    for rows, _ in batches:
+        verses.add((row['id'], row['text']) for row in rows)
+        added += len(rows)
+    if added:
+        log(f"Verse index built for {added} existing chunks")
+    return added
@@ -0,0 +1,114 @@
+import json
+import time
+from typing import Dict, List, Set
+
+
+class CheckpointJournal:
+    """
+    Journal of batches committed to the vector store by an unfinished run.
+
+    The pipeline appends one entry per source and batch right after the
+    batch is committed: source, document id, content hash, chunk position
+    range and chunk hashes (row ids are ``chunk_row_id(document_id, hash)``).
+    Entries for a source are dropped once the source manifest records it as
+    complete, so after a clean run the journal is empty.
+
+    When a run dies mid-source, ``--resume`` treats the journaled chunks of
+    that source as already indexed, provided its content and chunker
+    parameters have not changed, so nothing is embedded or inserted twice.
+    Works on any SQLAlchemy engine, like ``SourceManifest``.
+    """
+
+    def __init__(self, engine, scope: str):
+        from sqlalchemy import text
+
+        self.engine = engine
+        self.scope = scope
+        with engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS rag_index_journal (
+                    scope VARCHAR(255) NOT NULL,
+                    source_key VARCHAR(1000) NOT NULL,
+                    document_id VARCHAR(255) NOT NULL,
+                    content_hash VARCHAR(64) NOT NULL,
+                    chunker_params TEXT NOT NULL,
+                    first_position INTEGER NOT NULL,
+                    last_position INTEGER NOT NULL,
+                    chunk_hashes TEXT NOT NULL,
+                    committed_at DOUBLE PRECISION NOT NULL
+                )
+            """))
+            conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS rag_index_journal_source_idx
+                ON rag_index_journal (scope, source_key)
+            """))
+
+    def record(self, source_key: str, document_id: str, content_hash: str, chunker_params: Dict,
+               positions: List[int], chunk_hashes: List[str]):
+        """
+        Record chunks of one source that were just committed.
+
+        Args:
+            source_key (str): Source path or URL
+            document_id (str): Document the chunks were written under
+            content_hash (str): Hash of the source content being indexed
+            chunker_params (Dict): Chunker parameters of the run
+            positions (List[int]): Chunk positions within the source
+            chunk_hashes (List[str]): Chunk content hashes
+        """
+        from sqlalchemy import text
+
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                INSERT INTO rag_index_journal (scope, source_key, document_id, content_hash, chunker_params,
+                                               first_position, last_position, chunk_hashes, committed_at)
+                VALUES (:scope, :source_key, :document_id, :content_hash, :chunker_params,
+                        :first_position, :last_position, :chunk_hashes, :committed_at)
+            """), {
+                'scope': self.scope,
+                'source_key': source_key,
+                'document_id': document_id,
+                'content_hash': content_hash,
+                'chunker_params': json.dumps(chunker_params, sort_keys=True),
+                'first_position': min(positions),
+                'last_position': max(positions),
+                'chunk_hashes': json.dumps(chunk_hashes),
+                'committed_at': time.time(),
+            })
+
+    def committed_hashes(self, source_key: str, document_id: str, content_hash: str,
+                         chunker_params: Dict) -> Set[str]:
+        """Chunk hashes already committed for this exact version of a source."""
+        from sqlalchemy import text
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(text("""
+                SELECT chunk_hashes FROM rag_index_journal
+                WHERE scope = :scope AND source_key = :source_key AND document_id = :document_id
+                  AND content_hash = :content_hash AND chunker_params = :chunker_params
+            """), {
+                'scope': self.scope,
+                'source_key': source_key,
+                'document_id': document_id,
+                'content_hash': content_hash,
+                'chunker_params': json.dumps(chunker_params, sort_keys=True),
+            }).fetchall()
+        committed = set()
+        for row in rows:
+            committed.update(json.loads(row[0]))
+        return committed
+
+    def clear_source(self, source_key: str):
+        """Forget a source once the manifest has it."""
+        from sqlalchemy import text
+
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM rag_index_journal WHERE scope = :scope AND source_key = :source_key"),
+                         {'scope': self.scope, 'source_key': source_key})
+
+    def clear(self):
+        """Forget every unfinished source, for runs that start over."""
+        from sqlalchemy import text
+
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM rag_index_journal WHERE scope = :scope"), {'scope': self.scope})
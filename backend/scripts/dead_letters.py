@@ -0,0 +1,167 @@
+import time
+from typing import Dict, List, Optional, Set
+
+from ingest_pipeline import ChunkRecord
+
+
+class DeadLetter:
+    """A chunk that could not be embedded, with the source version it belongs to."""
+
+    def __init__(self, record: ChunkRecord, content_hash: str, error: Optional[str], attempts: int,
+                 first_failed_at: float, last_failed_at: float):
+        self.record = record
+        self.content_hash = content_hash
+        self.error = error
+        self.attempts = attempts
+        self.first_failed_at = first_failed_at
+        self.last_failed_at = last_failed_at
+
+
+class DeadLetterQueue:
+    """
+    Chunks that failed to embed after the engine's retries (``rag_dead_letters``).
+
+    The pipeline leaves such chunks out of the source manifest and parks
+    them here with their text, position, the content hash of the source
+    version they came from and the last error. A later run that finds the
+    source unchanged re-embeds only these chunks instead of skipping them
+    for good, and ``IngestPipeline.retry_dead_letters`` does the same for
+    every parked chunk without reading any source. Entries go away once
+    their chunk is written, or when their source is re-indexed with content
+    that no longer contains them. Like ``SourceManifest`` it works on
+    Postgres or on the SQLite file beside a Chroma collection.
+    """
+
+    def __init__(self, engine, scope: str):
+        from sqlalchemy import text
+
+        self.engine = engine
+        self.scope = scope
+        with engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS rag_dead_letters (
+                    scope VARCHAR(255) NOT NULL,
+                    row_id VARCHAR(500) NOT NULL,
+                    source_key VARCHAR(1000) NOT NULL,
+                    source_type VARCHAR(16) NOT NULL,
+                    document_id VARCHAR(255) NOT NULL,
+                    content_hash VARCHAR(64) NOT NULL,
+                    position INTEGER NOT NULL,
+                    digest VARCHAR(64) NOT NULL,
+                    chunk_text TEXT NOT NULL,
+                    error TEXT,
+                    attempts INTEGER NOT NULL,
+                    first_failed_at DOUBLE PRECISION NOT NULL,
+                    last_failed_at DOUBLE PRECISION NOT NULL,
+                    PRIMARY KEY (scope, row_id)
+                )
+            """))
+            conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS rag_dead_letters_source_idx
+                ON rag_dead_letters (scope, source_key)
+            """))
+
+    def add(self, records: List[ChunkRecord], content_hashes: List[str], errors: List[Optional[str]]):
+        """
+        Park chunks that failed, counting one more attempt for chunks already parked.
+
+        Args:
+            records (List[ChunkRecord]): Chunks that could not be embedded
+            content_hashes (List[str]): Content hash of each chunk's source version
+            errors (List[Optional[str]]): Last error of each chunk, if known
+        """
+        from sqlalchemy import bindparam, text
+
+        if not records:
+            return
+        now = time.time()
+        row_ids = [record.row_id for record in records]
+        with self.engine.begin() as conn:
+            previous = {
+                row[0]: (row[1], row[2])
+                for row in conn.execute(text("""
+                    SELECT row_id, attempts, first_failed_at FROM rag_dead_letters
+                    WHERE scope = :scope AND row_id IN :row_ids
+                """).bindparams(bindparam('row_ids', expanding=True)), {'scope': self.scope, 'row_ids': row_ids})
+            }
+            conn.execute(text("DELETE FROM rag_dead_letters WHERE scope = :scope AND row_id IN :row_ids")
+                         .bindparams(bindparam('row_ids', expanding=True)), {'scope': self.scope, 'row_ids': row_ids})
+            conn.execute(text("""
+                INSERT INTO rag_dead_letters (scope, row_id, source_key, source_type, document_id, content_hash,
+                                              position, digest, chunk_text, error, attempts,
+                                              first_failed_at, last_failed_at)
+                VALUES (:scope, :row_id, :source_key, :source_type, :document_id, :content_hash,
+                        :position, :digest, :chunk_text, :error, :attempts, :first_failed_at, :last_failed_at)
+            """), [
+                {
+                    'scope': self.scope,
+                    'row_id': record.row_id,
+                    'source_key': record.source_path,
+                    'source_type': record.source_type,
+                    'document_id': record.document_id,
+                    'content_hash': content_hash,
+                    'position': record.position,
+                    'digest': record.digest,
+                    'chunk_text': record.text,
+                    'error': error,
+                    'attempts': previous.get(record.row_id, (0, now))[0] + 1,
+                    'first_failed_at': previous.get(record.row_id, (0, now))[1],
+                    'last_failed_at': now,
+                }
+                for record, content_hash, error in zip(records, content_hashes, errors)
+            ])
+
+    def remove(self, row_ids: List[str]):
+        """Forget chunks that were written."""
+        from sqlalchemy import bindparam, text
+
+        if not row_ids:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM rag_dead_letters WHERE scope = :scope AND row_id IN :row_ids")
+                         .bindparams(bindparam('row_ids', expanding=True)),
+                         {'scope': self.scope, 'row_ids': list(row_ids)})
+
+    def row_ids(self) -> Set[str]:
+        from sqlalchemy import text
+
+        with self.engine.connect() as conn:
+            return {row[0] for row in conn.execute(text("SELECT row_id FROM rag_dead_letters WHERE scope = :scope"),
+                                                   {'scope': self.scope})}
+
+    def entries(self, source_key: Optional[str] = None) -> List[DeadLetter]:
+        """Parked chunks of the scope (or of one source), in source and position order."""
+        from sqlalchemy import text
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(f"""
+                SELECT source_type, source_key, document_id, position, digest, chunk_text, content_hash,
+                       error, attempts, first_failed_at, last_failed_at
+                FROM rag_dead_letters
+                WHERE scope = :scope {'AND source_key = :source_key' if source_key is not None else ''}
+                ORDER BY source_key, position
+            """), {'scope': self.scope, 'source_key': source_key}).fetchall()
+        return [DeadLetter(ChunkRecord(*row[:6]), *row[6:]) for row in rows]
+
+    def prune_source(self, source_key: str, document_id: str, content_hash: str, chunk_hashes: List[str]) -> int:
+        """
+        Drop a source's entries that its current version no longer contains.
+
+        Returns:
+            int: Entries dropped
+        """
+        current = set(chunk_hashes)
+        stale = [letter.record.row_id for letter in self.entries(source_key)
+                 if letter.record.document_id != document_id or letter.content_hash != content_hash
+                 or letter.record.digest not in current]
+        self.remove(stale)
+        return len(stale)
+
+    def counts(self) -> Dict[str, int]:
+        """Parked chunks per source."""
+        from sqlalchemy import text
+
+        with self.engine.connect() as conn:
+            return {row[0]: row[1] for row in conn.execute(text("""
+                SELECT source_key, COUNT(*) FROM rag_dead_letters WHERE scope = :scope GROUP BY source_key
+            """), {'scope': self.scope})}
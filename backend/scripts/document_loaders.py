@@ -0,0 +1,62 @@
+import os
+from typing import Iterator
+
+SUPPORTED_EXTENSIONS = ('.txt', '.md', '.pdf', '.docx')
+
+# Parsed formats; every other file (.txt, .md, no extension, ...) is read as UTF-8 text
+PARSED_EXTENSIONS = ('.pdf', '.docx')
+
+# Text files are streamed in blocks of this many characters
+TEXT_BLOCK_SIZE = 1024 * 1024
+
+# DOCX paragraphs are grouped into pages of this many paragraphs
+DOCX_PARAGRAPHS_PER_PAGE = 200
+
+
+def iter_document_pages(file_path: str) -> Iterator[str]:
+    """
+    Stream text content from a file (PDF, DOCX or plain text) one page at a time.
+
+    PDFs yield one item per page, DOCX files one item per group of
+    paragraphs and any other file, read as UTF-8 text like uploads always
+    were (invalid bytes become U+FFFD), one item per block, so callers
+    never need the whole document in memory. Concatenating the items gives
+    the full text.
+
+    Args:
+        file_path (str): Path to the file
+
+    Yields:
+        str: Consecutive pieces of the document text
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
+
+    file_extension = os.path.splitext(file_path)[1].lower()
+
+    if file_extension == '.pdf':
+        # Parsers are imported on first use; they dominate startup time otherwise
+        import PyPDF2
+
+        with open(file_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            for page in pdf_reader.pages:
+                yield (page.extract_text() or "") + "\n"
+
+    elif file_extension == '.docx':
+        from docx import Document
+
+        doc = Document(file_path)
+        paragraphs = []
+        for paragraph in doc.paragraphs:
+            paragraphs.append(paragraph.text)
+            if len(paragraphs) == DOCX_PARAGRAPHS_PER_PAGE:
+                yield "\n".join(paragraphs) + "\n"
+                paragraphs = []
+        if paragraphs:
+            yield "\n".join(paragraphs) + "\n"
+
+    else:
+        with open(file_path, 'r', encoding='utf-8', errors='replace') as file:
+            for block in iter(lambda: file.read(TEXT_BLOCK_SIZE), ''):
+                yield block
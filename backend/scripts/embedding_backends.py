@@ -0,0 +1,374 @@
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from embedding_cache import cache_key, normalize_text
+
+BACKENDS = ('gemini', 'local', 'record', 'replay')
+
+DEFAULT_RECORDING_PATH = "backend/data/embedding_recording.jsonl"
+
+# Model of every vector indexed before the backend was recorded with the store
+LEGACY_SPACE = {'model': "models/text-embedding-004", 'dimension': 768}
+
+# 32-bit FNV-1a
+FNV_OFFSET = 0x811c9dc5
+FNV_PRIME = 0x01000193
+
+
+class EmbeddingBackend:
+    """
+    Interface shared by the embedders the indexers can use.
+
+    ``model`` names the vector space: it is part of the embedding cache key
+    and is stored with the collection together with ``dimension``, so vectors
+    from different backends are never mixed. ``batch_size`` and
+    ``concurrency`` size the pipeline's write batches; ``metrics`` may be set
+    to an ``indexing_metrics.RunMetrics``.
+    """
+
+    model: str
+    task_type: str = "retrieval_document"
+    dimension: Optional[int] = None
+    batch_size: int = 100
+    concurrency: int = 1
+    metrics = None
+
+    def embed(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Embed texts in input order; ``None`` for blank texts and failures."""
+        raise NotImplementedError
+
+    def take_failure(self, text: str) -> Optional[str]:
+        """Why ``text`` last came back as ``None``, if the backend knows."""
+        return None
+
+    def record_failure(self, text: str, reason: str):
+        """Remember ``reason`` for ``take_failure(text)`` (e.g. for a text whose request another text made)."""
+
+
+class HashedNgramEmbedder(EmbeddingBackend):
+    """
+    Deterministic CPU embedder: signed feature hashing of character n-grams.
+
+    Every byte n-gram of the lower-cased, whitespace-normalized UTF-8 text is
+    hashed (FNV-1a, then the MurmurHash3 finalizer) to one of ``dimension``
+    buckets with a +1/-1 sign, and rows are L2-normalized. A whole batch is
+    hashed with a handful of NumPy passes over the concatenated bytes, with
+    no Python loop per n-gram, no network and no model download.
+
+    The vectors capture lexical overlap, not meaning: they serve offline and
+    bulk pre-indexing, re-chunking experiments and CI, not production search.
+    """
+
+    def __init__(self, dimension: int = 768, min_n: int = 3, max_n: int = 5, seed: int = 0,
+                 task_type: str = "retrieval_document", batch_size: int = 128):
+        if not 1 <= min_n <= max_n:
+            raise ValueError(f"Invalid n-gram range {min_n}-{max_n}")
+        self.dimension = dimension
+        self.min_n = min_n
+        self.max_n = max_n
+        self.seed = seed
+        self.task_type = task_type
+        self.batch_size = max(1, batch_size)
+        # Every parameter changes the vectors, so every parameter is in the model id
+        self.model = f"local/hashed-ngram-v1/d{dimension}/n{min_n}-{max_n}/s{seed}"
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "HashedNgramEmbedder":
+        """Build an embedder using LOCAL_EMBEDDING_DIMENSION / LOCAL_EMBEDDING_NGRAMS (e.g. "3-5") overrides."""
+        kwargs.setdefault('dimension', int(os.getenv('LOCAL_EMBEDDING_DIMENSION', 768)))
+        min_n, _, max_n = os.getenv('LOCAL_EMBEDDING_NGRAMS', '3-5').partition('-')
+        kwargs.setdefault('min_n', int(min_n))
+        kwargs.setdefault('max_n', int(max_n or min_n))
+        return cls(**kwargs)
+
+    def embed_matrix(self, texts: List[str]):
+        """
+        Embed non-blank texts into a float32 matrix of shape (len(texts), dimension).
+
+        Args:
+            texts (List[str]): Texts to embed
+
+        Returns:
+            numpy.ndarray: One L2-normalized row per text
+        """
+        import numpy as np
+
+        # Padding spaces give word-initial and word-final n-grams
+        encoded = [(' ' + normalize_text(text).lower() + ' ').encode('utf-8') for text in texts]
+        lengths = np.fromiter((len(data) for data in encoded), dtype=np.int64, count=len(encoded))
+        # 32-bit hashing: collisions only matter modulo ``dimension``, and it halves memory traffic
+        data = np.frombuffer(b''.join(encoded), dtype=np.uint8).astype(np.uint32)
+        owner = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+
+        prime = np.uint32(FNV_PRIME)
+        hashes = np.full(len(data), (FNV_OFFSET ^ self.seed) & 0xffffffff, dtype=np.uint32)
+        features, rows = [], []
+        for n in range(1, self.max_n + 1):
+            # FNV-1a over n bytes, extending the (n-1)-gram hashes by one byte
+            total = len(data) - n + 1
+            if total <= 0:
+                break
+            hashes = (hashes[:total] ^ data[n - 1:n - 1 + total]) * prime
+            if n >= self.min_n:
+                # Drop n-grams that run from one text into the next
+                inside = owner[:total] == owner[n - 1:n - 1 + total]
+                features.append(hashes[inside])
+                rows.append(owner[:total][inside])
+        if not features:
+            return np.zeros((len(texts), self.dimension), dtype=np.float32)
+
+        hashes = _fmix32(np.concatenate(features))
+        # Multiply-shift range reduction instead of a modulo
+        buckets = ((hashes >> np.uint32(16)).astype(np.int64) * self.dimension) >> 16
+        # Positive and negative hits counted in adjacent slots: an unweighted
+        # bincount is about twice as fast as one with +1/-1 weights
+        slots = (np.concatenate(rows) * self.dimension + buckets) * 2 + (hashes & np.uint32(1))
+        counts = np.bincount(slots, minlength=len(texts) * self.dimension * 2).reshape(-1, 2)
+
+        matrix = (counts[:, 0] - counts[:, 1]).reshape(len(texts), self.dimension).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def embed(self, texts: List[str]) -> List[Optional[List[float]]]:
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        positions = [i for i, text in enumerate(texts) if text.strip()]
+        for start in range(0, len(positions), self.batch_size):
+            batch = positions[start:start + self.batch_size]
+            matrix = self.embed_matrix([texts[i] for i in batch])
+            for i, row in zip(batch, matrix.tolist()):
+                results[i] = row
+        return results
+
+
+def _fmix32(hashes):
+    """MurmurHash3 finalizer, so the bits used for bucket and sign depend on every input byte."""
+    import numpy as np
+
+    hashes = hashes ^ (hashes >> np.uint32(16))
+    hashes = hashes * np.uint32(0x85ebca6b)
+    hashes = hashes ^ (hashes >> np.uint32(13))
+    hashes = hashes * np.uint32(0xc2b2ae35)
+    return hashes ^ (hashes >> np.uint32(16))
+
+
+def _read_recording(path: str) -> Tuple[Optional[Dict], Dict[str, List[float]]]:
+    header, vectors = None, {}
+    if not os.path.exists(path):
+        return header, vectors
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if 'key' in entry:
+                vectors[entry['key']] = entry['vector']
+            else:
+                header = entry
+    return header, vectors
+
+
+class RecordingEmbedder(EmbeddingBackend):
+    """
+    Passes texts to another backend and appends every new vector to a JSON-lines recording.
+
+    The first line of the recording holds the model and dimension; each
+    further line is ``{"key", "vector"}`` with the embedding cache key
+    (model, task type, normalized text). ``ReplayEmbedder`` serves the
+    recording back without the network.
+    """
+
+    def __init__(self, inner: EmbeddingBackend, path: str = DEFAULT_RECORDING_PATH):
+        self.inner = inner
+        self.path = path
+        self.model = inner.model
+        self.task_type = inner.task_type
+        self.dimension = inner.dimension
+        self.batch_size = inner.batch_size
+        self.concurrency = inner.concurrency
+        self.lock = threading.Lock()
+
+        header, vectors = _read_recording(path)
+        if header is not None and header['model'] != self.model:
+            raise ValueError(f"Recording {path} holds {header['model']} embeddings, not {self.model}")
+        self.recorded = set(vectors)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if header is None:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'model': self.model, 'dimension': self.dimension}) + "\n")
+
+    @property
+    def metrics(self):
+        return self.inner.metrics
+
+    @metrics.setter
+    def metrics(self, value):
+        self.inner.metrics = value
+
+    def take_failure(self, text: str) -> Optional[str]:
+        return self.inner.take_failure(text)
+
+    def record_failure(self, text: str, reason: str):
+        self.inner.record_failure(text, reason)
+
+    def embed(self, texts: List[str]) -> List[Optional[List[float]]]:
+        embeddings = self.inner.embed(texts)
+        lines = []
+        with self.lock:
+            for text, embedding in zip(texts, embeddings):
+                key = cache_key(self.model, self.task_type, text)
+                if embedding is not None and key not in self.recorded:
+                    self.recorded.add(key)
+                    lines.append(json.dumps({'key': key, 'vector': embedding}) + "\n")
+            if lines:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.writelines(lines)
+        return embeddings
+
+
+class ReplayEmbedder(EmbeddingBackend):
+    """
+    Serves embeddings from a ``RecordingEmbedder`` recording; never calls an API.
+
+    Texts missing from the recording yield ``None`` (a failed chunk, as with
+    the API) and are counted in ``misses``.
+    """
+
+    def __init__(self, path: str = DEFAULT_RECORDING_PATH, task_type: str = "retrieval_document"):
+        header, self.vectors = _read_recording(path)
+        if header is None:
+            raise FileNotFoundError(f"No embedding recording at {path}")
+        self.path = path
+        self.model = header['model']
+        self.dimension = header['dimension']
+        self.task_type = task_type
+        self.misses = 0
+        self.failures = {}
+
+    def embed(self, texts: List[str]) -> List[Optional[List[float]]]:
+        results = []
+        for text in texts:
+            vector = self.vectors.get(cache_key(self.model, self.task_type, text)) if text.strip() else None
+            if vector is None and text.strip():
+                self.failures[text] = f"Not in recording {self.path}"
+                self.misses += 1
+                if self.metrics is not None:
+                    self.metrics.inc('embedding_failures')
+            results.append(vector)
+        return results
+
+    def take_failure(self, text: str) -> Optional[str]:
+        return self.failures.pop(text, None)
+
+    def record_failure(self, text: str, reason: str):
+        self.failures[text] = reason
+
+
+def create_embedder(backend: str, api_key: Optional[str] = None, task_type: str = "retrieval_document",
+                    recording_path: str = DEFAULT_RECORDING_PATH) -> EmbeddingBackend:
+    """
+    Build an embedding backend by name.
+
+    Args:
+        backend (str): 'gemini' (the API), 'local' (HashedNgramEmbedder),
+            'record' (the API, recorded to ``recording_path``) or 'replay'
+            (served from ``recording_path``)
+        api_key (Optional[str]): Gemini API key, for 'gemini' and 'record'
+        task_type (str): Embedding task type
+        recording_path (str): Recording file for 'record' and 'replay'
+
+    Returns:
+        EmbeddingBackend: The embedder
+    """
+    if backend == 'gemini':
+        from embedding_engine import EmbeddingEngine
+        return EmbeddingEngine.from_env(api_key, task_type=task_type)
+    if backend == 'local':
+        return HashedNgramEmbedder.from_env(task_type=task_type)
+    if backend == 'record':
+        return RecordingEmbedder(create_embedder('gemini', api_key, task_type), recording_path)
+    if backend == 'replay':
+        return ReplayEmbedder(recording_path, task_type)
+    raise ValueError(f"Unknown embedding backend: {backend} (expected one of {', '.join(BACKENDS)})")
+
+
+def embedder_from_env(api_key: Optional[str], task_type: str = "retrieval_document") -> EmbeddingBackend:
+    """Build the backend named by EMBEDDING_BACKEND (default 'gemini') and EMBEDDING_RECORDING_PATH."""
+    return create_embedder(os.getenv('EMBEDDING_BACKEND', 'gemini'), api_key, task_type,
+                           os.getenv('EMBEDDING_RECORDING_PATH', DEFAULT_RECORDING_PATH))
+
+
+def api_key_from_env() -> Optional[str]:
+    """The Gemini API key: GEMINI_API_KEY, else GOOGLE_API_KEY (the name the Chroma indexer used to read)."""
+    return os.getenv('GEMINI_API_KEY') or os.getenv('GOOGLE_API_KEY')
+
+
+def needs_api_key(backend: Optional[str] = None) -> bool:
+    """Whether the backend (default: EMBEDDING_BACKEND) calls the Gemini API."""
+    return (backend or os.getenv('EMBEDDING_BACKEND', 'gemini')) in ('gemini', 'record')
+
+
+def check_embedding_space(recorded: Optional[Dict], embedder: EmbeddingBackend, store: str) -> Dict:
+    """
+    Make sure an embedder writes into the same vector space as a store's existing vectors.
+
+    Args:
+        recorded (Optional[Dict]): ``{'model', 'dimension'}`` stored with the
+            collection or table, None when it holds no vectors yet
+        embedder (EmbeddingBackend): Embedder about to write
+        store (str): Collection or table name, for the error message
+
+    Returns:
+        Dict: The space to record for the store
+
+    Raises:
+        ValueError: When the store holds vectors of another model or dimension
+    """
+    space = {'model': embedder.model, 'dimension': embedder.dimension}
+    if recorded and (recorded['model'] != space['model'] or recorded['dimension'] != space['dimension']):
+        raise ValueError(
+            f"{store} holds {recorded['model']} vectors (dimension {recorded['dimension']}); "
+            f"refusing to add {space['model']} vectors (dimension {space['dimension']}). "
+            f"Index into another collection or rebuild it with the new backend."
+        )
+    return space
+
+
+def ensure_embedding_space(engine, scope: str, embedder: EmbeddingBackend, has_vectors: bool) -> Dict:
+    """
+    Record the embedding model and dimension of a SQL vector table, or check them against the record.
+
+    Tables that already hold vectors but have no record were written with
+    ``LEGACY_SPACE``. Works on any SQLAlchemy engine, like ``SourceManifest``.
+
+    Args:
+        engine: SQLAlchemy engine
+        scope (str): Table (or other store) the vectors live in
+        embedder (EmbeddingBackend): Embedder about to write
+        has_vectors (bool): Whether the store already holds vectors
+
+    Returns:
+        Dict: The recorded space
+    """
+    from sqlalchemy import text
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS rag_embedding_spaces (
+                scope VARCHAR(255) PRIMARY KEY,
+                model VARCHAR(255) NOT NULL,
+                dimension INTEGER
+            )
+        """))
+        row = conn.execute(text("SELECT model, dimension FROM rag_embedding_spaces WHERE scope = :scope"),
+                           {'scope': scope}).fetchone()
+        recorded = {'model': row[0], 'dimension': row[1]} if row else (LEGACY_SPACE if has_vectors else None)
+        space = check_embedding_space(recorded, embedder, scope)
+        if row is None:
+            conn.execute(text("INSERT INTO rag_embedding_spaces (scope, model, dimension) "
+                              "VALUES (:scope, :model, :dimension)"), {'scope': scope, **space})
+    return space
@@ -0,0 +1,197 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from typing import List, Optional
+
+DEFAULT_CACHE_PATH = "backend/data/embedding_cache.sqlite3"
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # 1 GB
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text so cosmetic whitespace/Unicode differences share a cache entry."""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def cache_key(model: str, task_type: str, text: str) -> str:
+    digest = hashlib.sha256()
+    for part in (model, task_type, normalize_text(text)):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent content-addressed embedding cache stored in SQLite.
+
+    Entries are keyed by hash(model, task_type, normalized text) and hold the
+    vector as packed float32. When the stored vectors exceed ``max_bytes`` the
+    least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    @classmethod
+    def from_env(cls) -> "EmbeddingCache":
+        """Build a cache using EMBEDDING_CACHE_PATH / EMBEDDING_CACHE_MAX_BYTES overrides."""
+        return cls(
+            os.getenv('EMBEDDING_CACHE_PATH', DEFAULT_CACHE_PATH),
+            int(os.getenv('EMBEDDING_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)),
+        )
+
+    def get_many(self, model: str, task_type: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Look up cached embeddings.
+
+        Args:
+            model (str): Embedding model name
+            task_type (str): Embedding task type
+            texts (List[str]): Texts to look up
+
+        Returns:
+            List[Optional[List[float]]]: Cached vectors in input order, None on a miss
+        """
+        keys = [cache_key(model, task_type, text) for text in texts]
+        found = {}
+        with self.lock:
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                placeholders = ','.join('?' * len(part))
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self.conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self.conn.commit()
+
+        results = []
+        for key in keys:
+            blob = found.get(key)
+            if blob is None:
+                self.misses += 1
+                results.append(None)
+            else:
+                self.hits += 1
+                results.append(array('f', blob).tolist())
+        return results
+
+    def put_many(self, model: str, task_type: str, texts: List[str],
+                 embeddings: List[Optional[List[float]]]):
+        """Store embeddings for texts, skipping None entries, then enforce the size bound."""
+        now = time.time()
+        rows = []
+        for text, embedding in zip(texts, embeddings):
+            if embedding is None:
+                continue
+            blob = array('f', embedding).tobytes()
+            rows.append((cache_key(model, task_type, text), blob, len(blob), now))
+        if not rows:
+            return
+
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, size, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self.conn.commit()
+            self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Free down to 90% of the bound so eviction does not run on every put
+        target = int(self.max_bytes * 0.9)
+        while self.total_bytes > target:
+            rows = self.conn.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                break
+            evicted = []
+            for key, size in rows:
+                evicted.append((key,))
+                self.total_bytes -= size
+                if self.total_bytes <= target:
+                    break
+            self.conn.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+        self.conn.commit()
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        rate = (self.hits / total * 100) if total else 0.0
+        return f"{self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate)"
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def embed_with_cache(engine, cache: Optional[EmbeddingCache], texts: List[str]) -> List[Optional[List[float]]]:
+    """
+    Embed texts through the cache, calling the engine only for misses.
+
+    Args:
+        engine (EmbeddingBackend): The embedder
+        cache (Optional[EmbeddingCache]): Cache to consult, None to bypass it
+        texts (List[str]): Texts to embed
+
+    Returns:
+        List[Optional[List[float]]]: Embeddings in input order, None where embedding failed
+    """
+    if cache is None:
+        return engine.embed(texts)
+
+    results = cache.get_many(engine.model, engine.task_type, texts)
+    # Texts that normalize the same share one API call
+    missing = {}
+    for i, embedding in enumerate(results):
+        if embedding is None and texts[i].strip():
+            missing.setdefault(normalize_text(texts[i]), []).append(i)
+    if missing:
+        unique = [texts[positions[0]] for positions in missing.values()]
+        fresh = engine.embed(unique)
+        for positions, embedding in zip(missing.values(), fresh):
+            for i in positions:
+                results[i] = embedding
+            if embedding is None and len(positions) > 1:
+                # Only the text that was sent has a failure reason; its variants share it
+                reason = engine.take_failure(texts[positions[0]])
+                if reason is not None:
+                    for i in positions:
+                        engine.record_failure(texts[i], reason)
+        cache.put_many(engine.model, engine.task_type, unique, fresh)
+    return results
@@ -0,0 +1,344 @@
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import List, Optional
+
+import requests
+
+from embedding_backends import EmbeddingBackend
+
+DEFAULT_MODEL = "models/text-embedding-004"
+DEFAULT_API_BASE = "https://generativelanguage.googleapis.com"
+# Output size of DEFAULT_MODEL
+DEFAULT_DIMENSION = 768
+
+# batchEmbedContents accepts at most 100 requests per call
+MAX_BATCH_SIZE = 100
+
+# Failure reasons kept for take_failure; long-lived callers that never ask do not grow without bound
+MAX_FAILURE_REASONS = 10000
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# A 400 whose error mentions one of these is a bad key rather than a bad request
+AUTH_ERROR_MARKERS = ('API_KEY_INVALID', 'API key not valid', 'API_KEY_SERVICE_BLOCKED')
+
+# A 400 whose error mentions one of these is a request that is too large
+PAYLOAD_SIZE_MARKERS = ('payload size', 'too large', 'exceeds the limit', 'at most 100 requests')
+
+
+class TransientEmbeddingError(RuntimeError):
+    """The API kept failing in a way that retrying later may fix (connection errors, 429, 5xx)."""
+
+
+class EmbeddingAuthError(RuntimeError):
+    """The API refused the key (401, 403 or an invalid-key 400); no request will succeed until it is fixed."""
+
+
+class PayloadTooLargeError(RuntimeError):
+    """The request was rejected for its size (413, or a 400 saying so); smaller batches may pass."""
+
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds to wait from a Retry-After header, in either of its forms.
+
+    Returns:
+        Optional[float]: The delay (delta-seconds or HTTP-date), or None if absent or unparseable
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def _error_message(response: requests.Response) -> str:
+    try:
+        return response.json()['error']['message']
+    except (ValueError, KeyError, TypeError):
+        return response.text[:500]
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """Exponential backoff with full jitter: a random delay up to ``base * 2**attempt``, capped."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket whose refill rate adapts to quota responses.
+
+    The rate grows additively after each successful request and is halved
+    whenever the API answers with 429/RESOURCE_EXHAUSTED (AIMD), so the
+    indexer converges on whatever quota the key actually has instead of
+    sleeping a fixed amount.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None,
+                 min_rate: float = 0.2, max_rate: Optional[float] = None):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate or rate * 4
+        self.increase_step = max(0.1, rate * 0.1)
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.throttle_count = 0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        """Block until one token is available and consume it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_throttle(self, retry_after: Optional[float] = None):
+        with self.lock:
+            self.throttle_count += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+            pause = retry_after if retry_after is not None else 1.0 / self.rate
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+
+
+class EmbeddingEngine(EmbeddingBackend):
+    """
+    Batched, concurrent client for the Gemini batchEmbedContents endpoint.
+
+    Texts are grouped into multi-text requests, up to ``concurrency`` requests
+    run at once on a thread pool, and every request goes through a shared
+    adaptive ``TokenBucket``. Results come back in input order; a text that
+    could not be embedded yields ``None`` at its position.
+
+    Setting ``api_base`` (or GEMINI_API_BASE) points the engine at a local
+    server such as ``fake_embedding_server.py``. When ``metrics`` is set to an
+    ``indexing_metrics.RunMetrics``, request latency, retries, 429s and
+    permanent failures are reported to it. Vectors whose length is not
+    ``dimension`` are rejected like any other failed response.
+
+    Transient errors are retried up to ``max_retries`` times, pausing the
+    shared bucket for Retry-After (seconds or an HTTP date) or an
+    exponential, jittered delay so concurrent workers do not retry in
+    lockstep. A batch that still fails that way, or is rejected outright, is
+    given up as a whole; only a batch rejected for its size is split until
+    the parts fit. An invalid or unauthorized key raises
+    ``EmbeddingAuthError`` at once instead of failing every text one by one.
+    ``take_failure(text)`` tells why a text came back as ``None``. The
+    request threads are kept for the engine's lifetime (``close`` stops them).
+    """
+
+    def __init__(self, api_key: Optional[str], model: str = DEFAULT_MODEL,
+                 task_type: str = "retrieval_document", batch_size: int = MAX_BATCH_SIZE,
+                 concurrency: int = 4, requests_per_second: float = 5.0,
+                 api_base: Optional[str] = None, max_retries: int = 6, timeout: float = 60,
+                 dimension: Optional[int] = DEFAULT_DIMENSION, backoff_base: float = 0.5,
+                 backoff_cap: float = 30.0):
+        self.api_key = api_key
+        self.model = model
+        self.dimension = dimension
+        self.task_type = task_type
+        self.batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+        self.concurrency = max(1, concurrency)
+        self.api_base = (api_base or DEFAULT_API_BASE).rstrip('/')
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.rate_limiter = TokenBucket(requests_per_second)
+        self.metrics = None
+        self._local = threading.local()
+        self._failures = {}
+        self._failures_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, api_key: Optional[str], **kwargs) -> "EmbeddingEngine":
+        """Build an engine using EMBEDDING_* / GEMINI_API_BASE overrides from the environment."""
+        kwargs.setdefault('dimension', int(os.getenv('EMBEDDING_DIMENSION', DEFAULT_DIMENSION)))
+        kwargs.setdefault('batch_size', int(os.getenv('EMBEDDING_BATCH_SIZE', MAX_BATCH_SIZE)))
+        kwargs.setdefault('concurrency', int(os.getenv('EMBEDDING_CONCURRENCY', 4)))
+        kwargs.setdefault('requests_per_second', float(os.getenv('EMBEDDING_RPS', 5.0)))
+        kwargs.setdefault('api_base', os.getenv('GEMINI_API_BASE'))
+        kwargs.setdefault('max_retries', int(os.getenv('EMBEDDING_MAX_RETRIES', 6)))
+        return cls(api_key, **kwargs)
+
+    def _session(self) -> requests.Session:
+        # One session per worker thread so connections are reused across batches
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        return session
+
+    def _report(self, counter: str):
+        if self.metrics is not None:
+            self.metrics.inc(counter)
+
+    def _post_batch(self, texts: List[str]) -> List[List[float]]:
+        url = f"{self.api_base}/v1beta/{self.model}:batchEmbedContents"
+        payload = {
+            'requests': [
+                {
+                    'model': self.model,
+                    'content': {'parts': [{'text': text}]},
+                    'taskType': self.task_type.upper(),
+                }
+                for text in texts
+            ]
+        }
+        headers = {'x-goog-api-key': self.api_key or ''}
+
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            started = time.perf_counter()
+            try:
+                response = self._session().post(url, json=payload, headers=headers, timeout=self.timeout)
+            except requests.RequestException as e:
+                self._report('embedding_connection_errors')
+                if attempt == self.max_retries:
+                    raise TransientEmbeddingError(f"{type(e).__name__} after {attempt + 1} attempts: {e}") from e
+                self._report('embedding_retries')
+                self.rate_limiter.on_throttle(backoff_delay(attempt, self.backoff_base, self.backoff_cap))
+                continue
+            if self.metrics is not None:
+                self.metrics.observe('embedding_request_seconds', time.perf_counter() - started)
+                self.metrics.inc('embedding_requests')
+                if response.status_code == 429:
+                    self.metrics.inc('embedding_throttled')
+                elif response.status_code >= 400:
+                    self.metrics.inc('embedding_http_errors')
+
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                if attempt == self.max_retries:
+                    raise TransientEmbeddingError(f"HTTP {response.status_code} after {attempt + 1} attempts")
+                self._report('embedding_retries')
+                retry_after = retry_after_seconds(response.headers.get('Retry-After'))
+                self.rate_limiter.on_throttle(retry_after if retry_after is not None
+                                              else backoff_delay(attempt, self.backoff_base, self.backoff_cap))
+                continue
+
+            if response.status_code >= 400:
+                message = _error_message(response)
+                if response.status_code in (401, 403) or (
+                        response.status_code == 400 and any(marker in message for marker in AUTH_ERROR_MARKERS)):
+                    raise EmbeddingAuthError(f"HTTP {response.status_code}: {message}")
+                if response.status_code == 413 or (
+                        response.status_code == 400 and any(marker in message for marker in PAYLOAD_SIZE_MARKERS)):
+                    raise PayloadTooLargeError(f"HTTP {response.status_code}: {message}")
+            response.raise_for_status()
+            self.rate_limiter.on_success()
+            embeddings = [item['values'] for item in response.json()['embeddings']]
+            if len(embeddings) != len(texts):
+                raise ValueError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+            if self.dimension and any(len(embedding) != self.dimension for embedding in embeddings):
+                raise ValueError(f"Expected {self.dimension}-dimensional embeddings from {self.model}")
+            return embeddings
+
+        raise RuntimeError("Embedding request retries exhausted")
+
+    def _fail(self, texts: List[str], error: Exception) -> List[None]:
+        print(f"Error generating {len(texts)} embedding(s): {str(error)}")
+        if self.metrics is not None:
+            self.metrics.inc('embedding_failures', len(texts))
+        for text in texts:
+            self.record_failure(text, f"{type(error).__name__}: {error}")
+        return [None] * len(texts)
+
+    def take_failure(self, text: str) -> Optional[str]:
+        """Why the last request for ``text`` failed, forgetting it; None if it did not."""
+        with self._failures_lock:
+            return self._failures.pop(text, None)
+
+    def record_failure(self, text: str, reason: str):
+        with self._failures_lock:
+            if len(self._failures) >= MAX_FAILURE_REASONS:
+                self._failures.clear()
+            self._failures[text] = reason
+
+    def _embed_batch(self, texts: List[str]) -> List[Optional[List[float]]]:
+        try:
+            return self._post_batch(texts)
+        except EmbeddingAuthError:
+            # Every other request would fail the same way
+            raise
+        except PayloadTooLargeError as e:
+            if len(texts) == 1:
+                return self._fail(texts, e)
+            # Halve the batch until the requests fit
+            middle = len(texts) // 2
+            return self._embed_batch(texts[:middle]) + self._embed_batch(texts[middle:])
+        except Exception as e:
+            # Splitting would only repeat the request; the texts are retried in a later run
+            return self._fail(texts, e)
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='embedding')
+            return self._executor
+
+    def close(self):
+        """Stop the request threads; a later ``embed`` starts new ones."""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def embed(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Embed texts, preserving input order.
+
+        Args:
+            texts (List[str]): Texts to embed
+
+        Returns:
+            List[Optional[List[float]]]: One embedding per text, ``None`` for
+            blank texts and texts that failed permanently
+
+        Raises:
+            EmbeddingAuthError: If the API refuses the key
+        """
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        positions = [i for i, text in enumerate(texts) if text.strip()]
+        batches = [positions[i:i + self.batch_size] for i in range(0, len(positions), self.batch_size)]
+
+        executor = self._pool()
+        futures = [
+            executor.submit(self._embed_batch, [texts[i] for i in batch])
+            for batch in batches
+        ]
+        for batch, future in zip(batches, futures):
+            for i, embedding in zip(batch, future.result()):
+                results[i] = embedding
+
+        return results
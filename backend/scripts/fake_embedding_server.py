@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BATCH_PATH = re.compile(r"^/v1beta/(models/[^:]+):batchEmbedContents$")
+
+
+def fake_embedding(text: str, dimension: int) -> list:
+    """Deterministic pseudo-embedding so repeated runs return identical vectors."""
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'big')
+    rng = random.Random(seed)
+    return [rng.uniform(-1, 1) for _ in range(dimension)]
+
+
+class FakeEmbeddingHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for the Gemini batchEmbedContents endpoint."""
+
+    server_version = "FakeEmbedding/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        match = BATCH_PATH.match(self.path.split('?')[0])
+        if not match:
+            self._send_json(404, {'error': {'code': 404, 'message': 'Not found'}})
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        requests_ = payload.get('requests', [])
+
+        with self.server.lock:
+            self.server.request_count += 1
+            self.server.text_count += len(requests_)
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.server.throttle_rate and random.random() < self.server.throttle_rate:
+            self._send_json(429, {'error': {'code': 429, 'status': 'RESOURCE_EXHAUSTED'}},
+                            {'Retry-After': '0.1'})
+            return
+
+        if self.server.error_rate and random.random() < self.server.error_rate:
+            with self.server.lock:
+                self.server.error_count += 1
+            self._send_json(500, {'error': {'code': 500, 'status': 'INTERNAL'}})
+            return
+
+        embeddings = []
+        for item in requests_:
+            text = ''.join(part.get('text', '') for part in item.get('content', {}).get('parts', []))
+            embeddings.append({'values': fake_embedding(text, self.server.dimension)})
+
+        self._send_json(200, {'embeddings': embeddings})
+
+
+def create_server(host: str = '127.0.0.1', port: int = 0, dimension: int = 768,
+                  throttle_rate: float = 0.0, verbose: bool = False, latency: float = 0.0,
+                  error_rate: float = 0.0) -> ThreadingHTTPServer:
+    """
+    Create (but do not start) a fake embedding server.
+
+    Args:
+        host (str): Interface to bind
+        port (int): Port to bind, 0 picks a free one
+        dimension (int): Size of the returned vectors
+        throttle_rate (float): Fraction of requests answered with 429
+        verbose (bool): Log every request
+        latency (float): Seconds to wait before answering each request
+        error_rate (float): Fraction of requests answered with HTTP 500
+
+    Returns:
+        ThreadingHTTPServer: Server ready for ``serve_forever``
+    """
+    server = ThreadingHTTPServer((host, port), FakeEmbeddingHandler)
+    server.daemon_threads = True
+    server.dimension = dimension
+    server.throttle_rate = throttle_rate
+    server.verbose = verbose
+    server.latency = latency
+    server.error_rate = error_rate
+    server.request_count = 0
+    server.text_count = 0
+    server.error_count = 0
+    server.lock = threading.Lock()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local fake Gemini embedding server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--dimension', type=int, default=768)
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help="Fraction of requests answered with HTTP 429")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help="Fraction of requests answered with HTTP 500")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port, args.dimension, args.throttle_rate, args.verbose,
+                           args.latency, args.error_rate)
+    print(f"Fake embedding server listening on http://{args.host}:{server.server_address[1]}")
+    print(f"Use GEMINI_API_BASE=http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html><head><title>{title}</title><style>body {{ font-family: serif; }}</style></head>
+<body>
+<header><a href="/">Comentário Bíblico</a></header>
+<nav>{nav}</nav>
+<article>
+<h1>{title}</h1>
+{body}
+</article>
+<aside>Assine a nossa newsletter</aside>
+<footer>Todos os direitos reservados</footer>
+<script>console.log('tracking');</script>
+</body></html>
+"""
+
+
+def commentary_page(number: int, pages: int) -> str:
+    """A commentary page with boilerplate around the article and links to its neighbours."""
+    nav = ' '.join(f'<a href="/comentario/{n}.html">Capítulo {n}</a>'
+                   for n in (number - 1, number + 1) if 1 <= n <= pages)
+    body = '\n'.join(
+        f"<p>Comentário do capítulo {number}, parágrafo {paragraph}: a graça de Deus em Efésios 2:8 "
+        f"e a fé que vem pelo ouvir (Romanos 10:17).</p>"
+        for paragraph in range(1, 4)
+    ) + '\n<p><a href="/privado/rascunho.html">Rascunho</a></p>'
+    return PAGE_TEMPLATE.format(title=f"Capítulo {number}", nav=nav, body=body)
+
+
+class FakeWebHandler(BaseHTTPRequestHandler):
+    """Serves a small commentary site with robots.txt, ETag/Last-Modified validators and 304 answers."""
+
+    server_version = "FakeWeb/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, body: bytes = b'', headers: dict = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        with self.server.lock:
+            self.server.request_count += 1
+            self.server.hits[path] = self.server.hits.get(path, 0) + 1
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active, self.server.active)
+        try:
+            if self.server.latency:
+                time.sleep(self.server.latency)
+            if path == '/robots.txt':
+                self._send(200, self.server.robots.encode('utf-8'), {'Content-Type': 'text/plain'})
+                return
+            html = self.server.pages.get(path)
+            if html is None:
+                self._send(404, b'Not found', {'Content-Type': 'text/plain'})
+                return
+            body = html.encode('utf-8')
+            etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+            headers = {'ETag': etag, 'Last-Modified': self.server.last_modified,
+                       'Content-Type': 'text/html; charset=utf-8'}
+            if self.headers.get('If-None-Match') == etag:
+                with self.server.lock:
+                    self.server.not_modified_count += 1
+                self._send(304, headers={'ETag': etag})
+                return
+            self._send(200, body, headers)
+        finally:
+            with self.server.lock:
+                self.server.active -= 1
+
+
+def create_server(host: str = '127.0.0.1', port: int = 0, pages: int = 20, crawl_delay: float = 0.0,
+                  latency: float = 0.0, verbose: bool = False) -> ThreadingHTTPServer:
+    """
+    Create (but do not start) a fake commentary site for crawler runs.
+
+    ``/`` links to ``/comentario/1.html``; each chapter page links to its
+    neighbours and to ``/privado/``, which robots.txt disallows. Replace
+    entries of ``server.pages`` (path -> HTML) to simulate edits; the
+    counters (``request_count``, ``not_modified_count``, ``hits`` per path,
+    ``max_active`` concurrent requests) show what a crawler did.
+
+    Args:
+        host (str): Interface to bind
+        port (int): Port to bind, 0 picks a free one
+        pages (int): Number of chapter pages
+        crawl_delay (float): Crawl-delay announced in robots.txt (0 for none)
+        latency (float): Seconds to wait before answering each request
+        verbose (bool): Log every request
+
+    Returns:
+        ThreadingHTTPServer: Server ready for ``serve_forever``
+    """
+    server = ThreadingHTTPServer((host, port), FakeWebHandler)
+    server.daemon_threads = True
+    server.pages = {'/': '<html><body><main><p>Índice</p><a href="/comentario/1.html">Capítulo 1</a>'
+                         '</main></body></html>'}
+    server.pages.update({f'/comentario/{n}.html': commentary_page(n, pages) for n in range(1, pages + 1)})
+    server.pages['/privado/rascunho.html'] = '<html><body>Rascunho</body></html>'
+    server.robots = "User-agent: *\nDisallow: /privado/\n" + (f"Crawl-delay: {crawl_delay}\n" if crawl_delay else "")
+    server.last_modified = formatdate(time.time(), usegmt=True)
+    server.latency = latency
+    server.verbose = verbose
+    server.request_count = 0
+    server.not_modified_count = 0
+    server.hits = {}
+    server.active = 0
+    server.max_active = 0
+    server.lock = threading.Lock()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local fake commentary site for crawler runs")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--crawl-delay', type=float, default=0.0, help="Crawl-delay announced in robots.txt")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port, args.pages, args.crawl_delay, args.latency, args.verbose)
+    print(f"Fake commentary site listening on http://{args.host}:{server.server_address[1]}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
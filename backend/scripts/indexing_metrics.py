@@ -0,0 +1,227 @@
+import bisect
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_METRICS_DIR = "backend/data/metrics"
+
+# Seconds; spans a cached lookup up to a fully backed-off API call
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (None when empty or beyond the last bucket)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def summary(self) -> Dict:
+        return {'count': self.count, 'sum': round(self.sum, 4),
+                'p50': self.quantile(0.5), 'p95': self.quantile(0.95), 'p99': self.quantile(0.99)}
+
+
+class RunMetrics:
+    """
+    Counters, histograms and per-stage timers for one indexing run.
+
+    Events are appended as JSON lines while the run progresses, and
+    ``finish`` writes a summary line plus a Prometheus textfile (for the
+    node_exporter textfile collector) so a slow nightly reindex can be
+    traced to the API, document parsing or the database. All methods are
+    thread-safe; pipeline stages report from their own threads.
+    """
+
+    def __init__(self, indexer: str, directory: Optional[str] = DEFAULT_METRICS_DIR):
+        self.indexer = indexer
+        self.directory = directory
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started_at = time.time()
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        # name -> sorted label items -> value, e.g. per-user gauges of a batch run
+        self.labeled_gauges: Dict[str, Dict[Tuple[Tuple[str, str], ...], float]] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self.stage_seconds: Dict[str, float] = {}
+        self.lock = threading.Lock()
+        self._events = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._events = open(os.path.join(directory, f"{indexer}.jsonl"), 'a', encoding='utf-8')
+        self.event('run_started')
+
+    @classmethod
+    def from_env(cls, indexer: str) -> "RunMetrics":
+        """Build metrics writing to RAG_METRICS_DIR; an empty value keeps them in memory only."""
+        return cls(indexer, os.getenv('RAG_METRICS_DIR', DEFAULT_METRICS_DIR) or None)
+
+    def inc(self, name: str, value: float = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        with self.lock:
+            self.gauges[name] = value
+
+    def set_labeled_gauge(self, name: str, labels: Dict[str, str], value: float):
+        with self.lock:
+            self.labeled_gauges.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = LATENCY_BUCKETS):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    def add_stage_time(self, stage: str, seconds: float):
+        with self.lock:
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Add the wall time of the block to the stage's busy time."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage_time(name, time.perf_counter() - started)
+
+    def event(self, name: str, **fields):
+        """Append one JSON line: ``{"ts", "run_id", "indexer", "event", ...fields}``."""
+        if self._events is None:
+            return
+        line = json.dumps({'ts': round(time.time(), 3), 'run_id': self.run_id, 'indexer': self.indexer,
+                           'event': name, **fields}, ensure_ascii=False, default=str)
+        with self.lock:
+            self._events.write(line + "\n")
+            self._events.flush()
+
+    def summary(self) -> Dict:
+        elapsed = time.time() - self.started_at
+        with self.lock:
+            indexed = self.counters.get('chunks_indexed', 0)
+            write_seconds = self.stage_seconds.get('write', 0.0)
+            return {
+                'elapsed_seconds': round(elapsed, 3),
+                'chunks_per_second': round(indexed / elapsed, 2) if elapsed else 0.0,
+                'rows_written_per_second': (round(self.counters.get('rows_written', 0) / write_seconds, 2)
+                                            if write_seconds else 0.0),
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'labeled_gauges': {name: [dict(labels, value=value) for labels, value in series.items()]
+                                   for name, series in self.labeled_gauges.items()},
+                'stage_seconds': {stage: round(seconds, 3) for stage, seconds in self.stage_seconds.items()},
+                'histograms': {name: histogram.summary() for name, histogram in self.histograms.items()},
+            }
+
+    def _prometheus_lines(self, summary: Dict) -> List[str]:
+        labels = f'indexer="{self.indexer}"'
+        lines = [
+            "# TYPE rag_index_last_run_timestamp_seconds gauge",
+            f"rag_index_last_run_timestamp_seconds{{{labels}}} {self.started_at:.0f}",
+            "# TYPE rag_index_run_seconds gauge",
+            f"rag_index_run_seconds{{{labels}}} {summary['elapsed_seconds']}",
+            "# TYPE rag_index_chunks_per_second gauge",
+            f"rag_index_chunks_per_second{{{labels}}} {summary['chunks_per_second']}",
+            "# TYPE rag_index_rows_written_per_second gauge",
+            f"rag_index_rows_written_per_second{{{labels}}} {summary['rows_written_per_second']}",
+        ]
+        for name, value in sorted(summary['counters'].items()):
+            lines += [f"# TYPE rag_index_{name}_total counter", f"rag_index_{name}_total{{{labels}}} {value}"]
+        for name, value in sorted(summary['gauges'].items()):
+            lines += [f"# TYPE rag_index_{name} gauge", f"rag_index_{name}{{{labels}}} {value}"]
+        for name, series in sorted(summary['labeled_gauges'].items()):
+            lines.append(f"# TYPE rag_index_{name} gauge")
+            for point in series:
+                extra = ''.join(f',{key}="{value}"' for key, value in point.items() if key != 'value')
+                lines.append(f"rag_index_{name}{{{labels}{extra}}} {point['value']}")
+        if self.stage_seconds:
+            lines.append("# TYPE rag_index_stage_seconds gauge")
+            for stage, seconds in sorted(self.stage_seconds.items()):
+                lines.append(f'rag_index_stage_seconds{{{labels},stage="{stage}"}} {seconds:.3f}')
+        for name, histogram in sorted(self.histograms.items()):
+            lines.append(f"# TYPE rag_index_{name} histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'rag_index_{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'rag_index_{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"rag_index_{name}_sum{{{labels}}} {histogram.sum:.6f}")
+            lines.append(f"rag_index_{name}_count{{{labels}}} {histogram.count}")
+        return lines
+
+    def finish(self, status: str = 'ok') -> Dict:
+        """
+        Write the summary event and the Prometheus textfile.
+
+        Returns:
+            Dict: The run summary
+        """
+        summary = self.summary()
+        self.event('run_finished', status=status, **summary)
+        if self.directory:
+            path = os.path.join(self.directory, f"{self.indexer}.prom")
+            # Written aside and renamed so the collector never reads a partial file
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                f.write("\n".join(self._prometheus_lines(summary)) + "\n")
+            os.replace(path + '.tmp', path)
+        if self._events is not None:
+            self._events.close()
+            self._events = None
+        return summary
+
+
+class StageProfiler:
+    """
+    Optional cProfile hook for pipeline stages.
+
+    Each stage thread gets its own profiler (cProfile only sees the thread
+    it is enabled in) and dumps ``<stage>_stage.prof`` into ``directory`` for
+    ``snakeviz`` or ``pstats``. Stage threads are also named, so
+    ``py-spy dump`` / ``py-spy record`` output shows which stage is busy.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> Optional["StageProfiler"]:
+        directory = os.getenv('RAG_PROFILE_DIR')
+        return cls(directory) if directory else None
+
+    @contextmanager
+    def profile(self, stage: str) -> Iterator[None]:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(self.directory, f"{stage}.prof"))
@@ -0,0 +1,612 @@
+import queue
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+from checkpoint_journal import CheckpointJournal
+from indexing_metrics import RunMetrics, StageProfiler
+from source_manifest import (SourceEntry, SourceManifest, chunk_hash, chunk_row_id, file_content_hash,
+                             source_document_id, stat_source)
+
+if TYPE_CHECKING:
+    from dead_letters import DeadLetterQueue
+    from near_duplicates import NearDuplicateFilter
+
+# Marks the end of the stream on every queue
+_END = object()
+
+# Follows the last page of a source on the page queue
+_SOURCE_END = object()
+
+# Default number of characters the splitter buffers before cutting chunks
+SPLIT_WINDOW = 64 * 1024
+
+
+class ChunkRecord:
+    """A chunk on its way from the splitter to a writer."""
+
+    def __init__(self, source_type: str, source_path: str, document_id: str, position: int,
+                 digest: str, text: str):
+        self.source_type = source_type
+        self.source_path = source_path
+        self.document_id = document_id
+        self.position = position
+        self.digest = digest
+        self.text = text
+
+    @property
+    def row_id(self) -> str:
+        return chunk_row_id(self.document_id, self.digest)
+
+
+class SourcePlan:
+    """A source that needs (re)indexing, with what the manifest knew about it."""
+
+    def __init__(self, source_type: str, source_path: str, document_id: str,
+                 entry: Optional[SourceEntry], size, mtime, content_hash: str, pages: Iterable[str]):
+        self.source_type = source_type
+        self.source_path = source_path
+        self.document_id = document_id
+        self.entry = entry
+        self.size = size
+        self.mtime = mtime
+        self.content_hash = content_hash
+        self.pages = pages
+        self.previous_hashes = set(entry.chunk_hashes) if entry and entry.document_id == document_id else set()
+        # Parked chunks to embed instead of splitting the source (see DeadLetterQueue)
+        self.retry: Optional[List[ChunkRecord]] = None
+
+
+class _SourceFailed:
+    """Replaces ``_SOURCE_END`` when a source could not be read to the end."""
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+class EmbeddingResult:
+    """The outcome of embedding one chunk: its vector, or the error that kept it from having one."""
+
+    def __init__(self, record: ChunkRecord, embedding: Optional[List[float]], error: Optional[str] = None):
+        self.record = record
+        self.embedding = embedding
+        self.error = error
+
+
+class SourceDone:
+    """Emitted after a source's last chunk; applied once every earlier batch is written."""
+
+    def __init__(self, plan: SourcePlan, chunk_hashes: List[str], stale_ids: List[str]):
+        self.plan = plan
+        self.chunk_hashes = chunk_hashes
+        self.stale_ids = stale_ids
+
+
+class ChunkWriter:
+    """Interface for the last pipeline stage; implemented per vector store."""
+
+    def write_chunks(self, records: List[ChunkRecord], embeddings: List[List[float]]) -> int:
+        """Persist embedded chunks and return how many were written."""
+        raise NotImplementedError
+
+    def delete_chunks(self, row_ids: List[str]):
+        raise NotImplementedError
+
+
+def stream_chunks(pages: Iterable[str], split: Callable[[str], List[str]],
+                  window: int = SPLIT_WINDOW) -> Iterator[str]:
+    """
+    Split a stream of pages into chunks while buffering at most about ``window`` characters.
+
+    Whenever the buffer exceeds the window it is split, every chunk but the
+    last is emitted, and splitting resumes from where the last chunk started.
+    Chunk boundaries therefore match splitting the full text, except right
+    at window edges.
+    """
+    buffer = ""
+    for page in pages:
+        buffer += page
+        if len(buffer) < window:
+            continue
+        chunks = split(buffer)
+        if len(chunks) < 2:
+            continue
+        for chunk in chunks[:-1]:
+            yield chunk
+        buffer = buffer[buffer.rfind(chunks[-1]):]
+    if buffer:
+        for chunk in split(buffer):
+            yield chunk
+
+
+class IngestPipeline:
+    """
+    Streaming load -> split -> embed -> write pipeline.
+
+    Each stage runs in its own thread and hands work to the next one through
+    a bounded queue, so a slow stage applies backpressure instead of letting
+    the corpus pile up in memory. Batches are committed as soon as they are
+    embedded, which makes the first chunks searchable while later files are
+    still being read.
+
+    Sources are checked against the manifest first: unchanged ones are not
+    read at all, and for changed ones only chunks missing from the index are
+    embedded. Stale chunks of a source are deleted after all of its new chunks
+    have been written.
+
+    With a ``NearDuplicateFilter``, new chunks that are near-copies of one
+    already seen in the run (boilerplate, repeated quotations) are dropped
+    before embedding. They stay in the manifest, so later runs do not
+    reconsider them until their source changes.
+
+    Busy time per stage (excluding time spent waiting on queues), bytes
+    read, batch timings and the final counters are reported to ``metrics``.
+    With a ``profiler`` every stage thread runs under its own cProfile.
+
+    With a ``journal`` every committed batch is checkpointed. A run with
+    ``resume=True`` skips the chunks an interrupted run already committed;
+    otherwise the journal is cleared and unfinished sources start over.
+
+    Every embedded batch must come back with exactly one result per chunk,
+    and each result travels with its chunk to the writer. With a
+    ``dead_letters`` queue, chunks whose embedding failed are parked there
+    with their error (``failure_reason(text)``, when given). A source that
+    is otherwise unchanged then re-embeds just its parked chunks, and
+    ``retry_dead_letters`` does so for every source without reading any.
+    """
+
+    def __init__(self, manifest: SourceManifest, writer: ChunkWriter,
+                 embed: Callable[[List[str]], List[Optional[List[float]]]],
+                 split: Callable[[str], List[str]],
+                 load_pages: Callable[[str, str], Iterable[str]],
+                 chunker_params: Dict, batch_size: int,
+                 default_document_id: Callable[[str], str] = source_document_id,
+                 near_duplicates: Optional['NearDuplicateFilter'] = None,
+                 metrics: Optional[RunMetrics] = None, profiler: Optional[StageProfiler] = None,
+                 journal: Optional[CheckpointJournal] = None, resume: bool = False,
+                 dead_letters: Optional['DeadLetterQueue'] = None,
+                 failure_reason: Optional[Callable[[str], Optional[str]]] = None,
+                 queue_size: int = 4, lookahead: int = 1, log: Callable[[str], None] = print):
+        self.manifest = manifest
+        self.writer = writer
+        self.embed = embed
+        self.split = split
+        self.load_pages = load_pages
+        self.chunker_params = chunker_params
+        self.batch_size = batch_size
+        self.default_document_id = default_document_id
+        self.near_duplicates = near_duplicates
+        self.metrics = metrics or RunMetrics('pipeline', directory=None)
+        self.profiler = profiler
+        self.journal = journal
+        self.resume = resume
+        self.dead_letters = dead_letters
+        self.failure_reason = failure_reason
+        self.queue_size = queue_size
+        self.lookahead = max(1, lookahead)
+        self.log = log
+
+        self.stats = self._zero_stats()
+        # Sources between their first chunk and their SourceDone, by path
+        self._open_plans: Dict[str, SourcePlan] = {}
+        # Row ids and sources with parked chunks, loaded when a run starts
+        self._dead_ids: Set[str] = set()
+        self._dead_sources: Set[str] = set()
+        self._retry_only = False
+        self._stop = threading.Event()
+        self._errors = []
+
+    # -- queue helpers ----------------------------------------------------
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _iter_queue(self, q: queue.Queue):
+        while True:
+            try:
+                item = q.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            if item is _END:
+                return
+            yield item
+
+    def _run_stage(self, target, *args):
+        try:
+            if self.profiler:
+                with self.profiler.profile(target.__name__.strip('_')):
+                    target(*args)
+            else:
+                target(*args)
+        except BaseException as e:
+            self._errors.append(e)
+            self._stop.set()
+
+    # -- stages -----------------------------------------------------------
+
+    def _plan_source(self, source: Dict[str, str]) -> Optional[SourcePlan]:
+        source_type = source.get('type')
+        location = source.get('path') or source.get('url')
+        # 'key' names the source in the manifest and on its chunks when where it
+        # is read from changes between runs (e.g. a spooled upload)
+        source_path = source.get('key') or location
+        self.log(f"Processing {source_type}: {source_path}")
+
+        entry = self.manifest.get(source_path)
+        if self._retry_only:
+            plan = self._retry_plan(source_type, source_path, entry)
+            if plan is None:
+                self.log("Source changed since its chunks failed; they are retried when it is re-indexed")
+            return plan
+        size = mtime = None
+        if source_type == 'file':
+            size, mtime = stat_source(location)
+            if entry and entry.matches_stat(size, mtime, self.chunker_params):
+                self.log("Source unchanged, skipping")
+                self.stats['sources_skipped'] += 1
+                return self._retry_plan(source_type, source_path, entry)
+            content_hash = file_content_hash(location)
+            self.metrics.inc('bytes_read', size)
+            if entry and entry.content_hash == content_hash and entry.chunker_params == self.chunker_params:
+                self.log("Source content unchanged, skipping")
+                entry.size, entry.mtime = size, mtime
+                self.manifest.put(entry)
+                self.stats['sources_skipped'] += 1
+                return self._retry_plan(source_type, source_path, entry)
+            pages = self.load_pages(source_type, location)
+        else:
+            # Remote sources have no cheap fingerprint, so fetch first and compare the content
+            content = "".join(self.load_pages(source_type, location))
+            self.metrics.inc('bytes_read', len(content.encode('utf-8')))
+            content_hash = chunk_hash(content)
+            if entry and entry.content_hash == content_hash and entry.chunker_params == self.chunker_params:
+                self.log("Source content unchanged, skipping")
+                self.stats['sources_skipped'] += 1
+                return self._retry_plan(source_type, source_path, entry)
+            pages = [content]
+
+        document_id = (source.get('document_id')
+                       or (entry.document_id if entry else None)
+                       or self.default_document_id(source_path))
+        plan = SourcePlan(source_type, source_path, document_id, entry, size, mtime, content_hash, pages)
+        if self.journal and self.resume:
+            committed = self.journal.committed_hashes(source_path, document_id, content_hash, self.chunker_params)
+            if committed:
+                # Already in the store: neither embedded nor written again, and not stale
+                self.log(f"Resuming: {len(committed)} chunks already committed")
+                self.stats['chunks_resumed'] += len(committed)
+                plan.previous_hashes |= committed
+        return plan
+
+    def _retry_plan(self, source_type: str, source_path: str, entry: Optional[SourceEntry]) -> Optional[SourcePlan]:
+        # Only chunks parked from the version the manifest holds can be added to it as they are
+        if source_path not in self._dead_sources or entry is None or entry.chunker_params != self.chunker_params:
+            return None
+        indexed = set(entry.chunk_hashes)
+        records = [letter.record for letter in self.dead_letters.entries(source_path)
+                   if letter.content_hash == entry.content_hash and letter.record.document_id == entry.document_id
+                   and letter.record.digest not in indexed]
+        if not records:
+            return None
+        self.log(f"Retrying {len(records)} chunks that failed to embed")
+        plan = SourcePlan(source_type, source_path, entry.document_id, entry, entry.size, entry.mtime,
+                          entry.content_hash, [])
+        plan.retry = records
+        return plan
+
+    def _load_stage(self, sources: List[Dict[str, str]], out: queue.Queue):
+        # Planning a source starts its loader, so keeping ``lookahead`` sources
+        # planned lets a parallel loader (see parallel_extraction) work on
+        # several files while pages of the current one are being consumed
+        pending = deque()
+        remaining = iter(sources)
+        while True:
+            while len(pending) < self.lookahead:
+                source = next(remaining, None)
+                if source is None or self._stop.is_set():
+                    break
+                try:
+                    with self.metrics.stage('load'):
+                        plan = self._plan_source(source)
+                except Exception as e:
+                    self.log(f"Error loading {source.get('path') or source.get('url')}: {str(e)}")
+                    continue
+                if plan is not None:
+                    pending.append(plan)
+            if not pending or self._stop.is_set():
+                break
+            plan = pending.popleft()
+            if not self._put(out, plan):
+                return
+            end = _SOURCE_END
+            pages = iter(plan.pages)
+            try:
+                while True:
+                    # Only time spent producing pages counts as load time, not queue waits
+                    with self.metrics.stage('load'):
+                        page = next(pages, _SOURCE_END)
+                    if page is _SOURCE_END:
+                        break
+                    self.metrics.inc('pages_loaded')
+                    if not self._put(out, page):
+                        return
+            except Exception as e:
+                end = _SourceFailed(e)
+            if not self._put(out, end):
+                return
+        self._put(out, _END)
+
+    def _source_pages(self, items: Iterator) -> Iterator[str]:
+        for item in items:
+            if item is _SOURCE_END:
+                return
+            if isinstance(item, _SourceFailed):
+                raise item.error
+            yield item
+
+    def _timed_split(self, text: str) -> List[str]:
+        with self.metrics.stage('split'):
+            return self.split(text)
+
+    def _split_stage(self, inp: queue.Queue, out: queue.Queue):
+        items = self._iter_queue(inp)
+        for plan in items:
+            self._open_plans[plan.source_path] = plan
+            if plan.retry is not None:
+                for _ in self._source_pages(items):
+                    pass
+                for record in plan.retry:
+                    if not self._put(out, record):
+                        return
+                self.stats['chunks_retried'] += len(plan.retry)
+                chunk_hashes = list(plan.entry.chunk_hashes) + [record.digest for record in plan.retry]
+                if not self._put(out, SourceDone(plan, chunk_hashes, [])):
+                    return
+                continue
+            seen = set()
+            chunk_hashes = []
+            new_count = 0
+            pages = self._source_pages(items)
+            try:
+                for position, chunk in enumerate(stream_chunks(pages, self._timed_split)):
+                    if not chunk.strip():
+                        continue
+                    digest = chunk_hash(chunk)
+                    if digest in seen:
+                        continue
+                    seen.add(digest)
+                    chunk_hashes.append(digest)
+                    if digest in plan.previous_hashes:
+                        if self.near_duplicates:
+                            self.near_duplicates.add(chunk)
+                        continue
+                    if self.near_duplicates and self.near_duplicates.is_duplicate(chunk):
+                        self.stats['chunks_near_duplicate'] += 1
+                        continue
+                    new_count += 1
+                    record = ChunkRecord(plan.source_type, plan.source_path, plan.document_id,
+                                         position, digest, chunk)
+                    if not self._put(out, record):
+                        return
+            except Exception as e:
+                # Whatever was already written stays; the manifest is not updated so the next run retries
+                self.log(f"Error reading {plan.source_path}: {str(e)}")
+                for _ in pages:
+                    pass
+                continue
+
+            if plan.entry and plan.entry.document_id != plan.document_id:
+                stale_ids = [chunk_row_id(plan.entry.document_id, digest) for digest in plan.entry.chunk_hashes]
+            else:
+                stale_ids = [chunk_row_id(plan.document_id, digest)
+                             for digest in plan.previous_hashes if digest not in seen]
+            self.log(f"Split {plan.source_path}: {len(chunk_hashes)} chunks, "
+                     f"{new_count} new, {len(stale_ids)} stale")
+            if not self._put(out, SourceDone(plan, chunk_hashes, stale_ids)):
+                return
+        self._put(out, _END)
+
+    def _embed_stage(self, inp: queue.Queue, out: queue.Queue):
+        records = []
+        done_markers = []
+
+        def flush() -> bool:
+            results = []
+            if records:
+                started = time.perf_counter()
+                embeddings = self.embed([record.text for record in records])
+                elapsed = time.perf_counter() - started
+                self.metrics.add_stage_time('embed', elapsed)
+                self.metrics.observe('embed_batch_seconds', elapsed)
+                if len(embeddings) != len(records):
+                    # Pairing them up anyway would attach vectors to the wrong text
+                    raise ValueError(f"Embedder returned {len(embeddings)} results for {len(records)} chunks")
+                results = [
+                    EmbeddingResult(record, embedding,
+                                    self.failure_reason(record.text)
+                                    if embedding is None and self.failure_reason else None)
+                    for record, embedding in zip(records, embeddings)
+                ]
+            ok = self._put(out, (results, list(done_markers)))
+            records.clear()
+            done_markers.clear()
+            return ok
+
+        for item in self._iter_queue(inp):
+            if isinstance(item, SourceDone):
+                # Released after the batch holding the source's last chunks
+                done_markers.append(item)
+                if not records and not flush():
+                    return
+                continue
+            records.append(item)
+            if len(records) >= self.batch_size and not flush():
+                return
+        if (records or done_markers) and not flush():
+            return
+        self._put(out, _END)
+
+    def _checkpoint(self, records: List[ChunkRecord]):
+        by_source = {}
+        for record in records:
+            by_source.setdefault(record.source_path, []).append(record)
+        for source_path, source_records in by_source.items():
+            plan = self._open_plans[source_path]
+            self.journal.record(source_path, plan.document_id, plan.content_hash, self.chunker_params,
+                                [record.position for record in source_records],
+                                [record.digest for record in source_records])
+
+    def _write_stage(self, inp: queue.Queue):
+        failed_by_source = {}
+        batch_number = 0
+        for results, done_markers in self._iter_queue(inp):
+            if results:
+                batch_number += 1
+                kept = [result for result in results if result.embedding is not None]
+                failed = [result for result in results if result.embedding is None]
+                for result in failed:
+                    # Left out of the manifest so a later run retries it
+                    failed_by_source.setdefault(result.record.source_path, set()).add(result.record.digest)
+                if failed:
+                    self.log(f"Warning: {len(failed)} of {len(results)} chunks could not be embedded")
+                    self.stats['chunks_failed'] += len(failed)
+                    if self.dead_letters:
+                        self.dead_letters.add(
+                            [result.record for result in failed],
+                            [self._open_plans[result.record.source_path].content_hash for result in failed],
+                            [result.error for result in failed],
+                        )
+                        self._dead_ids.update(result.record.row_id for result in failed)
+                        self._dead_sources.update(result.record.source_path for result in failed)
+                if kept:
+                    started = time.perf_counter()
+                    written = self.writer.write_chunks([result.record for result in kept],
+                                                       [result.embedding for result in kept])
+                    elapsed = time.perf_counter() - started
+                    self.metrics.add_stage_time('write', elapsed)
+                    self.metrics.inc('rows_written', written)
+                    self.metrics.event('batch_written', batch=batch_number, rows=written,
+                                       failed=len(failed), seconds=round(elapsed, 4))
+                    self.stats['chunks_indexed'] += written
+                    self.log(f"Batch {batch_number}: wrote {written} chunks")
+                    if self.journal:
+                        self._checkpoint([result.record for result in kept])
+                    recovered = [result.record.row_id for result in kept if result.record.row_id in self._dead_ids]
+                    if recovered:
+                        self.dead_letters.remove(recovered)
+                        self._dead_ids.difference_update(recovered)
+                        self.stats['chunks_recovered'] += len(recovered)
+
+            for done in done_markers:
+                # Stale chunks go only after their replacements are searchable
+                if done.stale_ids:
+                    with self.metrics.stage('write'):
+                        self.writer.delete_chunks(done.stale_ids)
+                    self.stats['chunks_removed'] += len(done.stale_ids)
+                failed = failed_by_source.pop(done.plan.source_path, set())
+                plan = done.plan
+                self.manifest.put(SourceEntry(
+                    plan.source_path, plan.document_id, plan.size, plan.mtime, plan.content_hash,
+                    self.chunker_params, [digest for digest in done.chunk_hashes if digest not in failed]
+                ))
+                if plan.source_path in self._dead_sources:
+                    # Parked chunks the new version no longer has will never be retried
+                    self.dead_letters.prune_source(plan.source_path, plan.document_id, plan.content_hash,
+                                                   done.chunk_hashes)
+                self.metrics.event('source_indexed', source=plan.source_path, chunks=len(done.chunk_hashes),
+                                   failed=len(failed), removed=len(done.stale_ids))
+                if self.journal:
+                    self.journal.clear_source(plan.source_path)
+                self._open_plans.pop(plan.source_path, None)
+
+    # -- entry point --------------------------------------------------------
+
+    @staticmethod
+    def _zero_stats() -> Dict[str, int]:
+        return {'sources_skipped': 0, 'chunks_indexed': 0, 'chunks_failed': 0, 'chunks_removed': 0,
+                'chunks_near_duplicate': 0, 'chunks_resumed': 0, 'chunks_retried': 0, 'chunks_recovered': 0}
+
+    def run(self, sources: List[Dict[str, str]]) -> Dict[str, int]:
+        """
+        Index the given sources.
+
+        A pipeline can run any number of times (e.g. once per slice of a
+        large library); each run returns its own counters, while the
+        near-duplicate filter and the writer carry over.
+
+        Args:
+            sources (List[Dict]): Source dictionaries with 'type' and 'path'/'url', optionally
+                'document_id' and a stable 'key' to record the source under instead of its path
+
+        Returns:
+            Dict[str, int]: Counters for indexed, failed, removed chunks and skipped sources
+        """
+        self.stats = self._zero_stats()
+        self._open_plans = {}
+        self._stop = threading.Event()
+        self._errors = []
+        if self.journal and not self.resume:
+            self.journal.clear()
+        if self.dead_letters:
+            self._dead_ids = self.dead_letters.row_ids()
+            self._dead_sources = set(self.dead_letters.counts())
+
+        pages = queue.Queue(maxsize=self.queue_size)
+        chunks = queue.Queue(maxsize=self.batch_size * self.queue_size)
+        batches = queue.Queue(maxsize=self.queue_size)
+
+        threads = [
+            # Named so profilers (py-spy, cProfile dumps) show which stage is busy
+            threading.Thread(target=self._run_stage, args=(self._load_stage, sources, pages),
+                             name='ingest-load', daemon=True),
+            threading.Thread(target=self._run_stage, args=(self._split_stage, pages, chunks),
+                             name='ingest-split', daemon=True),
+            threading.Thread(target=self._run_stage, args=(self._embed_stage, chunks, batches),
+                             name='ingest-embed', daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+        self._run_stage(self._write_stage, batches)
+        self._stop.set()
+        for thread in threads:
+            thread.join()
+        for name, value in self.stats.items():
+            self.metrics.inc(name, value)
+        if self.dead_letters:
+            self.metrics.set_gauge('dead_letter_chunks', sum(self.dead_letters.counts().values()))
+
+        if self._errors:
+            raise self._errors[0]
+        return self.stats
+
+    def retry_dead_letters(self) -> Dict[str, int]:
+        """
+        Re-embed the parked chunks of every source, and nothing else.
+
+        Sources are not read: each parked chunk is embedded from its stored
+        text, written, and added to its source's manifest entry. Chunks of a
+        source that changed since they failed are left for the run that
+        re-indexes it.
+
+        Returns:
+            Dict[str, int]: Counters as for ``run``; ``chunks_recovered`` were written this time
+        """
+        sources = {}
+        for letter in self.dead_letters.entries():
+            key = 'path' if letter.record.source_type == 'file' else 'url'
+            sources.setdefault(letter.record.source_path, {'type': letter.record.source_type,
+                                                           key: letter.record.source_path})
+        self._retry_only = True
+        try:
+            return self.run(list(sources.values()))
+        finally:
+            self._retry_only = False
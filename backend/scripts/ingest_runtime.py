@@ -0,0 +1,249 @@
+import os
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+from checkpoint_journal import CheckpointJournal
+from document_loaders import iter_document_pages
+from embedding_backends import api_key_from_env
+from embedding_cache import EmbeddingCache, embed_with_cache
+from indexing_metrics import RunMetrics, StageProfiler
+from ingest_pipeline import ChunkWriter, IngestPipeline
+from parallel_extraction import PARALLEL_EXTENSIONS, ExtractionPool
+from source_manifest import SourceManifest
+from text_splitter import split_text
+
+# requests, sqlalchemy and numpy are imported where they are used, so --help
+# and small runs do not pay for them at startup
+if TYPE_CHECKING:
+    from embedding_backends import EmbeddingBackend
+    from web_crawler import WebCrawler
+
+# The Gemini API key, for every indexer, the search service and the server (see api_key_from_env)
+API_KEY_ENV = 'GEMINI_API_KEY'
+
+# Recorded in the source manifest; changing them forces affected sources to be re-chunked
+CHUNKER_PARAMS = {'splitter': 'recursive', 'chunk_size': 1000, 'chunk_overlap': 200}
+
+# Shared across calls so the adaptive rate limit carries over between batches
+_embedding_engine = None
+_embedding_cache = None
+_extraction_pool = None
+_web_crawler = None
+
+
+def get_embedding_engine() -> "EmbeddingBackend":
+    """Return the process-wide embedding backend selected by EMBEDDING_BACKEND (Gemini reads api_key_from_env)."""
+    global _embedding_engine
+    if _embedding_engine is None:
+        from embedding_backends import embedder_from_env
+        _embedding_engine = embedder_from_env(api_key_from_env())
+    return _embedding_engine
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Return the process-wide on-disk embedding cache."""
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache.from_env()
+    return _embedding_cache
+
+
+def get_extraction_pool() -> ExtractionPool:
+    """Return the process-wide PDF/DOCX extraction pool."""
+    global _extraction_pool
+    if _extraction_pool is None:
+        _extraction_pool = ExtractionPool.from_env()
+    return _extraction_pool
+
+
+def shutdown_extraction_pool():
+    """Stop the extraction pool's workers, if started; the next ``get_extraction_pool`` starts a new pool."""
+    global _extraction_pool
+    if _extraction_pool is not None:
+        _extraction_pool.shutdown()
+        _extraction_pool = None
+
+
+def get_web_crawler() -> "WebCrawler":
+    """Return the process-wide web crawler, whose connections and robots rules are reused across pages."""
+    global _web_crawler
+    if _web_crawler is None:
+        from web_crawler import WebCrawler
+        _web_crawler = WebCrawler.from_env()
+    return _web_crawler
+
+
+def load_document(file_path: str) -> str:
+    """
+    Load text content from a file (PDF, DOCX, or anything else as UTF-8 text).
+
+    Args:
+        file_path (str): Path to the file
+
+    Returns:
+        str: Extracted text content
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
+
+    try:
+        return "".join(iter_document_pages(file_path))
+    except Exception as e:
+        print(f"Error loading document {file_path}: {str(e)}")
+        return ""
+
+
+def load_web_page(url: str) -> str:
+    """
+    Load the main text of a web page.
+
+    Pages go through the process-wide WebCrawler: robots.txt and per-host
+    politeness are respected, the main content is extracted with
+    BeautifulSoup, and the on-disk HTTP cache revalidates pages with
+    conditional GETs, so an unchanged page is not downloaded again and its
+    text hashes the same as last run (the pipeline then skips it).
+
+    Raises:
+        RuntimeError: If the page is disallowed or cannot be fetched and is not cached
+    """
+    return get_web_crawler().load(url)
+
+
+def load_source_pages(source_type: str, source_path: str) -> Iterable[str]:
+    """
+    Stream the text of a source page by page for the ingestion pipeline.
+
+    Args:
+        source_type (str): 'file' or 'url'
+        source_path (str): File path or URL
+
+    Returns:
+        Iterable[str]: Consecutive pieces of the source text
+    """
+    if source_type == 'file':
+        # PDF and DOCX extraction runs in the process pool, split by page range
+        if source_path.lower().endswith(PARALLEL_EXTENSIONS):
+            return get_extraction_pool().extract(source_path)
+        return iter_document_pages(source_path)
+    if source_type == 'url':
+        return [load_web_page(source_path)]
+    raise ValueError(f"Unknown source type: {source_type}")
+
+
+def crawl_sources(seeds: List[str], max_pages: int = 1000) -> List[Dict[str, str]]:
+    """
+    Crawl sites from their start pages and return their pages as url sources.
+
+    Pages are fetched concurrently (see web_crawler) and kept in the HTTP
+    cache, so indexing the returned sources reads them from there.
+
+    Args:
+        seeds (List[str]): Start pages; links under their directory are followed
+        max_pages (int): Maximum number of pages to visit
+
+    Returns:
+        List[Dict[str, str]]: One source per page with text
+    """
+    crawler = get_web_crawler()
+    results = crawler.crawl_sync(seeds, max_pages)
+    print(f"Crawl: {len(results)} pages visited, {crawler.stats()}")
+    return [{'type': 'url', 'url': result.url} for result in results if result.ok and result.text.strip()]
+
+
+def sources_from_args(paths: List[str]) -> List[Dict[str, str]]:
+    """Turn command-line paths and URLs into source dictionaries."""
+    return [
+        {'type': 'url', 'url': path} if urlparse(path).scheme in ('http', 'https') else {'type': 'file', 'path': path}
+        for path in paths
+    ]
+
+
+def split_text_into_chunks(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
+    """Split text into chunks with the recursive separator splitter (see text_splitter)."""
+    if not text.strip():
+        return []
+    return split_text(text, chunk_size, chunk_overlap, separators=["\n\n", "\n", ". ", " ", ""])
+
+
+def generate_embeddings(texts: List[str]) -> List[Optional[List[float]]]:
+    """
+    Embed texts with the configured backend, in input order (None where a text failed).
+
+    Cached embeddings are reused; only cache misses are sent to the backend
+    (for Gemini, in concurrent multi-text batches, see embedding_engine).
+    """
+    return embed_with_cache(get_embedding_engine(), get_embedding_cache(), texts)
+
+
+def build_pipeline(manifest: SourceManifest, writer: ChunkWriter, stored_batches: Callable[[], Iterable],
+                   metrics: Optional[RunMetrics] = None, resume: bool = False,
+                   wrap_writer: Optional[Callable[[ChunkWriter], ChunkWriter]] = None) -> IngestPipeline:
+    """
+    The ingestion pipeline of one manifest scope.
+
+    A BM25 index (lexical_index) and a verse -> chunk index of the Bible
+    references the chunks cite (bible_references) are kept in the
+    manifest's database for the same scope, built from the store's
+    ``stored_batches`` the first time and then fed by the written batches.
+    The checkpoint journal and the dead-letter table share the scope too.
+
+    Args:
+        manifest (SourceManifest): Manifest of the scope being indexed
+        writer (ChunkWriter): The vector store(s) to write
+        stored_batches (Callable): Returns the (rows, embeddings) pages already in the store
+        metrics (RunMetrics): Run metrics to report into
+        resume (bool): Skip the chunks an interrupted run already committed
+        wrap_writer (Callable): Optionally wraps the complete writer (e.g. to report progress)
+
+    Returns:
+        IngestPipeline: Ready to ``run`` or ``retry_dead_letters``
+    """
+    from bible_references import VerseChunkWriter, VerseIndex, ensure_verse_index
+    from dead_letters import DeadLetterQueue
+    from lexical_index import LexicalChunkWriter, LexicalIndex, ensure_lexical_index
+    from near_duplicates import NearDuplicateFilter
+
+    embedder = get_embedding_engine()
+    lexical = LexicalIndex(manifest.engine, manifest.scope)
+    ensure_lexical_index(lexical, stored_batches())
+    verses = VerseIndex(manifest.engine, manifest.scope)
+    ensure_verse_index(verses, stored_batches())
+    chunk_writer = VerseChunkWriter(LexicalChunkWriter(writer, lexical), verses)
+    return IngestPipeline(
+        manifest=manifest,
+        writer=wrap_writer(chunk_writer) if wrap_writer else chunk_writer,
+        embed=generate_embeddings,
+        split=split_text_into_chunks,
+        load_pages=load_source_pages,
+        chunker_params=CHUNKER_PARAMS,
+        batch_size=embedder.batch_size * embedder.concurrency,
+        near_duplicates=NearDuplicateFilter.from_env(),
+        metrics=metrics,
+        profiler=StageProfiler.from_env(),
+        journal=CheckpointJournal(manifest.engine, manifest.scope),
+        resume=resume,
+        dead_letters=DeadLetterQueue(manifest.engine, manifest.scope),
+        failure_reason=embedder.take_failure,
+        lookahead=get_extraction_pool().workers,
+    )
+
+
+def print_run_stats(stats: Dict[str, int], prefix: str = "Successfully indexed"):
+    """Print the counters of a pipeline run."""
+    print(f"{prefix}: {stats['chunks_indexed']} chunks added, "
+          f"{stats['chunks_removed']} removed, {stats['chunks_failed']} failed, "
+          f"{stats['sources_skipped']} sources unchanged")
+    if stats['chunks_retried']:
+        print(f"Retried {stats['chunks_retried']} chunks that failed before: {stats['chunks_recovered']} recovered")
+    if stats['chunks_failed']:
+        print(f"{stats['chunks_failed']} chunks are in the dead-letter table; rerun or use --retry-failed")
+    if stats['chunks_resumed']:
+        print(f"Resumed: {stats['chunks_resumed']} chunks were already committed by the interrupted run")
+
+
+def record_run_gauges(metrics: RunMetrics):
+    """Record the embedding cache and extraction pool counters in the run metrics."""
+    cache = get_embedding_cache()
+    metrics.set_gauge('embedding_cache_hits', cache.hits)
+    metrics.set_gauge('embedding_cache_misses', cache.misses)
+    metrics.set_gauge('pages_extracted_in_pool', get_extraction_pool().pages)
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import select
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+from ingest_pipeline import ChunkRecord, ChunkWriter
+
+JOB_CHANNEL = "rag_ingest_jobs"
+
+# A running job whose heartbeat is older than this belongs to a dead worker
+# and can be claimed again
+DEFAULT_LEASE_SECONDS = 120
+
+# Claims of a job before it is marked failed
+MAX_ATTEMPTS = 3
+
+# A failed job waits a jittered backoff (up to base * 2**attempts seconds,
+# capped) before it can be claimed again
+RETRY_BACKOFF_BASE = 15.0
+RETRY_BACKOFF_CAP = 900.0
+
+# Serializes claims across workers (one transaction-scoped advisory lock), so
+# the one-running-job-per-user check cannot race
+CLAIM_LOCK_KEY = 0x7261675f6a6f62  # "rag_job"
+
+# Kept in sync with drizzle/0007_rag_ingest_jobs.sql and 0010_rag_ingest_jobs_run_after.sql
+JOB_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS rag_ingest_jobs (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    document_id VARCHAR(255) NOT NULL,
+    file_name VARCHAR(500) NOT NULL,
+    source_url VARCHAR(500),
+    payload BYTEA,
+    payload_bytes INTEGER NOT NULL DEFAULT 0,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    chunks_indexed INTEGER NOT NULL DEFAULT 0,
+    chunks_failed INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    worker VARCHAR(255),
+    created_at TIMESTAMP DEFAULT NOW(),
+    started_at TIMESTAMP,
+    heartbeat_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    run_after TIMESTAMP DEFAULT NOW()
+);
+ALTER TABLE rag_ingest_jobs ADD COLUMN IF NOT EXISTS run_after TIMESTAMP DEFAULT NOW();
+CREATE INDEX IF NOT EXISTS rag_ingest_jobs_status_idx ON rag_ingest_jobs (status, id);
+CREATE INDEX IF NOT EXISTS rag_ingest_jobs_user_idx ON rag_ingest_jobs (user_id, created_at);
+CREATE OR REPLACE FUNCTION rag_ingest_jobs_notify() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('rag_ingest_jobs', NEW.id::text);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS rag_ingest_jobs_notify ON rag_ingest_jobs;
+CREATE TRIGGER rag_ingest_jobs_notify AFTER INSERT ON rag_ingest_jobs
+    FOR EACH ROW EXECUTE FUNCTION rag_ingest_jobs_notify();
+"""
+
+
+class IngestJob:
+    """A claimed row of ``rag_ingest_jobs``."""
+
+    def __init__(self, id: int, user_id: int, document_id: str, file_name: str, source_url: Optional[str],
+                 payload: bytes, attempts: int):
+        self.id = id
+        self.user_id = user_id
+        self.document_id = document_id
+        self.file_name = file_name
+        self.source_url = source_url
+        self.payload = payload
+        self.attempts = attempts
+
+
+class IngestJobQueue:
+    """
+    Ingestion jobs in Postgres, claimed with ``FOR UPDATE SKIP LOCKED``.
+
+    The server inserts a row with the uploaded file; an insert trigger
+    sends ``NOTIFY rag_ingest_jobs`` so idle workers wake up at once
+    instead of polling. Any number of workers can share the table: a job
+    is claimed by exactly one of them, a user has at most one job running
+    at a time (their manifest and checkpoint journal have a single writer),
+    and among the users with queued jobs the oldest job goes first. Workers
+    heartbeat while they work; a job whose worker died is claimed again
+    after ``lease_seconds`` and resumed from its checkpoints.
+    """
+
+    def __init__(self, engine, lease_seconds: int = DEFAULT_LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS):
+        from sqlalchemy import text
+
+        self.engine = engine
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        with engine.begin() as conn:
+            conn.execute(text(JOB_TABLE_SQL))
+
+    def enqueue(self, user_id: int, document_id: str, file_name: str, payload: bytes,
+                source_url: Optional[str] = None) -> int:
+        """Queue a document; returns the job id."""
+        from sqlalchemy import text
+
+        with self.engine.begin() as conn:
+            return conn.execute(text("""
+                INSERT INTO rag_ingest_jobs (user_id, document_id, file_name, source_url, payload, payload_bytes)
+                VALUES (:user_id, :document_id, :file_name, :source_url, :payload, :payload_bytes)
+                RETURNING id
+            """), {'user_id': user_id, 'document_id': document_id, 'file_name': file_name,
+                   'source_url': source_url, 'payload': payload, 'payload_bytes': len(payload)}).scalar()
+
+    def claim(self, worker: str) -> Optional[IngestJob]:
+        """
+        Take the next runnable job, or None.
+
+        Returns:
+            Optional[IngestJob]: The job, now 'running' and owned by ``worker``
+        """
+        from sqlalchemy import text
+
+        with self.engine.begin() as conn:
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': CLAIM_LOCK_KEY})
+            row = conn.execute(text("""
+                UPDATE rag_ingest_jobs
+                SET status = 'running', attempts = attempts + 1, worker = :worker,
+                    started_at = NOW(), heartbeat_at = NOW()
+                WHERE id = (
+                    SELECT j.id FROM rag_ingest_jobs j
+                    WHERE ((j.status = 'queued' AND (j.run_after IS NULL OR j.run_after <= NOW()))
+                           OR (j.status = 'running' AND j.heartbeat_at < NOW() - make_interval(secs => :lease)))
+                      AND NOT EXISTS (
+                          SELECT 1 FROM rag_ingest_jobs r
+                          WHERE r.user_id = j.user_id AND r.id <> j.id AND r.status = 'running'
+                            AND r.heartbeat_at >= NOW() - make_interval(secs => :lease))
+                    ORDER BY j.id
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING id, user_id, document_id, file_name, source_url, payload, attempts
+            """), {'worker': worker, 'lease': self.lease_seconds}).fetchone()
+        if row is None:
+            return None
+        return IngestJob(row[0], row[1], row[2], row[3], row[4], bytes(row[5] or b''), row[6])
+
+    def heartbeat(self, job_id: int, chunks_indexed: Optional[int] = None):
+        from sqlalchemy import text
+
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                UPDATE rag_ingest_jobs
+                SET heartbeat_at = NOW(), chunks_indexed = COALESCE(:chunks, chunks_indexed)
+                WHERE id = :id AND status = 'running'
+            """), {'id': job_id, 'chunks': chunks_indexed})
+
+    def finish(self, job_id: int, stats: Dict[str, int]):
+        """Mark a job done and drop its payload, which is no longer needed."""
+        from sqlalchemy import text
+
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                UPDATE rag_ingest_jobs
+                SET status = 'done', payload = NULL, error = NULL, finished_at = NOW(), heartbeat_at = NOW(),
+                    chunks_indexed = :chunks_indexed, chunks_failed = :chunks_failed
+                WHERE id = :id
+            """), {'id': job_id, 'chunks_indexed': stats.get('chunks_indexed', 0) + stats.get('chunks_resumed', 0),
+                   'chunks_failed': stats.get('chunks_failed', 0)})
+
+    def fail(self, job: IngestJob, error: str):
+        """
+        Put a job back in the queue after a backoff, or mark it failed once it
+        has used up its attempts.
+        """
+        from sqlalchemy import text
+
+        from embedding_engine import backoff_delay
+
+        final = job.attempts >= self.max_attempts
+        delay = 0.0 if final else backoff_delay(job.attempts, RETRY_BACKOFF_BASE, RETRY_BACKOFF_CAP)
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                UPDATE rag_ingest_jobs
+                SET status = :status, error = :error, heartbeat_at = NOW(),
+                    run_after = NOW() + make_interval(secs => :delay),
+                    finished_at = CASE WHEN :final THEN NOW() END
+                WHERE id = :id
+            """), {'id': job.id, 'status': 'failed' if final else 'queued', 'error': error[:2000], 'final': final,
+                   'delay': delay})
+
+    def next_due(self) -> Optional[float]:
+        """Seconds until the earliest backed-off job becomes claimable, or None if none is waiting."""
+        from sqlalchemy import text
+
+        with self.engine.connect() as conn:
+            seconds = conn.execute(text("""
+                SELECT EXTRACT(EPOCH FROM MIN(run_after) - NOW()) FROM rag_ingest_jobs
+                WHERE status = 'queued' AND run_after > NOW()
+            """)).scalar()
+        return None if seconds is None else max(0.0, float(seconds))
+
+    def listen(self):
+        """A dedicated autocommit connection subscribed to ``rag_ingest_jobs`` notifications."""
+        connection = self.engine.raw_connection()
+        dbapi = connection.driver_connection
+        dbapi.autocommit = True
+        with dbapi.cursor() as cursor:
+            cursor.execute(f"LISTEN {JOB_CHANNEL}")
+        return connection
+
+    @staticmethod
+    def wait(connection, timeout: float) -> bool:
+        """Block until a job is queued or ``timeout`` passes; True if notified."""
+        dbapi = connection.driver_connection
+        if not dbapi.notifies and select.select([dbapi], [], [], timeout) == ([], [], []):
+            return False
+        dbapi.poll()
+        notified = bool(dbapi.notifies)
+        dbapi.notifies.clear()
+        return notified
+
+
+class ProgressChunkWriter(ChunkWriter):
+    """Wraps the store writer and records each committed batch on the job row."""
+
+    def __init__(self, inner: ChunkWriter, queue: IngestJobQueue, job_id: int):
+        self.inner = inner
+        self.queue = queue
+        self.job_id = job_id
+        self.written = 0
+
+    def write_chunks(self, records: List[ChunkRecord], embeddings: List[List[float]]) -> int:
+        written = self.inner.write_chunks(records, embeddings)
+        self.written += written
+        self.queue.heartbeat(self.job_id, self.written)
+        return written
+
+    def delete_chunks(self, row_ids: List[str]):
+        self.inner.delete_chunks(row_ids)
+
+
+class IngestWorker:
+    """
+    Long-running loop: claim a job, index it with the ``rag_indexer_postgres``
+    pipeline, record the outcome, and sleep on LISTEN when the queue is empty.
+
+    The uploaded file is spooled to ``<spool>/<job id>/<file name>`` so the
+    usual loaders (PDF and DOCX included) read it, and removed afterwards.
+    The source is recorded as ``upload:<user id>/<document id>`` rather than
+    by that path, so a revised upload of the same document is re-indexed
+    incrementally: unchanged chunks are kept and removed ones deleted.
+    Jobs always run with ``resume``: a job claimed again after a crash skips
+    the chunks its previous attempt committed. The search snapshot is
+    republished once the queue drains, not after every job.
+    """
+
+    def __init__(self, queue: IngestJobQueue, spool_dir: Optional[str] = None, poll_interval: float = 30.0,
+                 name: Optional[str] = None, publish_snapshots: bool = True):
+        self.queue = queue
+        self.spool_dir = spool_dir or tempfile.gettempdir()
+        self.poll_interval = poll_interval
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.publish_snapshots = publish_snapshots
+        self.jobs_done = 0
+        self.jobs_failed = 0
+        self._unpublished = False
+
+    def _heartbeat_loop(self, job_id: int, stop: threading.Event):
+        while not stop.wait(self.queue.lease_seconds / 3):
+            try:
+                self.queue.heartbeat(job_id)
+            except Exception as e:
+                print(f"Heartbeat failed for job {job_id}: {e}")
+
+    def process(self, job: IngestJob) -> Dict[str, int]:
+        """
+        Index one job's document.
+
+        Returns:
+            Dict[str, int]: Pipeline counters
+
+        Raises:
+            RuntimeError: If the document was not fully indexed or some of its chunks failed to embed
+        """
+        from sqlalchemy import text
+        from indexing_metrics import RunMetrics
+        from migrate_pgvector import ensure_user_partition
+        from rag_indexer_postgres import get_embedding_engine, index_user_sources
+        from source_manifest import SourceManifest, file_content_hash
+
+        key = f"upload:{job.user_id}/{job.document_id}"
+        job_dir = os.path.join(self.spool_dir, f"rag-job-{job.id}")
+        os.makedirs(job_dir, exist_ok=True)
+        path = os.path.join(job_dir, os.path.basename(job.file_name) or 'document.txt')
+        with open(path, 'wb') as f:
+            f.write(job.payload)
+
+        metrics = RunMetrics.from_env('ingest-worker')
+        metrics.event('job_started', job_id=job.id, user=job.user_id, bytes=len(job.payload), attempt=job.attempts)
+        get_embedding_engine().metrics = metrics
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat_loop, args=(job.id, stop), daemon=True)
+        heartbeat.start()
+        status = 'error'
+        try:
+            with self.queue.engine.connect() as conn:
+                ensure_user_partition(conn, job.user_id)
+            stats = index_user_sources(
+                [{'type': 'file', 'path': path, 'key': key, 'document_id': job.document_id}], job.user_id, resume=True,
+                metrics=metrics, wrap_writer=lambda writer: ProgressChunkWriter(writer, self.queue, job.id),
+            )
+            # The manifest only records a source once all of its chunks were written
+            entry = SourceManifest(self.queue.engine, f"user:{job.user_id}").get(key)
+            if entry is None or entry.content_hash != file_content_hash(path):
+                raise RuntimeError("Document was not fully indexed (extraction or embedding failed)")
+            if stats['chunks_failed']:
+                # They wait in rag_dead_letters; the next attempt finds the file unchanged and embeds only them
+                raise RuntimeError(f"{stats['chunks_failed']} chunks could not be embedded")
+            # Chunks name their source by key; show the uploaded file name instead
+            with self.queue.engine.begin() as conn:
+                conn.execute(text("""
+                    UPDATE rag_chunks SET source_url = :source_url
+                    WHERE user_id = :user_id AND source_url = :key
+                """), {'source_url': job.source_url or job.file_name, 'user_id': job.user_id, 'key': key})
+            status = 'ok'
+            return stats
+        finally:
+            stop.set()
+            heartbeat.join()
+            metrics.finish(status=status)
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+    def run_once(self) -> bool:
+        """Claim and process one job; False when the queue had nothing runnable."""
+        job = self.queue.claim(self.name)
+        if job is None:
+            return False
+        if job.attempts > self.queue.max_attempts:
+            # Its workers kept dying mid-job
+            self.queue.fail(job, f"Gave up after {job.attempts - 1} attempts")
+            self.jobs_failed += 1
+            return True
+        print(f"Job {job.id}: {job.file_name} for user {job.user_id} "
+              f"({len(job.payload)} bytes, attempt {job.attempts})")
+        started = time.perf_counter()
+        try:
+            stats = self.process(job)
+        except Exception as e:
+            self.queue.fail(job, str(e))
+            self.jobs_failed += 1
+            print(f"Job {job.id} failed: {e}")
+        else:
+            self.queue.finish(job.id, stats)
+            self.jobs_done += 1
+            self._unpublished = self._unpublished or bool(stats['chunks_indexed'] or stats['chunks_removed'])
+            print(f"Job {job.id} done in {time.perf_counter() - started:.1f}s: "
+                  f"{stats['chunks_indexed']} chunks indexed")
+        return True
+
+    def _publish_if_needed(self):
+        if not (self.publish_snapshots and self._unpublished):
+            return
+        from rag_indexer_postgres import publish_search_snapshot
+
+        try:
+            publish_search_snapshot()
+            self._unpublished = False
+        except Exception as e:
+            print(f"Could not publish search snapshot: {e}")
+
+    def run(self, drain: bool = False):
+        """
+        Work until interrupted (or, with ``drain``, until the queue is empty).
+
+        Between jobs the worker waits on LISTEN; the poll interval only bounds
+        how long a job of a dead worker waits to be reclaimed. A job backing
+        off after a failure wakes the worker when it becomes due.
+        """
+        from ingest_runtime import shutdown_extraction_pool
+
+        connection = self.queue.listen()
+        print(f"Ingest worker {self.name} waiting for jobs on '{JOB_CHANNEL}'")
+        try:
+            while True:
+                while self.run_once():
+                    pass
+                self._publish_if_needed()
+                if drain:
+                    return
+                due = self.queue.next_due()
+                self.queue.wait(connection, self.poll_interval if due is None else min(self.poll_interval, due))
+        finally:
+            connection.close()
+            shutdown_extraction_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indexes uploaded documents queued in rag_ingest_jobs")
+    parser.add_argument('--spool-dir', default=os.getenv('RAG_SPOOL_DIR'),
+                        help="Where job files are written while they are indexed (default: system temp dir)")
+    parser.add_argument('--poll-interval', type=float, default=30.0,
+                        help="Seconds between queue checks when no notification arrives")
+    parser.add_argument('--lease', type=int, default=DEFAULT_LEASE_SECONDS,
+                        help="Seconds without heartbeat after which a running job is reclaimed")
+    parser.add_argument('--drain', action='store_true', help="Exit once the queue is empty")
+    parser.add_argument('--no-snapshot', action='store_true',
+                        help="Do not republish the vector_search_service snapshot when the queue drains")
+    args = parser.parse_args()
+
+    from embedding_backends import api_key_from_env, needs_api_key
+    from rag_indexer_postgres import (create_rag_table, ensure_table_space, get_embedding_engine,
+                                      get_engine)
+
+    if needs_api_key() and not api_key_from_env():
+        print("GEMINI_API_KEY is not set")
+        sys.exit(1)
+
+    create_rag_table()
+    space = ensure_table_space(get_embedding_engine())
+    print(f"Embedding backend: {space['model']} (dimension {space['dimension']})")
+
+    worker = IngestWorker(IngestJobQueue(get_engine(), lease_seconds=args.lease), args.spool_dir,
+                          args.poll_interval, publish_snapshots=not args.no_snapshot)
+    try:
+        worker.run(drain=args.drain)
+    except KeyboardInterrupt:
+        pass
+    print(f"Jobs done: {worker.jobs_done}, failed: {worker.jobs_failed}")
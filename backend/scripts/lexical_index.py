@@ -0,0 +1,275 @@
+import hashlib
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from ingest_pipeline import ChunkRecord, ChunkWriter
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Longest indexed term; longer tokens are truncated
+MAX_TERM_LENGTH = 64
+
+# Accent-folded, so they match folded tokens
+STOPWORDS = frozenset("""
+a ao aos aquela aquelas aquele aqueles aquilo as ate com como da das de dela delas dele deles depois do dos
+e ela elas ele eles em entre era eram essa essas esse esses esta estas este estes eu foi foram ha isso isto
+ja lhe lhes mais mas me mesmo meu meus minha minhas muito na nas nao nem no nos nossa nossas nosso nossos num
+numa o os ou para pela pelas pelo pelos por qual quando que quem se sem ser seu seus so sua suas tambem te
+tem tu tua tuas um uma umas uns voce voces vos
+""".split())
+
+# (suffix, replacement) plural rules, tried in order on folded tokens
+PLURAL_RULES = (
+    ('ns', 'm'), ('oes', 'ao'), ('aes', 'ao'), ('ais', 'al'), ('eis', 'el'), ('ois', 'ol'),
+    ('res', 'r'), ('zes', 'z'), ('les', 'l'),
+)
+
+
+def fold_accents(text: str) -> str:
+    """Lower-case and strip diacritics: "Propiciação" -> "propiciacao"."""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def stem(token: str) -> str:
+    """
+    Light Portuguese stemmer in the spirit of Savoy's: plural folding, then
+    dropping a final gender/number vowel.
+
+    It only has to map inflections of a word to the same key, for the index
+    and the query alike, so it favours a few predictable rules over
+    linguistic accuracy: "Efésios" and "efésio" share a key, as do
+    "pecados"/"pecado" and "orações"/"oração".
+    """
+    if len(token) <= 3 or token.isdigit():
+        return token
+    for suffix, replacement in PLURAL_RULES:
+        if token.endswith(suffix) and len(token) > len(suffix) + 2:
+            token = token[:-len(suffix)] + replacement
+            break
+    else:
+        if token.endswith('s') and not token.endswith(('ss', 'us', 'is')):
+            token = token[:-1]
+    if len(token) > 4 and token[-1] in 'aoe':
+        token = token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Accent-folded, stemmed terms of a text, without stopwords."""
+    return [stem(token)[:MAX_TERM_LENGTH] for token in TOKEN_PATTERN.findall(fold_accents(text))
+            if token not in STOPWORDS]
+
+
+def doc_key(chunk_id: str) -> int:
+    """60-bit integer key for a chunk id, so postings do not repeat the long id."""
+    return int(hashlib.sha256(chunk_id.encode('utf-8')).hexdigest()[:15], 16)
+
+
+class LexicalIndex:
+    """
+    BM25 inverted index over indexed chunks.
+
+    Postings ``(term, doc, tf)`` and per-chunk lengths live in SQL tables,
+    so like ``SourceManifest`` it works on the Postgres database of
+    ``rag_chunks`` or on a SQLite file beside a Chroma collection, and it is
+    updated incrementally as chunks are written and removed. Terms come from
+    ``tokenize`` (accent folding, Portuguese stopwords, light stemming), so
+    "Efésios", "efesios" and "Efésio" all hit the same postings.
+    """
+
+    def __init__(self, engine, scope: str, k1: float = 1.2, b: float = 0.75):
+        from sqlalchemy import text
+
+        self.engine = engine
+        self.scope = scope
+        self.k1 = k1
+        self.b = b
+        with engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS rag_lexical_docs (
+                    scope VARCHAR(255) NOT NULL,
+                    doc_key BIGINT NOT NULL,
+                    chunk_id VARCHAR(255) NOT NULL,
+                    length INTEGER NOT NULL,
+                    PRIMARY KEY (scope, doc_key)
+                )
+            """))
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS rag_lexical_postings (
+                    scope VARCHAR(255) NOT NULL,
+                    term VARCHAR(64) NOT NULL,
+                    doc_key BIGINT NOT NULL,
+                    tf INTEGER NOT NULL,
+                    PRIMARY KEY (scope, term, doc_key)
+                )
+            """))
+
+    def add(self, chunks: Iterable[Tuple[str, str]]):
+        """
+        Index (or re-index) chunks.
+
+        Args:
+            chunks (Iterable[Tuple[str, str]]): (chunk id, text) pairs
+        """
+        from sqlalchemy import text
+
+        docs, postings = {}, []
+        for chunk_id, chunk_text in chunks:
+            key = doc_key(chunk_id)
+            if key in docs:
+                continue
+            terms = Counter(tokenize(chunk_text))
+            docs[key] = {'scope': self.scope, 'doc_key': key, 'chunk_id': chunk_id,
+                         'length': sum(terms.values())}
+            postings.extend({'scope': self.scope, 'term': term, 'doc_key': key, 'tf': tf}
+                            for term, tf in terms.items())
+        if not docs:
+            return
+        with self.engine.begin() as conn:
+            self._delete_keys(conn, list(docs))
+            conn.execute(text("INSERT INTO rag_lexical_docs (scope, doc_key, chunk_id, length) "
+                              "VALUES (:scope, :doc_key, :chunk_id, :length)"), list(docs.values()))
+            if postings:
+                conn.execute(text("INSERT INTO rag_lexical_postings (scope, term, doc_key, tf) "
+                                  "VALUES (:scope, :term, :doc_key, :tf)"), postings)
+
+    def remove(self, chunk_ids: Sequence[str]):
+        if not chunk_ids:
+            return
+        with self.engine.begin() as conn:
+            self._delete_keys(conn, [doc_key(chunk_id) for chunk_id in chunk_ids])
+
+    def _delete_keys(self, conn, keys: List[int]):
+        from sqlalchemy import bindparam, text
+
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            for table in ('rag_lexical_postings', 'rag_lexical_docs'):
+                conn.execute(text(f"DELETE FROM {table} WHERE scope = :scope AND doc_key IN :keys")
+                             .bindparams(bindparam('keys', expanding=True)), {'scope': self.scope, 'keys': part})
+
+    def clear(self):
+        from sqlalchemy import text
+
+        with self.engine.begin() as conn:
+            for table in ('rag_lexical_postings', 'rag_lexical_docs'):
+                conn.execute(text(f"DELETE FROM {table} WHERE scope = :scope"), {'scope': self.scope})
+
+    def count(self) -> int:
+        from sqlalchemy import text
+
+        with self.engine.connect() as conn:
+            return conn.execute(text("SELECT COUNT(*) FROM rag_lexical_docs WHERE scope = :scope"),
+                                {'scope': self.scope}).scalar()
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[str, float]]:
+        """
+        Rank chunks for a query with BM25.
+
+        Args:
+            query (str): Query text
+            limit (int): Maximum number of results
+
+        Returns:
+            List[Tuple[str, float]]: (chunk id, score) pairs, best first
+        """
+        from sqlalchemy import bindparam, text
+
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+        with self.engine.connect() as conn:
+            documents, average_length = conn.execute(text(
+                "SELECT COUNT(*), AVG(length) FROM rag_lexical_docs WHERE scope = :scope"
+            ), {'scope': self.scope}).fetchone()
+            if not documents:
+                return []
+            rows = conn.execute(text("""
+                SELECT p.term, p.tf, d.length, d.chunk_id
+                FROM rag_lexical_postings p
+                JOIN rag_lexical_docs d ON d.scope = p.scope AND d.doc_key = p.doc_key
+                WHERE p.scope = :scope AND p.term IN :terms
+            """).bindparams(bindparam('terms', expanding=True)), {'scope': self.scope, 'terms': terms}).fetchall()
+
+        by_term: Dict[str, List] = {}
+        for term, tf, length, chunk_id in rows:
+            by_term.setdefault(term, []).append((tf, length, chunk_id))
+        average_length = float(average_length) or 1.0
+        scores: Dict[str, float] = {}
+        for term, postings in by_term.items():
+            idf = math.log(1 + (documents - len(postings) + 0.5) / (len(postings) + 0.5))
+            for tf, length, chunk_id in postings:
+                norm = tf + self.k1 * (1 - self.b + self.b * length / average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: -item[1])[:limit]
+
+
+class LexicalChunkWriter(ChunkWriter):
+    """Wraps a vector store writer and keeps a ``LexicalIndex`` in step with it."""
+
+    def __init__(self, inner: ChunkWriter, lexical: LexicalIndex):
+        self.inner = inner
+        self.lexical = lexical
+
+    def write_chunks(self, records: List[ChunkRecord], embeddings: List[List[float]]) -> int:
+        written = self.inner.write_chunks(records, embeddings)
+        self.lexical.add((record.row_id, record.text) for record in records)
+        return written
+
+    def delete_chunks(self, row_ids: List[str]):
+        self.inner.delete_chunks(row_ids)
+        self.lexical.remove(row_ids)
+
+
+def ensure_lexical_index(lexical: LexicalIndex, batches: Iterable[Tuple[List[Dict], List]],
+                         log=print) -> int:
+    """
+    Build the lexical index from the vector store when it is empty.
+
+    Stores indexed before the lexical index existed would otherwise only get
+    postings for sources that change again.
+
+    Args:
+        lexical (LexicalIndex): Index to fill
+        batches: (rows, embeddings) pages of the store, rows with 'id' and 'text'
+
+    Returns:
+        int: Number of chunks added
+    """
+    if lexical.count():
+        return 0
+    added = 0
+    for rows, _ in batches:
+        lexical.add((row['id'], row['text']) for row in rows)
+        added += len(rows)
+    if added:
+        log(f"Lexical index built for {added} existing chunks")
+    return added
+
+
+def fuse_scores(dense: Dict[str, float], lexical: Dict[str, float], alpha: float = 0.5) -> List[Tuple[str, float]]:
+    """
+    Combine dense and BM25 scores: ``alpha * dense + (1 - alpha) * lexical``.
+
+    Each side is min-max normalized over its candidates first (BM25 scores
+    are unbounded, cosine scores are not), and a candidate missing from one
+    side gets 0 there.
+
+    Returns:
+        List[Tuple[str, float]]: (chunk id, fused score), best first
+    """
+    def normalized(scores: Dict[str, float]) -> Dict[str, float]:
+        if not scores:
+            return {}
+        low, high = min(scores.values()), max(scores.values())
+        span = high - low
+        return {key: (value - low) / span if span else 1.0 for key, value in scores.items()}
+
+    dense, lexical = normalized(dense), normalized(lexical)
+    fused = {key: alpha * dense.get(key, 0.0) + (1 - alpha) * lexical.get(key, 0.0)
+             for key in set(dense) | set(lexical)}
+    return sorted(fused.items(), key=lambda item: -item[1])
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import sys
+import time
+from typing import List
+
+from sqlalchemy import create_engine, text
+
+# text-embedding-004 output size
+EMBEDDING_DIMENSION = 768
+
+VECTOR_INDEX_NAME = "rag_chunks_embedding_idx"
+
+# int8 codes, their per-row scale and packed sign bits (see vector_quantization)
+QUANTIZED_COLUMNS = ('embedding_int8', 'embedding_scale', 'embedding_bits')
+
+# Catches rows of users that have no partition of their own yet
+DEFAULT_PARTITION = "rag_chunks_default"
+
+# First key of the transaction-scoped advisory lock (namespace, user_id) taken
+# while a user's partition is created, so concurrent workers do not race
+PARTITION_LOCK_NAMESPACE = 0x72616763  # "ragc"
+
+# Rebuilds rag_chunks as a table LIST-partitioned by user_id, one partition per
+# existing user plus a default one; kept in sync with
+# drizzle/0006_rag_chunks_partition_by_user.sql. The primary key has to
+# include the partition key, so it becomes (user_id, id).
+PARTITION_SQL = """
+DO $$
+DECLARE
+  tenant integer;
+  id_sequence text;
+  had_user_fk boolean;
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'rag_chunks'::regclass) THEN
+    RETURN;
+  END IF;
+  id_sequence := pg_get_serial_sequence('rag_chunks', 'id');
+  had_user_fk := EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'rag_chunks_user_id_users_id_fk');
+
+  ALTER TABLE rag_chunks RENAME TO rag_chunks_unpartitioned;
+  ALTER TABLE rag_chunks_unpartitioned DROP CONSTRAINT IF EXISTS rag_chunks_pkey;
+  ALTER TABLE rag_chunks_unpartitioned DROP CONSTRAINT IF EXISTS rag_chunks_user_id_users_id_fk;
+  DROP INDEX IF EXISTS rag_chunks_embedding_idx;
+  DROP INDEX IF EXISTS rag_chunks_user_document_idx;
+
+  CREATE TABLE rag_chunks (
+    LIKE rag_chunks_unpartitioned INCLUDING DEFAULTS,
+    PRIMARY KEY (user_id, id)
+  ) PARTITION BY LIST (user_id);
+  CREATE TABLE rag_chunks_default PARTITION OF rag_chunks DEFAULT;
+  FOR tenant IN SELECT DISTINCT user_id FROM rag_chunks_unpartitioned LOOP
+    EXECUTE format('CREATE TABLE %I PARTITION OF rag_chunks FOR VALUES IN (%s)', 'rag_chunks_u' || tenant, tenant);
+  END LOOP;
+  INSERT INTO rag_chunks SELECT * FROM rag_chunks_unpartitioned;
+  IF id_sequence IS NOT NULL THEN
+    EXECUTE format('ALTER SEQUENCE %s OWNED BY rag_chunks.id', id_sequence);
+  END IF;
+  DROP TABLE rag_chunks_unpartitioned;
+
+  -- Legacy ids are content-addressed and exact duplicates dropped first (see pg_bulk_writer)
+  UPDATE rag_chunks
+  SET document_id = regexp_replace(document_id, '^(.*)_chunk_.*$', '\\1') || '_chunk_'
+                    || left(encode(sha256(convert_to(chunk_text, 'UTF8')), 'hex'), 16)
+  WHERE document_id !~ '_chunk_[0-9a-f]{16}$';
+  DELETE FROM rag_chunks a USING rag_chunks b
+  WHERE a.user_id = b.user_id AND a.document_id = b.document_id
+    AND a.chunk_text = b.chunk_text AND a.id > b.id;
+
+  -- Indexes on the parent are created on every partition, present and future
+  CREATE UNIQUE INDEX rag_chunks_user_document_idx ON rag_chunks (user_id, document_id);
+  IF EXISTS (SELECT 1 FROM information_schema.columns
+             WHERE table_name = 'rag_chunks' AND column_name = 'embedding') THEN
+    CREATE INDEX rag_chunks_embedding_idx ON rag_chunks USING hnsw (embedding vector_cosine_ops);
+  END IF;
+  IF had_user_fk THEN
+    ALTER TABLE rag_chunks ADD CONSTRAINT rag_chunks_user_id_users_id_fk
+      FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE;
+  END IF;
+END $$;
+"""
+
+
+def has_vector_column(conn) -> bool:
+    return conn.execute(text("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'rag_chunks' AND column_name = 'embedding'
+    """)).fetchone() is not None
+
+
+def ensure_vector_column(conn, dimension: int = EMBEDDING_DIMENSION) -> bool:
+    """
+    Add the native ``embedding vector(N)`` column to rag_chunks.
+
+    Returns:
+        bool: False if the pgvector extension is not available
+    """
+    try:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        conn.execute(text(f"ALTER TABLE rag_chunks ADD COLUMN IF NOT EXISTS embedding vector({dimension})"))
+        conn.commit()
+        return True
+    except Exception as e:
+        conn.rollback()
+        print(f"pgvector unavailable, keeping JSON embeddings only: {e}")
+        return False
+
+
+def has_quantized_columns(conn) -> bool:
+    return conn.execute(text("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'rag_chunks' AND column_name = 'embedding_bits'
+    """)).fetchone() is not None
+
+
+def ensure_quantized_columns(conn, dimension: int = EMBEDDING_DIMENSION):
+    """Add the compact code columns to rag_chunks; they use core types only, no extension."""
+    conn.execute(text(f"""
+        ALTER TABLE rag_chunks
+            ADD COLUMN IF NOT EXISTS embedding_int8 BYTEA,
+            ADD COLUMN IF NOT EXISTS embedding_scale REAL,
+            ADD COLUMN IF NOT EXISTS embedding_bits BIT({dimension})
+    """))
+    conn.commit()
+
+
+def is_partitioned(conn) -> bool:
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('rag_chunks')"
+    )).fetchone() is not None
+
+
+def partition_rag_chunks(conn) -> bool:
+    """
+    Convert rag_chunks to one partition per user (see ``PARTITION_SQL``).
+
+    The rows are copied in one transaction, so on a large table run it from
+    this script during a quiet period rather than at indexer start-up.
+
+    Returns:
+        bool: False if the conversion failed and the table was left as it was
+    """
+    try:
+        conn.execute(text(PARTITION_SQL))
+        conn.commit()
+        return True
+    except Exception as e:
+        conn.rollback()
+        print(f"Could not partition rag_chunks by user, keeping a single table: {e}")
+        return False
+
+
+def user_partition_name(user_id: int) -> str:
+    return f"rag_chunks_u{int(user_id)}"
+
+
+def ensure_user_partition(conn, user_id: int) -> bool:
+    """
+    Give a user their own partition of rag_chunks.
+
+    Rows the user already has in the default partition (written before the
+    partition existed) are moved into it before it is attached. A user's
+    reindex, deletes and ``WHERE user_id = ...`` searches then only touch
+    that partition. Workers indexing the same user at once serialize on an
+    advisory lock keyed by the user, held until the commit.
+
+    Returns:
+        bool: False if rag_chunks is not partitioned
+    """
+    if not is_partitioned(conn):
+        return False
+    name = user_partition_name(user_id)
+    params = {'namespace': PARTITION_LOCK_NAMESPACE, 'user_id': int(user_id)}
+    conn.execute(text("SELECT pg_advisory_xact_lock(:namespace, :user_id)"), params)
+    if conn.execute(text("SELECT to_regclass(:name)"), {'name': name}).scalar() is None:
+        has_rows = conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE user_id = :user_id)"),
+                                params).scalar()
+        if has_rows:
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {name} (LIKE rag_chunks INCLUDING DEFAULTS)"))
+            conn.execute(text(f"""
+                WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE user_id = :user_id RETURNING *)
+                INSERT INTO {name} SELECT * FROM moved
+            """), params)
+            conn.execute(text(f"ALTER TABLE rag_chunks ATTACH PARTITION {name} FOR VALUES IN ({int(user_id)})"))
+        else:
+            conn.execute(text(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF rag_chunks "
+                              f"FOR VALUES IN ({int(user_id)})"))
+    conn.commit()
+    return True
+
+
+# Index definitions by access method, HNSW first
+VECTOR_INDEX_METHODS = {
+    'hnsw': "USING hnsw (embedding vector_cosine_ops)",
+    'ivfflat': "USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100)",
+}
+
+
+def _drop_invalid_index(conn, name: str):
+    # A CREATE INDEX CONCURRENTLY that failed leaves an invalid index that IF NOT EXISTS would keep
+    invalid = conn.execute(text("""
+        SELECT 1 FROM pg_index WHERE indexrelid = to_regclass(:name) AND NOT indisvalid
+    """), {'name': name}).fetchone()
+    if invalid:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+
+def _build_vector_index(conn, using: str):
+    if not is_partitioned(conn):
+        _drop_invalid_index(conn, VECTOR_INDEX_NAME)
+        conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {VECTOR_INDEX_NAME} ON rag_chunks {using}"))
+        return
+    # A partitioned table cannot be indexed concurrently: the parent index is
+    # created ON ONLY rag_chunks, then each partition's concurrently and attached
+    partitions = conn.execute(text("""
+        SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass('rag_chunks')
+    """)).scalars().all()
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS {VECTOR_INDEX_NAME} ON ONLY rag_chunks {using}"))
+    for partition in partitions:
+        name = f"{partition}_embedding_idx"
+        _drop_invalid_index(conn, name)
+        conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {partition} {using}"))
+        conn.execute(text(f"ALTER INDEX {VECTOR_INDEX_NAME} ATTACH PARTITION {name}"))
+
+
+def create_vector_index(conn):
+    """
+    Create the ANN index, preferring HNSW and falling back to IVFFlat on older pgvector.
+
+    Run it after ``backfill_embeddings``: building the index once over the
+    filled column is much faster than maintaining it row by row. It is
+    built with CREATE INDEX CONCURRENTLY on its own autocommit connection,
+    so searches and writes carry on meanwhile; ``conn``'s transaction is
+    committed first.
+    """
+    conn.commit()
+    with conn.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as auto:
+        for method, using in VECTOR_INDEX_METHODS.items():
+            try:
+                _build_vector_index(auto, using)
+                print(f"{method.upper()} index ready")
+                return
+            except Exception as e:
+                if method == 'ivfflat':
+                    raise
+                print(f"HNSW not supported ({e}), creating IVFFlat index")
+
+
+def _parse_embeddings(rows, dimension: int, skipped: List[int]) -> List:
+    """(id, values) of the rows whose JSON has ``dimension`` values; the other ids go to ``skipped``."""
+    parsed = []
+    for row_id, raw in rows:
+        try:
+            values = json.loads(raw)
+        except (TypeError, ValueError) as e:
+            print(f"Skipping row {row_id}: embedding_vector is not valid JSON ({e})")
+            skipped.append(row_id)
+            continue
+        if not isinstance(values, list) or len(values) != dimension:
+            skipped.append(row_id)
+            continue
+        parsed.append((row_id, values))
+    return parsed
+
+
+def backfill_embeddings(engine, batch_size: int = 1000, dimension: int = EMBEDDING_DIMENSION) -> int:
+    """
+    Copy legacy JSON embeddings into the vector column in batches.
+
+    Each batch is its own transaction so the table stays usable while the
+    migration runs. The JSON is parsed row by row: rows that are not valid
+    JSON are logged and skipped, and rows without ``dimension`` values are
+    left untouched, so one bad row cannot stall the batches after it.
+
+    Returns:
+        int: Number of rows converted
+    """
+    total = 0
+    skipped: List[int] = []
+    after = 0
+    started = time.perf_counter()
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text("""
+                SELECT id, embedding_vector FROM rag_chunks
+                WHERE embedding IS NULL AND id > :after
+                ORDER BY id
+                LIMIT :batch_size
+                FOR UPDATE SKIP LOCKED
+            """), {'after': after, 'batch_size': batch_size}).fetchall()
+            if not rows:
+                break
+            after = rows[-1][0]
+            parsed = _parse_embeddings(rows, dimension, skipped)
+            if parsed:
+                conn.execute(text("UPDATE rag_chunks SET embedding = CAST(:embedding AS vector) WHERE id = :id"),
+                             [{'id': row_id, 'embedding': json.dumps(values)} for row_id, values in parsed])
+        total += len(parsed)
+        elapsed = time.perf_counter() - started
+        print(f"Backfilled {total} rows ({total / elapsed:.0f} rows/s)")
+    if skipped:
+        print(f"{len(skipped)} rows were skipped (malformed JSON or not {dimension} values)")
+    return total
+
+
+def backfill_quantized_codes(engine, batch_size: int = 1000, dimension: int = EMBEDDING_DIMENSION) -> int:
+    """
+    Compute int8 and sign-bit codes for rows written before the code columns existed.
+
+    Rows whose JSON embedding is malformed are logged and skipped, as in ``backfill_embeddings``.
+
+    Returns:
+        int: Number of rows updated
+    """
+    from vector_quantization import postgres_code_columns
+
+    total = 0
+    skipped: List[int] = []
+    after = 0
+    started = time.perf_counter()
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text("""
+                SELECT id, embedding_vector FROM rag_chunks
+                WHERE embedding_bits IS NULL AND id > :after
+                ORDER BY id LIMIT :batch_size
+                FOR UPDATE SKIP LOCKED
+            """), {'after': after, 'batch_size': batch_size}).fetchall()
+            if not rows:
+                break
+            after = rows[-1][0]
+            parsed = _parse_embeddings(rows, dimension, skipped)
+            if parsed:
+                codes = postgres_code_columns([values for _, values in parsed])
+                conn.execute(text("""
+                    UPDATE rag_chunks
+                    SET embedding_int8 = decode(substr(:int8, 3), 'hex'), embedding_scale = :scale,
+                        embedding_bits = CAST(:bits AS bit varying)
+                    WHERE id = :id
+                """), [{'id': row_id, 'int8': int8, 'scale': scale, 'bits': bits}
+                       for (row_id, _), (int8, scale, bits) in zip(parsed, codes)])
+        total += len(parsed)
+        elapsed = time.perf_counter() - started
+        print(f"Quantized {total} rows ({total / elapsed:.0f} rows/s)")
+    if skipped:
+        print(f"{len(skipped)} rows were skipped (malformed JSON or not {dimension} values)")
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move rag_chunks embeddings from JSON text to pgvector")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--quantized', action='store_true',
+                        help="Only add and backfill the int8 / sign-bit code columns")
+    parser.add_argument('--partition', action='store_true',
+                        help="Only rebuild rag_chunks with one partition per user")
+    args = parser.parse_args()
+
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        print("DATABASE_URL is not set")
+        sys.exit(1)
+
+    engine = create_engine(database_url)
+    if args.partition:
+        with engine.connect() as conn:
+            if not partition_rag_chunks(conn):
+                sys.exit(1)
+        print("rag_chunks is partitioned by user")
+        sys.exit(0)
+
+    if args.quantized:
+        with engine.connect() as conn:
+            ensure_quantized_columns(conn)
+        print(f"Quantized {backfill_quantized_codes(engine, args.batch_size)} rows")
+        sys.exit(0)
+
+    with engine.connect() as conn:
+        if not ensure_vector_column(conn):
+            sys.exit(1)
+
+    converted = backfill_embeddings(engine, args.batch_size)
+    print(f"Converted {converted} rows")
+
+    # Building the index after the backfill is much faster than maintaining it row by row,
+    # and CONCURRENTLY keeps the table writable while it builds
+    with engine.connect() as conn:
+        create_vector_index(conn)
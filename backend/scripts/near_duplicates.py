@@ -0,0 +1,116 @@
+import os
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from embedding_cache import normalize_text
+
+# Mersenne prime used by the universal hash family
+_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+
+
+def shingles(text: str, size: int = 5) -> np.ndarray:
+    """32-bit hashes of the text's overlapping word n-grams."""
+    words = normalize_text(text).lower().split()
+    if len(words) <= size:
+        grams = [' '.join(words)]
+    else:
+        grams = [' '.join(words[i:i + size]) for i in range(len(words) - size + 1)]
+    return np.fromiter((zlib.crc32(gram.encode('utf-8')) for gram in set(grams)), dtype=np.uint64)
+
+
+def lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    Pick (bands, rows) so that band collisions start around ``threshold``.
+
+    A pair with Jaccard similarity s becomes a candidate with probability
+    1 - (1 - s^rows)^bands, whose steepest point is near (1/bands)^(1/rows).
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class NearDuplicateFilter:
+    """
+    Detects chunks that are near-copies of a chunk already seen in this run.
+
+    Each chunk is reduced to a MinHash signature over its word 5-grams and
+    indexed with banded LSH, so a lookup only compares against the few
+    chunks sharing a band instead of the whole corpus. Candidates are
+    confirmed when the estimated Jaccard similarity reaches ``threshold``.
+    """
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError(f"Jaccard threshold must be in (0, 1], got {threshold}")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        self._signatures: List[np.ndarray] = []
+        self.checked = 0
+        self.removed = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["NearDuplicateFilter"]:
+        """Build a filter from NEAR_DUPLICATE_THRESHOLD; 0 disables near-duplicate removal."""
+        threshold = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', 0.85))
+        return cls(threshold) if threshold > 0 else None
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = shingles(text, self.shingle_size)
+        # (a * x + b) mod p for every (shingle, permutation) pair, minimised per permutation
+        permuted = ((hashes[:, None] * self._a + self._b) % _PRIME) & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def add(self, text: str):
+        """Index a chunk without checking it, e.g. one that is already in the store."""
+        self._insert(self.signature(text))
+
+    def _insert(self, signature: np.ndarray):
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            bucket.setdefault(key, []).append(index)
+
+    def is_duplicate(self, text: str) -> bool:
+        """
+        Check a chunk against everything seen so far and index it if it is new.
+
+        Args:
+            text (str): Chunk text
+
+        Returns:
+            bool: True if a previously seen chunk has estimated Jaccard similarity >= threshold
+        """
+        self.checked += 1
+        signature = self.signature(text)
+        candidates = set()
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(key, ()))
+        for index in candidates:
+            if np.mean(self._signatures[index] == signature) >= self.threshold:
+                self.removed += 1
+                return True
+        self._insert(signature)
+        return False
+
+    def stats(self) -> str:
+        return (f"{self.removed} of {self.checked} chunks dropped as near-duplicates "
+                f"(Jaccard >= {self.threshold}, {self.bands}x{self.rows} LSH bands)")
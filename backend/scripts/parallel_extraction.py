@@ -0,0 +1,196 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Optional, Tuple
+
+PARALLEL_EXTENSIONS = ('.pdf', '.docx')
+
+# PDFs are split into tasks of this many pages
+PDF_PAGES_PER_TASK = 25
+
+
+def _extract_pdf_range(file_path: str, start: int, end: int) -> List[str]:
+    import PyPDF2
+
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [(pdf_reader.pages[i].extract_text() or "") + "\n" for i in range(start, end)]
+
+
+def _extract_docx(file_path: str) -> List[str]:
+    from document_loaders import iter_document_pages
+
+    return list(iter_document_pages(file_path))
+
+
+def _count_pdf_pages(file_path: str) -> int:
+    import PyPDF2
+
+    with open(file_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+class Extraction:
+    """
+    Pages of one file, extracted by the pool and yielded in document order.
+
+    The first tasks are submitted as soon as the object is created, so
+    several files can be extracting while an earlier one is still being
+    consumed. At most ``window`` tasks of the file are in flight at a time,
+    which bounds the memory held by finished-but-unread pages. A file that
+    exceeds its timeout has the pool restarted, so its hung task does not
+    keep a worker; tasks of other files lost in the restart are resubmitted.
+    """
+
+    def __init__(self, pool: "ExtractionPool", file_path: str):
+        self.pool = pool
+        self.file_path = file_path
+        self.deadline = time.monotonic() + pool.file_timeout
+        # (future, task, pool generation it was submitted to)
+        self.futures = deque()
+        self.tasks = deque(self._plan_tasks())
+        self._fill()
+
+    def _plan_tasks(self) -> List[Tuple]:
+        extension = os.path.splitext(self.file_path)[1].lower()
+        if extension == '.pdf':
+            future, generation = self.pool.submit(_count_pdf_pages, self.file_path)
+            try:
+                page_count = future.result(timeout=self.pool.file_timeout)
+            except TimeoutError:
+                self.pool.restart(generation)
+                raise TimeoutError(f"Extraction of {self.file_path} exceeded {self.pool.file_timeout}s")
+            return [
+                (_extract_pdf_range, self.file_path, start, min(start + PDF_PAGES_PER_TASK, page_count))
+                for start in range(0, page_count, PDF_PAGES_PER_TASK)
+            ]
+        if extension == '.docx':
+            return [(_extract_docx, self.file_path)]
+        raise ValueError(f"Unsupported file format for parallel extraction: {extension}")
+
+    def _fill(self):
+        while self.tasks and len(self.futures) < self.pool.window:
+            task = self.tasks.popleft()
+            self.futures.append((*self.pool.submit(*task), task))
+
+    def _timed_out(self, generation: int) -> TimeoutError:
+        self.cancel()
+        self.pool.restart(generation)
+        return TimeoutError(f"Extraction of {self.file_path} exceeded {self.pool.file_timeout}s")
+
+    def __iter__(self) -> Iterator[str]:
+        while self.futures:
+            future, generation, task = self.futures.popleft()
+            try:
+                # A task that already finished is taken even past the deadline
+                pages = future.result(timeout=max(0.0, self.deadline - time.monotonic()))
+            except TimeoutError:
+                raise self._timed_out(generation)
+            except BrokenProcessPool:
+                if generation == self.pool.generation:
+                    raise
+                # Lost when the pool was restarted for another file's timeout; the
+                # file gets a fresh time budget, as its work starts over
+                self.deadline = max(self.deadline, time.monotonic() + self.pool.file_timeout)
+                self.futures.appendleft((*self.pool.submit(*task), task))
+                continue
+            self._fill()
+            self.pool.record(len(pages))
+            yield from pages
+
+    def cancel(self):
+        self.tasks.clear()
+        for future, _, _ in self.futures:
+            future.cancel()
+        self.futures.clear()
+
+
+class ExtractionPool:
+    """
+    Process pool for PDF and DOCX text extraction.
+
+    Work is split across files and, for PDFs, across page ranges, so large
+    scanned volumes use every core. Each file has a timeout, after which
+    the worker processes are killed and replaced, and the pool counts
+    extracted pages to report pages/s from its first submitted task.
+    """
+
+    def __init__(self, workers: Optional[int] = None, file_timeout: float = 600.0):
+        self.workers = workers or os.cpu_count() or 1
+        self.file_timeout = file_timeout
+        self.window = self.workers
+        self.executor = self._new_executor()
+        # Bumped by each restart, so futures of the killed executor can be told apart
+        self.generation = 0
+        self.pages = 0
+        self.started_at = None
+        self.lock = threading.Lock()
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # forkserver: the indexer is multi-threaded by the time extraction starts
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('forkserver'))
+
+    @classmethod
+    def from_env(cls) -> "ExtractionPool":
+        """Build a pool using EXTRACTION_WORKERS / EXTRACTION_TIMEOUT overrides."""
+        workers = os.getenv('EXTRACTION_WORKERS')
+        return cls(int(workers) if workers else None, float(os.getenv('EXTRACTION_TIMEOUT', 600)))
+
+    def extract(self, file_path: str) -> Extraction:
+        """
+        Start extracting a file.
+
+        Args:
+            file_path (str): PDF or DOCX file
+
+        Returns:
+            Extraction: Iterable over the file's pages, in order
+        """
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"File not found: {file_path}")
+        return Extraction(self, file_path)
+
+    def submit(self, function, *args) -> Tuple[Future, int]:
+        """Submit a task; returns its future and the pool generation it runs in."""
+        with self.lock:
+            if self.started_at is None:
+                self.started_at = time.monotonic()
+            return self.executor.submit(function, *args), self.generation
+
+    def restart(self, generation: int):
+        """
+        Kill the worker processes and start a fresh executor.
+
+        A timed-out task cannot be cancelled once it runs, and would keep
+        its worker busy for good. Several files timing out together restart
+        the pool once: callers pass the generation their task was submitted
+        to, and an older one is ignored.
+        """
+        with self.lock:
+            if generation != self.generation:
+                return
+            executor = self.executor
+            processes = list((executor._processes or {}).values())
+            self.executor = self._new_executor()
+            self.generation += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.kill()
+
+    def record(self, pages: int):
+        with self.lock:
+            self.pages += pages
+
+    def stats(self) -> str:
+        elapsed = time.monotonic() - self.started_at if self.started_at is not None else 0.0
+        rate = self.pages / elapsed if elapsed else 0.0
+        return f"{self.pages} pages extracted with {self.workers} workers ({rate:.1f} pages/s)"
+
+    def shutdown(self):
+        with self.lock:
+            executor = self.executor
+        executor.shutdown(wait=False, cancel_futures=True)
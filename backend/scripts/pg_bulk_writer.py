@@ -0,0 +1,185 @@
+import csv
+import io
+import json
+import time
+from typing import List
+
+from ingest_pipeline import ChunkRecord, ChunkWriter
+from migrate_pgvector import QUANTIZED_COLUMNS, has_quantized_columns, has_vector_column
+from sqlalchemy import text
+from vector_quantization import postgres_code_columns
+
+COPY_COLUMNS = ('document_id', 'chunk_text', 'embedding_vector', 'source_url', 'page_number', 'user_id')
+
+CHUNK_ID_INDEX_NAME = "rag_chunks_user_document_idx"
+
+
+def has_chunk_id_index(conn) -> bool:
+    return conn.execute(text("SELECT 1 FROM pg_indexes WHERE tablename = 'rag_chunks' AND indexname = :name"),
+                        {'name': CHUNK_ID_INDEX_NAME}).fetchone() is not None
+
+
+# Rewrites ids written before they were content-addressed (a bare document id
+# shared by all of a source's chunks, or <document>_chunk_<position>) to
+# <document>_chunk_<sha256(chunk_text)[:16]>, the id source_manifest.chunk_row_id
+# gives the same chunk (see also sink_fanout.row_to_record)
+CONTENT_ADDRESS_IDS_SQL = r"""
+    UPDATE rag_chunks
+    SET document_id = regexp_replace(document_id, '^(.*)_chunk_.*$', '\1') || '_chunk_'
+                      || left(encode(sha256(convert_to(chunk_text, 'UTF8')), 'hex'), 16)
+    WHERE document_id !~ '_chunk_[0-9a-f]{16}$'
+"""
+
+# Identical chunks of a source now share an id; the oldest row is kept
+DELETE_DUPLICATE_CHUNKS_SQL = """
+    DELETE FROM rag_chunks a USING rag_chunks b
+    WHERE a.user_id = b.user_id AND a.document_id = b.document_id
+      AND a.chunk_text = b.chunk_text AND a.id > b.id
+"""
+
+
+def ensure_chunk_id_index(conn) -> bool:
+    """
+    Make (user_id, document_id) unique so chunk writes can upsert.
+
+    Rows written before chunk ids were content-addressed are given their
+    content-addressed id first, and the exact duplicate rows this reveals
+    (left by earlier non-idempotent runs) are removed. If conflicting rows
+    remain, the index is not created and writes fall back to plain inserts.
+
+    Returns:
+        bool: True if the unique index exists
+    """
+    if has_chunk_id_index(conn):
+        return True
+    try:
+        rewritten = conn.execute(text(CONTENT_ADDRESS_IDS_SQL)).rowcount
+        removed = conn.execute(text(DELETE_DUPLICATE_CHUNKS_SQL)).rowcount
+        conn.execute(text(f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS {CHUNK_ID_INDEX_NAME}
+            ON rag_chunks (user_id, document_id)
+        """))
+        conn.commit()
+        if rewritten or removed:
+            print(f"Content-addressed {rewritten} legacy chunk ids, removed {removed} duplicate rows")
+        return True
+    except Exception as e:
+        conn.rollback()
+        print(f"Could not create unique chunk id index, writes will not upsert: {e}")
+        return False
+
+
+class BulkChunkWriter(ChunkWriter):
+    """
+    Writes pipeline batches into ``rag_chunks`` with ``COPY ... FROM STDIN``.
+
+    Each batch is serialized to CSV in memory and streamed in a single COPY on
+    a connection borrowed from the SQLAlchemy engine's pool, then committed
+    once. Throughput is tracked so callers can report rows/s.
+
+    When the table has the pgvector ``embedding`` column, it is filled in the
+    same COPY; the compact JSON array is also valid pgvector input. The
+    int8 codes, their scale and the sign bits (``vector_quantization``) go in
+    the same COPY when the code columns exist.
+
+    Chunk ids are content-addressed, so with the unique (user_id, document_id)
+    index in place the batch is copied into a temporary staging table and
+    merged with ``INSERT ... ON CONFLICT``: re-indexing a chunk refreshes its
+    embedding and metadata instead of adding a duplicate row.
+    """
+
+    def __init__(self, engine, user_id: int):
+        self.engine = engine
+        self.user_id = user_id
+        self.rows_written = 0
+        self.write_seconds = 0.0
+        with engine.connect() as conn:
+            self.use_pgvector = has_vector_column(conn)
+            self.use_codes = has_quantized_columns(conn)
+            self.upsert = has_chunk_id_index(conn)
+        self.columns = (COPY_COLUMNS + (('embedding',) if self.use_pgvector else ())
+                        + (QUANTIZED_COLUMNS if self.use_codes else ()))
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows_written / self.write_seconds if self.write_seconds else 0.0
+
+    def _serialize(self, records: List[ChunkRecord], embeddings: List[List[float]]) -> io.StringIO:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        codes = postgres_code_columns(embeddings) if self.use_codes and embeddings else None
+        for i, (record, embedding) in enumerate(zip(records, embeddings)):
+            vector = json.dumps(embedding, separators=(',', ':'))
+            row = [
+                record.row_id,
+                # Postgres text columns cannot hold NUL characters
+                record.text.replace('\x00', ''),
+                vector,
+                record.source_path,
+                record.position + 1,
+                self.user_id,
+            ]
+            if self.use_pgvector:
+                row.append(vector)
+            if codes is not None:
+                row.extend(codes[i])
+            writer.writerow(row)
+        buffer.seek(0)
+        return buffer
+
+    def _merge_statement(self) -> str:
+        columns = ', '.join(self.columns)
+        updates = ', '.join(
+            f"{column} = EXCLUDED.{column}"
+            for column in self.columns if column not in ('document_id', 'user_id', 'chunk_text')
+        )
+        return (f"INSERT INTO rag_chunks ({columns}) SELECT {columns} FROM rag_chunks_staging "
+                f"ON CONFLICT (user_id, document_id) DO UPDATE SET {updates}")
+
+    def write_chunks(self, records: List[ChunkRecord], embeddings: List[List[float]]) -> int:
+        started = time.perf_counter()
+        # A row may only be affected once per INSERT ... ON CONFLICT
+        unique = {}
+        for record, embedding in zip(records, embeddings):
+            unique.setdefault(record.row_id, (record, embedding))
+        records = [record for record, _ in unique.values()]
+        embeddings = [embedding for _, embedding in unique.values()]
+        buffer = self._serialize(records, embeddings)
+        columns = ', '.join(self.columns)
+
+        conn = self.engine.raw_connection()
+        try:
+            with conn.cursor() as cursor:
+                if self.upsert:
+                    cursor.execute(f"CREATE TEMP TABLE rag_chunks_staging ON COMMIT DROP AS "
+                                   f"SELECT {columns} FROM rag_chunks WITH NO DATA")
+                    cursor.copy_expert(f"COPY rag_chunks_staging ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+                    cursor.execute(self._merge_statement())
+                else:
+                    cursor.copy_expert(f"COPY rag_chunks ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            # Returns the connection to the pool
+            conn.close()
+
+        self.rows_written += len(records)
+        self.write_seconds += time.perf_counter() - started
+        return len(records)
+
+    def delete_chunks(self, row_ids: List[str]):
+        conn = self.engine.raw_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "DELETE FROM rag_chunks WHERE user_id = %s AND document_id = ANY(%s)",
+                    (self.user_id, row_ids)
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
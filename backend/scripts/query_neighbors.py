@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import re
+import sys
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from embedding_backends import BACKENDS, api_key_from_env, needs_api_key
+from indexing_metrics import RunMetrics
+from lexical_index import fold_accents
+from vector_quantization import top_k
+from vector_snapshot import open_snapshot, snapshot_root
+
+DEFAULT_CATALOG = "backend/data/sermon_query_catalog.json"
+
+# Neighbours kept per query; the server uses the first ones above its similarity floor
+DEFAULT_TOP_K = 16
+
+# Snapshot rows scored per matrix product, to bound the (queries x rows) score block
+SCAN_ROWS = 65536
+
+# Longest stored key; longer queries are truncated before lookup on both sides
+MAX_KEY_LENGTH = 500
+
+NEIGHBOR_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS rag_query_neighbors (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    query_key VARCHAR(500) NOT NULL,
+    query_text TEXT NOT NULL,
+    kind VARCHAR(20) NOT NULL,
+    model VARCHAR(255) NOT NULL,
+    query_embedding TEXT NOT NULL,
+    neighbors JSONB NOT NULL,
+    snapshot_version VARCHAR(64) NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, query_key)
+)
+"""
+
+
+def normalize_query_key(query: str) -> str:
+    """
+    Lookup key of a query: accent-folded, lower-case, punctuation collapsed to single spaces.
+
+    ``normalizeQueryKey`` in server/ragService.ts must produce the same key.
+    """
+    return re.sub(r"[^a-z0-9]+", ' ', fold_accents(query)).strip()[:MAX_KEY_LENGTH]
+
+
+def load_catalog(path: str = DEFAULT_CATALOG) -> List[Tuple[str, str]]:
+    """
+    Read the curated catalog: ``{"themes": [...], "passages": [...]}``.
+
+    Returns:
+        List[Tuple[str, str]]: (kind, query) pairs, the first of each key kept
+    """
+    with open(path, encoding='utf-8') as f:
+        catalog = json.load(f)
+    entries, seen = [], set()
+    for kind, queries in (('theme', catalog.get('themes', [])), ('passage', catalog.get('passages', []))):
+        for query in queries:
+            key = normalize_query_key(query)
+            if key and key not in seen:
+                seen.add(key)
+                entries.append((kind, query))
+    return entries
+
+
+def scan_top_k(queries: np.ndarray, matrix: np.ndarray, k: int,
+               rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact top-k rows of ``matrix`` for every query, one matrix product per block of rows.
+
+    Args:
+        queries (np.ndarray): (q, d) normalized queries
+        matrix (np.ndarray): (n, d) normalized rows, e.g. a mapped snapshot
+        k (int): Neighbours per query
+        rows (Optional[np.ndarray]): Restrict the scan to these row numbers
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (q, k') row numbers and scores, best first, k' <= k
+    """
+    rows = np.arange(matrix.shape[0]) if rows is None else np.sort(np.asarray(rows, dtype=np.int64))
+    best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+    best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+    for start in range(0, len(rows), SCAN_ROWS):
+        block = rows[start:start + SCAN_ROWS]
+        scores = queries @ matrix[block].T
+        keep = min(k, scores.shape[1])
+        part = np.argpartition(-scores, keep - 1, axis=1)[:, :keep]
+        best_rows = np.concatenate([best_rows, block[part]], axis=1)
+        best_scores = np.concatenate([best_scores, np.take_along_axis(scores, part, axis=1)], axis=1)
+        if best_rows.shape[1] > k:
+            part = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+            best_rows = np.take_along_axis(best_rows, part, axis=1)
+            best_scores = np.take_along_axis(best_scores, part, axis=1)
+    order = np.argsort(-best_scores, axis=1, kind='stable')
+    return np.take_along_axis(best_rows, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+class NeighborTable:
+    """
+    Precomputed neighbours of catalog queries in ``rag_query_neighbors``.
+
+    One row per user and normalized query, with the query's embedding (so
+    refreshes never embed it again), the user's top-k chunks (id, text,
+    source, score) as JSON and the snapshot version they were computed
+    against. The server answers a catalog query with a single primary-key
+    lookup on (user, query), so a user only ever gets their own chunks.
+    """
+
+    def __init__(self, engine):
+        from sqlalchemy import inspect, text
+
+        self.engine = engine
+        with engine.begin() as conn:
+            columns = {column['name'] for column in inspect(conn).get_columns('rag_query_neighbors')} \
+                if inspect(conn).has_table('rag_query_neighbors') else set()
+            if columns and 'user_id' not in columns:
+                # Shared across users before drizzle/0009; the rows are derived, so rebuild
+                conn.execute(text("DROP TABLE rag_query_neighbors"))
+            conn.execute(text(NEIGHBOR_TABLE_SQL))
+
+    def entries(self) -> Dict[Tuple[int, str], Dict]:
+        from sqlalchemy import text
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(text("SELECT user_id, query_key, query_text, kind, model, query_embedding, "
+                                     "neighbors, snapshot_version FROM rag_query_neighbors")).fetchall()
+        return {
+            (row[0], row[1]): {'query_text': row[2], 'kind': row[3], 'model': row[4],
+                               'embedding': json.loads(row[5]),
+                               'neighbors': json.loads(row[6]) if isinstance(row[6], str) else row[6],
+                               'snapshot_version': row[7]}
+            for row in rows
+        }
+
+    def upsert(self, entries: Dict[Tuple[int, str], Dict]):
+        from sqlalchemy import JSON, bindparam, text
+
+        if not entries:
+            return
+        params = [{'user_id': user_id, 'query_key': key, 'query_text': entry['query_text'], 'kind': entry['kind'],
+                   'model': entry['model'], 'query_embedding': json.dumps(entry['embedding']),
+                   'neighbors': entry['neighbors'], 'snapshot_version': entry['snapshot_version']}
+                  for (user_id, key), entry in entries.items()]
+        with self.engine.begin() as conn:
+            self._delete(conn, list(entries))
+            conn.execute(text("""
+                INSERT INTO rag_query_neighbors
+                    (user_id, query_key, query_text, kind, model, query_embedding, neighbors, snapshot_version,
+                     updated_at)
+                VALUES (:user_id, :query_key, :query_text, :kind, :model, :query_embedding, :neighbors,
+                        :snapshot_version, CURRENT_TIMESTAMP)
+            """).bindparams(bindparam('neighbors', type_=JSON)), params)
+
+    def delete(self, keys: Sequence[Tuple[int, str]]):
+        if keys:
+            with self.engine.begin() as conn:
+                self._delete(conn, list(keys))
+
+    def _delete(self, conn, keys: List[Tuple[int, str]]):
+        from sqlalchemy import bindparam, text
+
+        by_user = {}
+        for user_id, key in keys:
+            by_user.setdefault(user_id, []).append(key)
+        for user_id, user_keys in by_user.items():
+            for start in range(0, len(user_keys), 500):
+                conn.execute(text("DELETE FROM rag_query_neighbors WHERE user_id = :user_id AND query_key IN :keys")
+                             .bindparams(bindparam('keys', expanding=True)),
+                             {'user_id': user_id, 'keys': user_keys[start:start + 500]})
+
+
+def refresh_neighbors(table: NeighborTable, catalog: List[Tuple[str, str]],
+                      embed: Callable[[List[str]], List[Optional[List[float]]]], model: str,
+                      root: Optional[str] = None, k: int = DEFAULT_TOP_K,
+                      log: Callable[[str], None] = print) -> Dict[str, int]:
+    """
+    Bring the neighbour table in line with the catalog and the current snapshot.
+
+    Neighbours are computed per user over that user's rows only, for every
+    user with chunks in the snapshot (which must carry ``user_id``, i.e.
+    be published from Postgres). Each catalog query is embedded once,
+    when no user has its embedding stored for this model yet. An entry
+    computed against an older snapshot is refreshed from the difference
+    between the two versions: when none of its neighbours was removed,
+    only the user's added chunks are scored and merged into its list;
+    otherwise, or when the old version has been pruned, it is recomputed
+    over the user's rows. Entries already on the current version are left
+    alone, and entries of queries dropped from the catalog or of users
+    without chunks are deleted.
+
+    Args:
+        table (NeighborTable): Table to refresh
+        catalog (List[Tuple[str, str]]): (kind, query) pairs, see ``load_catalog``
+        embed: Embeds query texts (a retrieval_query embedder)
+        model (str): Model of ``embed``; must be the snapshot's
+        root (Optional[str]): Snapshot root, default ``snapshot_root()``
+        k (int): Neighbours kept per query
+
+    Returns:
+        Dict[str, int]: Counts of users, and of embedded queries and recomputed, merged, unchanged and deleted entries
+    """
+    root = root or snapshot_root()
+    manifest, matrix, chunks = open_snapshot(root)
+    version = manifest['version']
+    if manifest['count'] and manifest['model'] != model:
+        raise ValueError(f"Snapshot {version} holds {manifest['model']} vectors, queries would use {model}")
+    if chunks and 'user_id' not in chunks[0]:
+        raise ValueError(f"Snapshot {version} does not record which user owns each chunk; "
+                         f"neighbours are per user, publish it from Postgres")
+
+    user_rows = {}
+    for i, chunk in enumerate(chunks):
+        user_rows.setdefault(chunk['user_id'], []).append(i)
+    user_rows = {user_id: np.asarray(rows, dtype=np.int64) for user_id, rows in user_rows.items()}
+
+    existing = table.entries()
+    wanted = {normalize_query_key(query): (kind, query) for kind, query in catalog}
+    stale = sorted(pair for pair in existing if pair[1] not in wanted or pair[0] not in user_rows)
+    stats = {'users': len(user_rows), 'entries': len(wanted) * len(user_rows), 'embedded': 0, 'recomputed': 0,
+             'merged': 0, 'unchanged': 0, 'deleted': len(stale)}
+    table.delete(stale)
+
+    # A query's embedding does not depend on the user, so any user's stored copy will do
+    embeddings = {}
+    for (_, key), entry in existing.items():
+        if key in wanted and entry['model'] == model and len(entry['embedding']) == manifest['dimension']:
+            embeddings[key] = entry['embedding']
+    to_embed = [key for key in wanted if key not in embeddings]
+    if to_embed and user_rows:
+        for key, embedding in zip(to_embed, embed([wanted[key][1] for key in to_embed])):
+            if embedding is None:
+                log(f"Could not embed {wanted[key][1]!r}, skipping it")
+                continue
+            embeddings[key] = embedding
+        stats['embedded'] = len(to_embed)
+
+    entries = {}
+    for user_id in user_rows:
+        for key, (kind, query) in wanted.items():
+            if key not in embeddings:
+                continue
+            entry = existing.get((user_id, key))
+            if entry and entry['model'] == model and entry['embedding'] == embeddings[key]:
+                entries[(user_id, key)] = dict(entry, kind=kind, query_text=query)
+            else:
+                entries[(user_id, key)] = {'query_text': query, 'kind': kind, 'model': model,
+                                           'embedding': embeddings[key], 'neighbors': [], 'snapshot_version': None}
+
+    current_rows = {chunk['id']: i for i, chunk in enumerate(chunks)}
+    versions = {entry['snapshot_version'] for entry in entries.values()} - {version, None}
+    diffs = {}
+    for old_version in versions:
+        try:
+            _, _, old_chunks = open_snapshot(root, old_version)
+        except FileNotFoundError:
+            log(f"Snapshot {old_version} is gone, recomputing its entries in full")
+            continue
+        old_ids = {chunk['id'] for chunk in old_chunks}
+        diffs[old_version] = (np.array([i for chunk_id, i in current_rows.items() if chunk_id not in old_ids],
+                                       dtype=np.int64),
+                              old_ids - current_rows.keys())
+    full, merge = {}, {}
+    for (user_id, key), entry in entries.items():
+        if entry['snapshot_version'] == version:
+            stats['unchanged'] += 1
+        elif entry['snapshot_version'] in diffs and not any(
+                neighbor['id'] in diffs[entry['snapshot_version']][1] for neighbor in entry['neighbors']):
+            merge.setdefault((user_id, entry['snapshot_version']), []).append(key)
+        else:
+            full.setdefault(user_id, []).append(key)
+
+    def queries(keys: List[str]) -> np.ndarray:
+        vectors = np.asarray([embeddings[key] for key in keys], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    changed = {}
+    for user_id, keys in full.items():
+        rows, scores = scan_top_k(queries(keys), matrix, k, user_rows[user_id])
+        for key, key_rows, key_scores in zip(keys, rows, scores):
+            neighbors = [dict(chunks[i], score=round(float(score), 6)) for i, score in zip(key_rows, key_scores)]
+            changed[(user_id, key)] = dict(entries[(user_id, key)], snapshot_version=version, neighbors=neighbors)
+        stats['recomputed'] += len(keys)
+
+    for (user_id, old_version), keys in merge.items():
+        added = np.intersect1d(diffs[old_version][0], user_rows[user_id])
+        rows, scores = scan_top_k(queries(keys), matrix, k, added) if len(added) else (None, None)
+        for i, key in enumerate(keys):
+            neighbors = list(entries[(user_id, key)]['neighbors'])
+            if rows is not None:
+                neighbors += [dict(chunks[row], score=round(float(score), 6))
+                              for row, score in zip(rows[i], scores[i])]
+            neighbors = [neighbors[j] for j in top_k(np.array([n['score'] for n in neighbors]), k)]
+            changed[(user_id, key)] = dict(entries[(user_id, key)], snapshot_version=version, neighbors=neighbors)
+        stats['merged'] += len(keys)
+
+    table.upsert(changed)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Precompute each user's top-k chunks for the canonical sermon themes and passages "
+                    "(rag_query_neighbors)")
+    parser.add_argument('--catalog', default=DEFAULT_CATALOG, help="JSON catalog with 'themes' and 'passages'")
+    parser.add_argument('--k', type=int, default=DEFAULT_TOP_K, help="Neighbours kept per query")
+    parser.add_argument('--snapshot-dir', default=None, help="Snapshot root (RAG_SNAPSHOT_DIR)")
+    parser.add_argument('--embedding-backend', choices=BACKENDS,
+                        help="Query embedder: gemini (default), local hashed n-grams, or record/replay "
+                             "(EMBEDDING_BACKEND)")
+    parser.add_argument('--recording-path', help="Recording file for --embedding-backend record/replay")
+    args = parser.parse_args()
+    if args.embedding_backend:
+        os.environ['EMBEDDING_BACKEND'] = args.embedding_backend
+    if args.recording_path:
+        os.environ['EMBEDDING_RECORDING_PATH'] = args.recording_path
+
+    api_key = api_key_from_env()
+    if needs_api_key() and not api_key:
+        print("Error: GEMINI_API_KEY environment variable not set")
+        sys.exit(1)
+
+    from embedding_backends import embedder_from_env
+    from rag_indexer_postgres import get_engine
+
+    metrics = RunMetrics.from_env('query-neighbors')
+    try:
+        embedder = embedder_from_env(api_key, task_type="retrieval_query")
+        embedder.metrics = metrics
+        with metrics.stage('refresh'):
+            result = refresh_neighbors(NeighborTable(get_engine()), load_catalog(args.catalog), embedder.embed,
+                                       embedder.model, args.snapshot_dir, args.k)
+        for name, value in result.items():
+            metrics.set_gauge(f"query_neighbors_{name}", value)
+        metrics.finish()
+        print(f"Query neighbours refreshed: {result}")
+    except Exception as e:
+        print(f"Error refreshing query neighbours: {e}")
+        metrics.finish(status='error')
+        sys.exit(1)
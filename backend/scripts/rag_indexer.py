@@ -1,311 +1,246 @@
 
+import argparse
 import os
 import sys
-import requests
-import google.generativeai as genai
-import chromadb
-from chromadb.config import Settings
-from typing import List, Dict, Any
-import PyPDF2
-from docx import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-import time
-from urllib.parse import urlparse
+from typing import TYPE_CHECKING, List, Dict, Any
 
-# Configure Google Generative AI
-# Make sure to set your GOOGLE_API_KEY environment variable
-genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
+from embedding_backends import BACKENDS, api_key_from_env, needs_api_key
+from ingest_pipeline import ChunkRecord, ChunkWriter
+from ingest_runtime import API_KEY_ENV, crawl_sources, get_embedding_engine, sources_from_args
+from source_manifest import SourceManifest
 
-def load_document(file_path: str) -> str:
-    """
-    Load text content from a file (TXT, PDF, DOCX).
-    
-    Args:
-        file_path (str): Path to the file
-        
-    Returns:
-        str: Extracted text content
-    """
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"File not found: {file_path}")
-    
-    file_extension = os.path.splitext(file_path)[1].lower()
-    
-    try:
-        if file_extension == '.txt':
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read()
-                
-        elif file_extension == '.pdf':
-            text = ""
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-            return text
-            
-        elif file_extension == '.docx':
-            doc = Document(file_path)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text
-            
-        else:
-            raise ValueError(f"Unsupported file format: {file_extension}")
-            
-    except Exception as e:
-        print(f"Error loading document {file_path}: {str(e)}")
-        return ""
+# chromadb and sqlalchemy are imported where they are used, so --help and
+# small runs do not pay for them at startup
+if TYPE_CHECKING:
+    from embedding_backends import EmbeddingBackend
 
-def load_web_page(url: str) -> str:
+CHROMA_PERSIST_DIRECTORY = "backend/data/chromadb"
+
+def create_chroma_collection(collection_name: str = "bible_comments_rag"):
     """
-    Load text content from a web page.
-    This is a simplified implementation for MVP.
+    Initialize a ChromaDB collection and return it.
     
     Args:
-        url (str): URL of the web page
+        collection_name (str): Name of the collection
         
     Returns:
-        str: Extracted text content
+        chromadb.Collection: ChromaDB collection object
     """
+    import chromadb
+    
     try:
-        # For MVP, we'll do a simple text extraction
-        # In production, you'd want to use BeautifulSoup for better HTML parsing
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
+        # Create ChromaDB client with persistent storage
+        persist_directory = CHROMA_PERSIST_DIRECTORY
+        os.makedirs(persist_directory, exist_ok=True)
         
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
+        client = chromadb.PersistentClient(path=persist_directory)
         
-        # Simple text extraction (remove HTML tags in a basic way)
-        text = response.text
-        # This is a very basic HTML tag removal - in production use BeautifulSoup
-        import re
-        text = re.sub(r'<[^>]+>', ' ', text)
-        text = re.sub(r'\s+', ' ', text)
+        # Try to get existing collection or create new one
+        try:
+            collection = client.get_collection(name=collection_name)
+            print(f"Using existing collection: {collection_name}")
+        except:
+            collection = client.create_collection(
+                name=collection_name,
+                metadata={"description": "RAG collection for biblical commentaries"}
+            )
+            print(f"Created new collection: {collection_name}")
         
-        return text.strip()
+        return collection
         
     except Exception as e:
-        print(f"Error loading web page {url}: {str(e)}")
-        return ""
+        print(f"Error creating ChromaDB collection: {str(e)}")
+        raise
 
-def split_text_into_chunks(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
+def ensure_collection_space(collection, embedder: "EmbeddingBackend") -> Dict[str, Any]:
     """
-    Split text into chunks using RecursiveCharacterTextSplitter.
+    Record the embedding model and dimension in the collection metadata, or check them.
+    
+    Collections created before the model was recorded hold Gemini
+    text-embedding-004 vectors.
     
     Args:
-        text (str): Text to split
-        chunk_size (int): Maximum size of each chunk
-        chunk_overlap (int): Overlap between chunks
+        collection: ChromaDB collection about to receive vectors
+        embedder (EmbeddingBackend): Backend producing them
         
     Returns:
-        List[str]: List of text chunks
+        Dict: The collection's embedding space ('model', 'dimension')
+        
+    Raises:
+        ValueError: If the collection holds vectors from another model or dimension
     """
-    if not text.strip():
-        return []
-    
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        length_function=len,
-        separators=["\n\n", "\n", ". ", " ", ""]
-    )
+    from embedding_backends import LEGACY_SPACE, check_embedding_space
     
-    chunks = text_splitter.split_text(text)
-    return chunks
+    metadata = dict(collection.metadata or {})
+    if 'embedding_model' in metadata:
+        recorded = {'model': metadata['embedding_model'], 'dimension': metadata.get('embedding_dimension')}
+    else:
+        recorded = LEGACY_SPACE if collection.count() else None
+    space = check_embedding_space(recorded, embedder, f"Collection {collection.name}")
+    if 'embedding_model' not in metadata:
+        metadata.update(embedding_model=space['model'], embedding_dimension=space['dimension'])
+        collection.modify(metadata=metadata)
+    return space
 
-def generate_embeddings(texts: List[str]) -> List[List[float]]:
+def get_source_manifest(collection_name: str) -> SourceManifest:
     """
-    Generate embeddings for a list of texts using Google Generative AI.
+    Open the source manifest kept beside the ChromaDB collection.
     
     Args:
-        texts (List[str]): List of texts to embed
+        collection_name (str): Collection the manifest describes
         
     Returns:
-        List[List[float]]: List of embedding vectors
+        SourceManifest: Manifest scoped to the collection
     """
-    embeddings = []
+    from sqlalchemy import create_engine
     
-    for i, text in enumerate(texts):
-        if not text.strip():
-            continue
-            
-        try:
-            # Rate limiting to avoid quota issues
-            if i > 0 and i % 10 == 0:
-                time.sleep(1)
-            
-            result = genai.embed_content(
-                model="models/text-embedding-004",
-                content=text,
-                task_type="retrieval_document"
-            )
-            
-            embeddings.append(result['embedding'])
-            
-        except Exception as e:
-            print(f"Error generating embedding for text {i}: {str(e)}")
-            # Continue with other texts even if one fails
-            continue
+    manifest_path = os.path.join(CHROMA_PERSIST_DIRECTORY, "source_manifest.sqlite3")
+    return SourceManifest(create_engine(f"sqlite:///{manifest_path}"), scope=collection_name)
+
+class ChromaChunkWriter(ChunkWriter):
+    """Writes embedded chunks from the ingestion pipeline into a ChromaDB collection."""
+    
+    def __init__(self, collection):
+        self.collection = collection
+    
+    def write_chunks(self, records: List[ChunkRecord], embeddings: List[List[float]]) -> int:
+        # Ids are content-addressed, so re-indexing the same chunk overwrites it
+        self.collection.upsert(
+            embeddings=embeddings,
+            documents=[record.text for record in records],
+            metadatas=[
+                {'source_type': record.source_type, 'source_path': record.source_path,
+                 'chunk_index': record.position}
+                for record in records
+            ],
+            ids=[record.row_id for record in records]
+        )
+        return len(records)
     
-    return embeddings
+    def delete_chunks(self, row_ids: List[str]):
+        self.collection.delete(ids=row_ids)
 
-def create_chroma_collection(collection_name: str = "bible_comments_rag"):
+def iter_collection_batches(collection, batch_size: int = 1000):
     """
-    Initialize a ChromaDB collection and return it.
+    Page through every chunk in a ChromaDB collection.
+    
+    Yields:
+        tuple: (rows, embeddings) for one page, as expected by vector_snapshot
+    """
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "documents", "metadatas"],
+                              limit=batch_size, offset=offset)
+        if not page['ids']:
+            return
+        rows = [
+            {'id': chunk_id, 'text': document, 'source': (metadata or {}).get('source_path')}
+            for chunk_id, document, metadata in zip(page['ids'], page['documents'], page['metadatas'])
+        ]
+        yield rows, [list(embedding) for embedding in page['embeddings']]
+        offset += len(page['ids'])
+
+def publish_search_snapshot(collection) -> str:
+    """
+    Publish the collection as a memory-mappable snapshot for vector_search_service.
     
     Args:
-        collection_name (str): Name of the collection
+        collection: ChromaDB collection to export
         
     Returns:
-        chromadb.Collection: ChromaDB collection object
+        str: Published snapshot version
     """
-    try:
-        # Create ChromaDB client with persistent storage
-        persist_directory = "backend/data/chromadb"
-        os.makedirs(persist_directory, exist_ok=True)
-        
-        client = chromadb.PersistentClient(path=persist_directory)
-        
-        # Try to get existing collection or create new one
-        try:
-            collection = client.get_collection(name=collection_name)
-            print(f"Using existing collection: {collection_name}")
-        except:
-            collection = client.create_collection(
-                name=collection_name,
-                metadata={"description": "RAG collection for biblical commentaries"}
-            )
-            print(f"Created new collection: {collection_name}")
-        
-        return collection
-        
-    except Exception as e:
-        print(f"Error creating ChromaDB collection: {str(e)}")
-        raise
+    from vector_snapshot import publish_snapshot
+    
+    version = publish_snapshot(iter_collection_batches(collection), get_embedding_engine().model)
+    print(f"Published search snapshot {version}")
+    return version
 
-def index_documents(sources: List[Dict[str, str]]) -> bool:
+def index_documents(sources: List[Dict[str, str]], resume: bool = False,
+                    collection_name: str = "bible_comments_rag", retry_failed: bool = False) -> bool:
     """
     Index documents from various sources into ChromaDB.
     
+    This is rag_indexer_fanout with the collection as the only store:
+    sources stream through the shared ingestion pipeline (load -> split ->
+    embed -> write), unchanged sources are skipped using the manifest kept
+    beside the collection, and only the chunks that differ are embedded.
+    Every committed batch is checkpointed for ``resume``; the embedding
+    model and dimension are stored with the collection and a run whose
+    backend does not match them is refused. The search snapshot is
+    republished when chunks changed.
+    
     Args:
         sources (List[Dict]): List of source dictionaries with 'type' and 'path'/'url'
+        resume (bool): Continue an interrupted run from its checkpoint journal
+        collection_name (str): ChromaDB collection to index into
+        retry_failed (bool): Only re-embed chunks that failed in earlier runs
         
     Returns:
         bool: True if indexing was successful
     """
-    try:
-        # Create ChromaDB collection
-        collection = create_chroma_collection()
-        
-        all_chunks = []
-        all_metadatas = []
-        all_ids = []
-        
-        chunk_id_counter = 0
-        
-        for source in sources:
-            source_type = source.get('type')
-            source_path = source.get('path') or source.get('url')
-            
-            print(f"Processing {source_type}: {source_path}")
-            
-            # Load content based on source type
-            if source_type == 'file':
-                content = load_document(source_path)
-            elif source_type == 'url':
-                content = load_web_page(source_path)
-            else:
-                print(f"Unknown source type: {source_type}")
-                continue
-            
-            if not content:
-                print(f"No content loaded from {source_path}")
-                continue
-            
-            # Split into chunks
-            chunks = split_text_into_chunks(content)
-            print(f"Split into {len(chunks)} chunks")
-            
-            # Prepare chunks and metadata
-            for chunk in chunks:
-                if chunk.strip():
-                    all_chunks.append(chunk)
-                    all_metadatas.append({
-                        'source_type': source_type,
-                        'source_path': source_path,
-                        'chunk_index': len(all_chunks) - 1
-                    })
-                    all_ids.append(f"chunk_{chunk_id_counter}")
-                    chunk_id_counter += 1
-        
-        if not all_chunks:
-            print("No chunks to index")
-            return False
-        
-        print(f"Generating embeddings for {len(all_chunks)} chunks...")
-        
-        # Generate embeddings in batches to avoid memory issues
-        batch_size = 50
-        for i in range(0, len(all_chunks), batch_size):
-            batch_chunks = all_chunks[i:i + batch_size]
-            batch_metadatas = all_metadatas[i:i + batch_size]
-            batch_ids = all_ids[i:i + batch_size]
-            
-            print(f"Processing batch {i//batch_size + 1}/{(len(all_chunks) + batch_size - 1)//batch_size}")
-            
-            # Generate embeddings for this batch
-            batch_embeddings = generate_embeddings(batch_chunks)
-            
-            if len(batch_embeddings) != len(batch_chunks):
-                print(f"Warning: Generated {len(batch_embeddings)} embeddings for {len(batch_chunks)} chunks")
-                # Adjust arrays to match successful embeddings
-                batch_chunks = batch_chunks[:len(batch_embeddings)]
-                batch_metadatas = batch_metadatas[:len(batch_embeddings)]
-                batch_ids = batch_ids[:len(batch_embeddings)]
-            
-            # Add to ChromaDB
-            if batch_embeddings:
-                collection.add(
-                    embeddings=batch_embeddings,
-                    documents=batch_chunks,
-                    metadatas=batch_metadatas,
-                    ids=batch_ids
-                )
-                print(f"Added {len(batch_embeddings)} chunks to collection")
-        
-        print(f"Successfully indexed {len(all_chunks)} chunks")
-        return True
-        
-    except Exception as e:
-        print(f"Error indexing documents: {str(e)}")
-        return False
+    from rag_indexer_fanout import index_fanout
+    
+    return index_fanout(sources, ['chroma'], collection_name=collection_name, resume=resume,
+                        retry_failed=retry_failed,
+                        publish=lambda: publish_search_snapshot(create_chroma_collection(collection_name)),
+                        indexer='chroma')
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index biblical commentary sources into ChromaDB")
+    parser.add_argument('sources', nargs='*',
+                        help="Files or URLs to index (defaults to the commentary files in backend/data)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted run without re-embedding committed chunks")
+    parser.add_argument('--collection', default="bible_comments_rag", help="ChromaDB collection to index into")
+    parser.add_argument('--retry-failed', action='store_true',
+                        help="Only re-embed the chunks that failed in earlier runs (dead-letter table)")
+    parser.add_argument('--crawl', action='store_true',
+                        help="Treat the URLs as start pages and index every page reachable under them")
+    parser.add_argument('--max-pages', type=int, default=1000, help="Maximum pages visited by --crawl")
+    parser.add_argument('--embedding-backend', choices=BACKENDS,
+                        help="Embedder: gemini (default), local hashed n-grams, or record/replay (EMBEDDING_BACKEND)")
+    parser.add_argument('--recording-path', help="Recording file for --embedding-backend record/replay")
+    parser.add_argument('--metrics-dir', help="Where to write <indexer>.jsonl and <indexer>.prom (RAG_METRICS_DIR)")
+    parser.add_argument('--profile-dir', help="Write a cProfile dump per pipeline stage here (RAG_PROFILE_DIR)")
+    args = parser.parse_args()
+    if args.metrics_dir is not None:
+        os.environ['RAG_METRICS_DIR'] = args.metrics_dir
+    if args.profile_dir:
+        os.environ['RAG_PROFILE_DIR'] = args.profile_dir
+    if args.embedding_backend:
+        os.environ['EMBEDDING_BACKEND'] = args.embedding_backend
+    if args.recording_path:
+        os.environ['EMBEDDING_RECORDING_PATH'] = args.recording_path
+    
     print("Starting RAG indexing process...")
     
-    # Check if Google API key is set
-    if not os.getenv('GOOGLE_API_KEY'):
-        print("Error: GOOGLE_API_KEY environment variable not set")
+    # Check if the Gemini API key is set (only the API-backed embedders need it)
+    if needs_api_key() and not api_key_from_env():
+        print(f"Error: {API_KEY_ENV} environment variable not set")
         sys.exit(1)
     
+    if args.retry_failed:
+        success = index_documents([], collection_name=args.collection, retry_failed=True)
+        sys.exit(0 if success else 1)
+    
     # Define sources to index
     # For MVP, we'll focus on local files instead of web scraping
     # You can manually download content from these sites and save as TXT files
-    sources = [
+    sources = sources_from_args(args.sources) or [
         # Example local files (create these manually for MVP)
         {'type': 'file', 'path': 'backend/data/freebiblecommentary_content.txt'},
         {'type': 'file', 'path': 'backend/data/bibliotecabiblica_content.txt'},
         {'type': 'file', 'path': 'backend/data/enduringword_content.txt'},
         
-        # Uncomment these for web scraping (may need additional setup)
+        # Uncomment these for web scraping (or pass the URLs with --crawl to index whole sites)
         # {'type': 'url', 'url': 'https://www.freebiblecommentary.org/portuguese_bible_study.htm'},
         # {'type': 'url', 'url': 'https://bibliotecabiblica.blogspot.com/'},
         # {'type': 'url', 'url': 'https://pt.enduringword.com/'},
     ]
+    if args.crawl:
+        seeds = [source['url'] for source in sources if source['type'] == 'url']
+        sources = [source for source in sources if source['type'] != 'url'] + crawl_sources(seeds, args.max_pages)
     
     # Create data directory if it doesn't exist
     os.makedirs('backend/data', exist_ok=True)
@@ -318,7 +253,7 @@ if __name__ == "__main__":
     ]
     
     for file_path in sample_files:
-        if not os.path.exists(file_path):
+        if not args.sources and not os.path.exists(file_path):
             with open(file_path, 'w', encoding='utf-8') as f:
                 f.write(f"Sample content for {os.path.basename(file_path)}\n\n")
                 f.write("This is placeholder content. Replace with actual biblical commentary content.\n")
@@ -340,7 +275,7 @@ if __name__ == "__main__":
         sys.exit(1)
     
     # Run indexing
-    success = index_documents(existing_sources)
+    success = index_documents(existing_sources, resume=args.resume, collection_name=args.collection)
     
     if success:
         print("RAG indexing completed successfully!")
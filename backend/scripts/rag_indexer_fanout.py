@@ -0,0 +1,275 @@
+import argparse
+import os
+import sys
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from embedding_backends import BACKENDS, api_key_from_env, needs_api_key
+from indexing_metrics import RunMetrics
+from ingest_pipeline import ChunkWriter
+from ingest_runtime import (API_KEY_ENV, build_pipeline, get_embedding_cache, get_embedding_engine,
+                            get_extraction_pool, print_run_stats, record_run_gauges, shutdown_extraction_pool,
+                            sources_from_args)
+from source_manifest import SourceManifest
+from sink_fanout import DEFAULT_MAX_LAG_BATCHES, FanOutChunkWriter, SinkState, resync_sink
+
+SINKS = ('postgres', 'chroma', 'snapshot')
+
+# The first of these that is selected keeps the manifest and the journal
+PRIMARY_SINKS = ('postgres', 'chroma')
+
+def open_sinks(names: List[str], user_id: int, collection_name: str,
+               embedder) -> Dict[str, Tuple[ChunkWriter, Callable[[], Iterable]]]:
+    """
+    Open the selected vector stores.
+    
+    A store that cannot be opened is left out with a message, unless it
+    would be the primary.
+    
+    Args:
+        names (List[str]): Sinks from SINKS
+        user_id (int): Owner of the Postgres rows
+        collection_name (str): ChromaDB collection
+        embedder (EmbeddingBackend): Backend whose space every store must match
+    
+    Returns:
+        Dict: name -> (writer, function returning the store's (rows, embeddings) pages)
+    """
+    primary = next(name for name in PRIMARY_SINKS if name in names)
+    sinks = {}
+    for name in names:
+        try:
+            if name == 'postgres':
+                from pg_bulk_writer import BulkChunkWriter
+                from rag_indexer_postgres import (create_rag_table, ensure_table_space, ensure_user_partitions,
+                                                  get_engine, iter_table_batches)
+                
+                create_rag_table()
+                ensure_table_space(embedder)
+                ensure_user_partitions([user_id])
+                sinks[name] = (BulkChunkWriter(get_engine(), user_id),
+                               lambda: iter_table_batches(user_id=user_id))
+            elif name == 'chroma':
+                from rag_indexer import (ChromaChunkWriter, create_chroma_collection, ensure_collection_space,
+                                         iter_collection_batches)
+                
+                collection = create_chroma_collection(collection_name)
+                ensure_collection_space(collection, embedder)
+                sinks[name] = (ChromaChunkWriter(collection), lambda: iter_collection_batches(collection))
+            elif name == 'snapshot':
+                from sink_fanout import SnapshotSink
+                
+                # Rows exported from Postgres carry their user; a Chroma collection has none
+                row_fields = {'user_id': user_id} if primary == 'postgres' else None
+                snapshot = SnapshotSink(embedder.model, row_fields=row_fields)
+                sinks[name] = (snapshot, snapshot.iter_batches)
+        except Exception as e:
+            if name == primary:
+                raise
+            print(f"Sink {name} unavailable, indexing without it: {e}")
+    return sinks
+
+def primary_manifest(primary: str, user_id: int, collection_name: str) -> SourceManifest:
+    """The source manifest kept by the primary store: per user in Postgres, beside the Chroma collection otherwise."""
+    if primary == 'postgres':
+        from rag_indexer_postgres import get_engine
+        
+        return SourceManifest(get_engine(), scope=f"user:{user_id}")
+    from rag_indexer import get_source_manifest
+    
+    return get_source_manifest(collection_name)
+
+class SinkIndexer:
+    """
+    The ingestion pipeline of one manifest scope writing into already opened stores.
+    
+    The primary store (Postgres if present, otherwise Chroma) is the one
+    ``manifest`` describes; the other stores are first resynced from it if
+    they are new to the scope or failed last time (rag_sink_state), then
+    fed the same batches through FanOutChunkWriter. Everything is set up
+    once: ``run`` can be called for any number of source lists (e.g. the
+    slices of one user's library) before ``close``.
+    
+    Args:
+        sinks (Dict): name -> (writer, function returning the store's pages), as from ``open_sinks``
+        manifest (SourceManifest): The primary store's manifest
+        metrics (RunMetrics): Run metrics to report into
+        resume (bool): Continue an interrupted run from its checkpoint journal
+        max_lag_batches (int): Batches a secondary store may fall behind the primary
+        wrap_writer (Callable): Optionally wraps the complete writer (e.g. to report progress)
+    """
+    
+    def __init__(self, sinks: Dict[str, Tuple[ChunkWriter, Callable[[], Iterable]]], manifest: SourceManifest,
+                 metrics: RunMetrics, resume: bool = False, max_lag_batches: int = DEFAULT_MAX_LAG_BATCHES,
+                 wrap_writer: Optional[Callable[[ChunkWriter], ChunkWriter]] = None):
+        self.sinks = sinks
+        self.primary = next(name for name in PRIMARY_SINKS if name in sinks)
+        primary_writer, primary_batches = sinks[self.primary]
+        self.state = SinkState(manifest.engine, manifest.scope)
+        self.state.mark(self.primary, 'ok')
+        
+        self.secondaries = {}
+        for name, (writer, batches) in sinks.items():
+            if name == self.primary:
+                continue
+            if self.state.get(name) != 'ok':
+                try:
+                    with metrics.stage('resync'):
+                        written, deleted = resync_sink(writer, primary_batches(), batches())
+                    print(f"Sink {name}: resynced from {self.primary}, {written} chunks copied, {deleted} removed")
+                except Exception as e:
+                    print(f"Sink {name}: resync failed, indexing without it: {e}")
+                    self.state.mark(name, 'failed', str(e))
+                    continue
+            self.state.mark(name, 'syncing')
+            self.secondaries[name] = writer
+        
+        self.fanout = FanOutChunkWriter((self.primary, primary_writer), self.secondaries, max_lag_batches, metrics)
+        self.pipeline = build_pipeline(manifest, self.fanout, primary_batches, metrics, resume, wrap_writer)
+    
+    def run(self, sources: List[Dict[str, str]], retry_failed: bool = False) -> Dict[str, int]:
+        """Index ``sources`` (or, with ``retry_failed``, only earlier failures); returns this run's counters."""
+        stats = self.pipeline.retry_dead_letters() if retry_failed else self.pipeline.run(sources)
+        if self.pipeline.near_duplicates:
+            print(f"Near-duplicates: {self.pipeline.near_duplicates.stats()}")
+        return stats
+    
+    def close(self) -> Dict[str, Optional[Exception]]:
+        """Wait for the secondary stores and record their state. Returns the error of each store, or None."""
+        errors = self.fanout.close()
+        for name, error in errors.items():
+            self.state.mark(name, 'failed' if error else 'ok', str(error) if error else None)
+        if self.secondaries:
+            for name, sink in self.fanout.stats().items():
+                print(f"Sink {name}: {sink['rows_written']} rows, lag {sink['lag_seconds']}s"
+                      + (f", failed: {sink['error']}" if sink['error'] else ""))
+        return errors
+
+def index_into_sinks(sources: List[Dict[str, str]], sinks: Dict[str, Tuple[ChunkWriter, Callable[[], Iterable]]],
+                     manifest: SourceManifest, metrics: RunMetrics, resume: bool = False,
+                     retry_failed: bool = False, max_lag_batches: int = DEFAULT_MAX_LAG_BATCHES
+                     ) -> Tuple[Dict[str, int], Dict[str, Optional[Exception]]]:
+    """
+    Run the ingestion pipeline once into already opened stores (see SinkIndexer).
+    
+    Returns:
+        tuple: (pipeline counters, error of each store or None)
+    """
+    indexer = SinkIndexer(sinks, manifest, metrics, resume, max_lag_batches)
+    try:
+        stats = indexer.run(sources, retry_failed)
+    finally:
+        errors = indexer.close()
+    return stats, errors
+
+def index_fanout(sources: List[Dict[str, str]], sink_names: List[str], user_id: int = 1,
+                 collection_name: str = "bible_comments_rag", resume: bool = False,
+                 max_lag_batches: int = DEFAULT_MAX_LAG_BATCHES, retry_failed: bool = False,
+                 publish: Optional[Callable[[], str]] = None, indexer: str = 'fanout') -> bool:
+    """
+    Index documents once into several vector stores.
+    
+    Sources go through a single ingestion pipeline, so each chunk is loaded,
+    split and embedded once whatever the number of stores. The primary
+    store (Postgres if selected, otherwise Chroma) keeps the source
+    manifest, checkpoint journal, BM25 and verse indexes; the other stores
+    receive the same embedded batches concurrently through
+    FanOutChunkWriter, each failing on its own. rag_indexer and
+    rag_indexer_postgres are this function with a single store, so all
+    three can take turns on the same data.
+    
+    A store that is new to the primary's scope, or that failed or was
+    interrupted last time (rag_sink_state), is first brought in line from
+    the primary's stored vectors; adding a backend costs no embedding
+    calls.
+    
+    Chunks that fail to embed are parked in the primary's dead-letter table
+    and re-embedded by the next run that finds their source unchanged;
+    ``retry_failed`` re-embeds only those.
+    
+    Args:
+        sources (List[Dict]): Source dictionaries with 'type' and 'path'/'url'
+        sink_names (List[str]): Stores to write, from SINKS
+        user_id (int): Owner of the Postgres rows (and manifest scope when Postgres is primary)
+        collection_name (str): ChromaDB collection
+        resume (bool): Continue an interrupted run from its checkpoint journal
+        max_lag_batches (int): Batches a secondary store may fall behind the primary
+        retry_failed (bool): Only re-embed chunks that failed in earlier runs (``sources`` is ignored)
+        publish (Callable): Publishes the search snapshot when chunks changed or none exists yet
+        indexer (str): Name of the run metrics files
+    
+    Returns:
+        bool: True if every store was indexed
+    """
+    from vector_snapshot import current_version, snapshot_root
+    
+    metrics = RunMetrics.from_env(indexer)
+    try:
+        embedder = get_embedding_engine()
+        embedder.metrics = metrics
+        print(f"Embedding backend: {embedder.model}")
+        sinks = open_sinks(sink_names, user_id, collection_name, embedder)
+        primary = next(name for name in PRIMARY_SINKS if name in sinks)
+        manifest = primary_manifest(primary, user_id, collection_name)
+        
+        stats, errors = index_into_sinks(sources, sinks, manifest, metrics, resume, retry_failed, max_lag_batches)
+        print_run_stats(stats)
+        print(f"Embedding cache: {get_embedding_cache().stats()}")
+        print(f"Extraction: {get_extraction_pool().stats()}")
+        
+        if publish and (stats['chunks_indexed'] or stats['chunks_removed'] or not current_version(snapshot_root())):
+            with metrics.stage('snapshot'):
+                publish()
+        
+        record_run_gauges(metrics)
+        failed = [name for name in sink_names if name not in sinks or errors.get(name, 'skipped')]
+        summary = metrics.finish(status='error' if failed else 'ok')
+        print(f"Run metrics: {summary['chunks_per_second']} chunks/s, stage seconds {summary['stage_seconds']}")
+        return not failed
+    
+    except Exception as e:
+        print(f"Error indexing documents: {str(e)}")
+        metrics.finish(status='error')
+        return False
+    finally:
+        shutdown_extraction_pool()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index sources once into several vector stores")
+    parser.add_argument('sources', nargs='*', help="Files or URLs to index")
+    parser.add_argument('--sinks', default='postgres,snapshot',
+                        help=f"Comma-separated stores to write, from {', '.join(SINKS)}; "
+                             f"postgres or chroma must be one of them")
+    parser.add_argument('--user-id', type=int, default=1, help="Owner of the Postgres rows")
+    parser.add_argument('--collection', default="bible_comments_rag", help="ChromaDB collection to index into")
+    parser.add_argument('--max-lag-batches', type=int, default=DEFAULT_MAX_LAG_BATCHES,
+                        help="Batches a secondary store may fall behind before the pipeline waits for it")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted run without re-embedding committed chunks")
+    parser.add_argument('--retry-failed', action='store_true',
+                        help="Only re-embed the chunks that failed in earlier runs (dead-letter table)")
+    parser.add_argument('--embedding-backend', choices=BACKENDS,
+                        help="Embedder: gemini (default), local hashed n-grams, or record/replay (EMBEDDING_BACKEND)")
+    parser.add_argument('--recording-path', help="Recording file for --embedding-backend record/replay")
+    parser.add_argument('--metrics-dir', help="Where to write <indexer>.jsonl and <indexer>.prom (RAG_METRICS_DIR)")
+    args = parser.parse_args()
+    if args.metrics_dir is not None:
+        os.environ['RAG_METRICS_DIR'] = args.metrics_dir
+    if args.embedding_backend:
+        os.environ['EMBEDDING_BACKEND'] = args.embedding_backend
+    if args.recording_path:
+        os.environ['EMBEDDING_RECORDING_PATH'] = args.recording_path
+    
+    sink_names = [name.strip() for name in args.sinks.split(',') if name.strip()]
+    unknown = [name for name in sink_names if name not in SINKS]
+    if unknown or not any(name in sink_names for name in PRIMARY_SINKS):
+        parser.error(f"--sinks must name stores from {', '.join(SINKS)}, including postgres or chroma")
+    if not args.sources and not args.retry_failed:
+        parser.error("give the sources to index, or --retry-failed")
+    if needs_api_key() and not api_key_from_env():
+        print(f"Error: {API_KEY_ENV} environment variable not set")
+        sys.exit(1)
+    
+    success = index_fanout(sources_from_args(args.sources), sink_names, user_id=args.user_id,
+                           collection_name=args.collection, resume=args.resume,
+                           max_lag_batches=args.max_lag_batches, retry_failed=args.retry_failed)
+    sys.exit(0 if success else 1)
@@ -1,51 +1,47 @@
+import argparse
 import os
 import sys
-import google.generativeai as genai
-from sqlalchemy import create_engine, text, Column, Integer, String, Text, ARRAY, Float
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from typing import List, Dict
-import PyPDF2
-from docx import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-import time
+from typing import TYPE_CHECKING, Callable, List, Dict, Iterable, Optional
 import json
 
-# Configure Google Generative AI
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+from embedding_backends import BACKENDS, api_key_from_env, needs_api_key
+from indexing_metrics import RunMetrics
+from ingest_pipeline import ChunkWriter
+from ingest_runtime import (API_KEY_ENV, get_embedding_cache, get_embedding_engine, get_extraction_pool,
+                            print_run_stats, record_run_gauges, shutdown_extraction_pool, sources_from_args)
+from tenant_scheduler import DEFAULT_SLICE_BYTES, FairScheduler
 
-# Database setup
-DATABASE_URL = os.environ.get("DATABASE_URL")
-if not DATABASE_URL:
-    raise ValueError("DATABASE_URL não configurada nas variáveis de ambiente.")
+# sqlalchemy e numpy são importados onde são usados, para que --help e
+# execuções pequenas não paguem por eles na inicialização
+if TYPE_CHECKING:
+    from embedding_backends import EmbeddingBackend
+    from rag_indexer_fanout import SinkIndexer
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(bind=engine)
-Base = declarative_base()
+# Compartilhado entre chamadas para que o pool de conexões seja reaproveitado
+_engine = None
 
-class RagChunk(Base):
-    __tablename__ = "rag_chunks"
-    
-    id = Column(Integer, primary_key=True)
-    document_id = Column(String(255), nullable=False)
-    chunk_text = Column(Text, nullable=False)
-    embedding_vector = Column(Text, nullable=False)  # JSON string of float array
-    source_url = Column(String(500))
-    page_number = Column(Integer)
-    user_id = Column(Integer, nullable=False)
+def get_engine():
+    """Retorna o engine SQLAlchemy do processo, criado na primeira chamada"""
+    global _engine
+    if _engine is None:
+        from sqlalchemy import create_engine
+        
+        database_url = os.environ.get("DATABASE_URL")
+        if not database_url:
+            raise ValueError("DATABASE_URL não configurada nas variáveis de ambiente.")
+        # O pool é compartilhado pelo manifesto e pelo gravador em massa
+        _engine = create_engine(database_url, pool_size=5, pool_pre_ping=True)
+    return _engine
 
 def create_rag_table():
     """Cria a tabela rag_chunks se não existir"""
+    from sqlalchemy import text
+    from migrate_pgvector import (create_vector_index, ensure_quantized_columns, ensure_vector_column,
+                                  is_partitioned, partition_rag_chunks)
+    from pg_bulk_writer import ensure_chunk_id_index
+    
     try:
-        with engine.connect() as conn:
-            # Instalar extensão pgvector se necessário (para Supabase/PostgreSQL)
-            try:
-                conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector;"))
-                conn.commit()
-                print("Extensão vector habilitada")
-            except Exception as e:
-                print(f"Aviso: Não foi possível habilitar extensão vector: {e}")
-            
+        with get_engine().connect() as conn:
             # Criar tabela
             conn.execute(text("""
                 CREATE TABLE IF NOT EXISTS rag_chunks (
@@ -62,199 +58,273 @@ def create_rag_table():
             conn.commit()
             print("Tabela rag_chunks criada com sucesso")
             
+            # Uma partição por usuário; tabelas com dados são convertidas pelo migrate_pgvector.py --partition
+            if not is_partitioned(conn):
+                if conn.execute(text("SELECT EXISTS (SELECT 1 FROM rag_chunks)")).scalar():
+                    print("rag_chunks não é particionada por usuário; execute migrate_pgvector.py --partition")
+                elif partition_rag_chunks(conn):
+                    print("rag_chunks particionada por usuário")
+            
+            # Coluna vector(768) nativa com índice ANN (pgvector), quando disponível
+            if ensure_vector_column(conn):
+                create_vector_index(conn)
+                print("Coluna embedding (pgvector) e índice ANN prontos")
+            
+            # Códigos int8 e de sinal (1 bit) para a busca grosseira com reordenação
+            ensure_quantized_columns(conn)
+            
+            # IDs de chunk determinísticos + índice único permitem upsert idempotente
+            if ensure_chunk_id_index(conn):
+                print("Índice único (user_id, document_id) pronto")
+            
     except Exception as e:
         print(f"Erro ao criar tabela: {e}")
         raise
 
-def load_document(file_path: str) -> str:
-    """Carrega conteúdo de texto de um arquivo"""
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"Arquivo não encontrado: {file_path}")
+def ensure_table_space(embedder: "EmbeddingBackend") -> Dict:
+    """Registra (ou confere) o modelo e a dimensão dos vetores do rag_chunks; recusa misturar modelos"""
+    from sqlalchemy import text
+    from embedding_backends import ensure_embedding_space
     
-    file_extension = os.path.splitext(file_path)[1].lower()
+    engine = get_engine()
+    with engine.connect() as conn:
+        has_vectors = conn.execute(text("SELECT EXISTS (SELECT 1 FROM rag_chunks)")).scalar()
+    return ensure_embedding_space(engine, 'rag_chunks', embedder, has_vectors)
+
+def iter_table_batches(batch_size: int = 1000, user_id: Optional[int] = None):
+    """Percorre os chunks do rag_chunks (só os do usuário, se informado) com cursor no servidor, em lotes (rows, embeddings)"""
+    from sqlalchemy import text
     
-    try:
-        if file_extension == '.txt':
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read()
-                
-        elif file_extension == '.pdf':
-            text = ""
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-            return text
-            
-        elif file_extension == '.docx':
-            doc = Document(file_path)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text
-            
-        else:
-            raise ValueError(f"Formato de arquivo não suportado: {file_extension}")
-            
-    except Exception as e:
-        print(f"Erro ao carregar documento {file_path}: {str(e)}")
-        return ""
+    with get_engine().connect() as conn:
+        # Com a tabela particionada, o filtro por usuário lê apenas a partição dele
+        result = conn.execution_options(stream_results=True, max_row_buffer=batch_size).execute(text(f"""
+            SELECT document_id, chunk_text, source_url, user_id, embedding_vector
+            FROM rag_chunks {'WHERE user_id = :user_id' if user_id is not None else ''} ORDER BY id
+        """), {'user_id': user_id})
+        for partition in result.partitions(batch_size):
+            rows = [
+                {'id': row[0], 'text': row[1], 'source': row[2], 'user_id': row[3]}
+                for row in partition
+            ]
+            yield rows, [json.loads(row[4]) for row in partition]
 
-def split_text_into_chunks(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
-    """Divide texto em fragmentos usando RecursiveCharacterTextSplitter"""
-    if not text.strip():
-        return []
+def publish_search_snapshot() -> str:
+    """Publica o rag_chunks como snapshot mapeável em memória para o vector_search_service; cada linha guarda seu user_id e o serviço só busca nas do usuário da consulta"""
+    from vector_snapshot import publish_snapshot
     
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        length_function=len,
-        separators=["\n\n", "\n", ". ", " ", ""]
-    )
+    version = publish_snapshot(iter_table_batches(), get_embedding_engine().model)
+    print(f"Snapshot de busca publicado: {version}")
+    return version
+
+def ensure_user_partitions(user_ids: Iterable[int]):
+    """Cria a partição de cada usuário no rag_chunks, se a tabela for particionada"""
+    from migrate_pgvector import ensure_user_partition
     
-    chunks = text_splitter.split_text(text)
-    return chunks
+    with get_engine().connect() as conn:
+        for user_id in user_ids:
+            ensure_user_partition(conn, user_id)
 
-def generate_embeddings(texts: List[str]) -> List[List[float]]:
-    """Gera embeddings para uma lista de textos usando Google Generative AI"""
-    embeddings = []
+def open_user_indexer(user_id: int, resume: bool = False, metrics: Optional[RunMetrics] = None,
+                      wrap_writer: Optional[Callable[[ChunkWriter], ChunkWriter]] = None) -> "SinkIndexer":
+    """Monta uma vez o pipeline compartilhado (rag_indexer_fanout) de um usuário: gravador COPY na partição dele, manifesto, índices BM25 e de versículos e filtro de quase-duplicatas"""
+    from pg_bulk_writer import BulkChunkWriter
+    from rag_indexer_fanout import SinkIndexer
+    from source_manifest import SourceManifest
     
-    for i, text in enumerate(texts):
-        if not text.strip():
-            continue
-            
-        try:
-            # Rate limiting para evitar problemas de quota
-            if i > 0 and i % 10 == 0:
-                time.sleep(1)
-            
-            result = genai.embed_content(
-                model="models/text-embedding-004",
-                content=text,
-                task_type="retrieval_document"
-            )
-            
-            embeddings.append(result['embedding'])
-            
-        except Exception as e:
-            print(f"Erro ao gerar embedding para texto {i}: {str(e)}")
-            continue
+    writer = BulkChunkWriter(get_engine(), user_id)
+    return SinkIndexer({'postgres': (writer, lambda: iter_table_batches(user_id=user_id))},
+                       SourceManifest(get_engine(), scope=f"user:{user_id}"),
+                       metrics or RunMetrics('postgres', directory=None), resume, wrap_writer=wrap_writer)
+
+def index_user_sources(sources: List[Dict[str, str]], user_id: int, resume: bool = False,
+                       metrics: Optional[RunMetrics] = None,
+                       wrap_writer: Optional[Callable[[ChunkWriter], ChunkWriter]] = None,
+                       retry_failed: bool = False, indexer: Optional["SinkIndexer"] = None) -> Dict[str, int]:
+    """Indexa as fontes de um usuário e retorna os contadores; com ``indexer`` (de open_user_indexer) reaproveita o pipeline já montado"""
+    owned = indexer is None
+    if owned:
+        indexer = open_user_indexer(user_id, resume, metrics, wrap_writer)
+    try:
+        stats = indexer.run(sources, retry_failed)
+    finally:
+        if owned:
+            indexer.close()
+    
+    writer = indexer.sinks['postgres'][0]
+    print_run_stats(stats, f"Usuário {user_id}")
+    print(f"Gravação no banco: {writer.rows_written} linhas a {writer.rows_per_second:.0f} linhas/s")
+    if metrics is not None:
+        metrics.set_labeled_gauge('copy_rows_per_second', {'user': str(user_id)}, round(writer.rows_per_second, 1))
+    return stats
+
+def index_documents(sources: List[Dict[str, str]], user_id: int = 1, resume: bool = False,
+                    retry_failed: bool = False) -> bool:
+    """
+    Indexa documentos de várias fontes no PostgreSQL de forma incremental.
+    
+    É o rag_indexer_fanout com o rag_chunks como único destino: as fontes
+    passam pelo pipeline de ingestão compartilhado em streaming, fontes
+    inalteradas (segundo o manifesto rag_sources do usuário) são ignoradas e
+    só os chunks novos geram embeddings. Cada lote gravado vai para o diário
+    de checkpoints (``resume``), o modelo e a dimensão ficam em
+    rag_embedding_spaces, e chunks que falharam ficam em rag_dead_letters
+    (``retry_failed`` reprocessa só esses). O snapshot de busca é publicado
+    de novo quando algo mudou.
+    """
+    from rag_indexer_fanout import index_fanout
     
-    return embeddings
+    return index_fanout(sources, ['postgres'], user_id=user_id, resume=resume, retry_failed=retry_failed,
+                        publish=publish_search_snapshot, indexer='postgres')
 
-def index_documents(sources: List[Dict[str, str]], user_id: int = 1) -> bool:
-    """Indexa documentos de várias fontes no PostgreSQL"""
+def index_libraries(libraries: Dict[int, List[Dict[str, str]]], workers: int = 4,
+                    slice_bytes: int = DEFAULT_SLICE_BYTES, resume: bool = False) -> bool:
+    """
+    Indexa as bibliotecas de vários usuários em paralelo.
+    
+    As fontes de cada usuário são divididas em fatias e distribuídas entre
+    ``workers`` threads pelo FairScheduler (tenant_scheduler): cada usuário
+    tem no máximo uma fatia em andamento e a próxima fatia vai para o
+    usuário menos atendido até agora, então uma biblioteca grande não atrasa
+    as pequenas. Cada usuário grava só na sua partição do rag_chunks e no
+    seu escopo do manifesto. O pipeline de cada usuário (com os índices BM25
+    e de versículos e o filtro de quase-duplicatas) é montado na primeira
+    fatia dele e reaproveitado nas seguintes. O backend de embeddings (e seu
+    limite de taxa) é compartilhado; o snapshot de busca é publicado uma vez
+    no final.
+    
+    Args:
+        libraries (Dict[int, List[Dict]]): Fontes por usuário
+        workers (int): Fatias indexadas ao mesmo tempo
+        slice_bytes (int): Tamanho aproximado de uma fatia
+        resume (bool): Retoma execuções interrompidas (ver index_documents)
+    
+    Returns:
+        bool: True se todos os usuários foram indexados
+    """
+    from vector_snapshot import current_version, snapshot_root
+    
+    metrics = RunMetrics.from_env('postgres-batch')
     try:
-        session = SessionLocal()
-        
-        # Limpar chunks existentes do usuário
-        session.execute(text("DELETE FROM rag_chunks WHERE user_id = :user_id"), {"user_id": user_id})
-        session.commit()
-        print(f"Chunks existentes do usuário {user_id} removidos")
+        embedder = get_embedding_engine()
+        embedder.metrics = metrics
+        space = ensure_table_space(embedder)
+        print(f"Backend de embeddings: {space['model']} (dimensão {space['dimension']})")
+        ensure_user_partitions(libraries)
+        # Criados antes das threads, para que todas compartilhem os mesmos
+        get_embedding_cache()
+        get_extraction_pool()
         
-        all_chunks = []
-        all_metadatas = []
-        
-        for source in sources:
-            source_type = source.get('type')
-            source_path = source.get('path')
-            document_id = source.get('document_id', f"doc_{int(time.time())}")
-            
-            print(f"Processando {source_type}: {source_path}")
-            
-            # Carregar conteúdo
-            if source_type == 'file':
-                content = load_document(source_path)
-            else:
-                print(f"Tipo de fonte desconhecido: {source_type}")
-                continue
-            
-            if not content:
-                print(f"Nenhum conteúdo carregado de {source_path}")
-                continue
-            
-            # Dividir em chunks
-            chunks = split_text_into_chunks(content)
-            print(f"Dividido em {len(chunks)} chunks")
-            
-            # Preparar chunks e metadados
-            for i, chunk in enumerate(chunks):
-                if chunk.strip():
-                    all_chunks.append(chunk)
-                    all_metadatas.append({
-                        'document_id': document_id,
-                        'source_path': source_path,
-                        'page_number': i + 1,
-                        'user_id': user_id
-                    })
+        # Um usuário tem no máximo uma fatia em andamento, então seu pipeline nunca roda em duas threads
+        indexers = {}
         
-        if not all_chunks:
-            print("Nenhum chunk para indexar")
-            return False
+        def index_slice(user_id: int, sources: List[Dict[str, str]]) -> Dict[str, int]:
+            if user_id not in indexers:
+                indexers[user_id] = open_user_indexer(user_id, resume, metrics)
+            return index_user_sources(sources, user_id, metrics=metrics, indexer=indexers[user_id])
         
-        print(f"Gerando embeddings para {len(all_chunks)} chunks...")
+        scheduler = FairScheduler(index_slice, workers=workers, slice_bytes=slice_bytes, metrics=metrics)
+        for user_id, sources in libraries.items():
+            scheduler.add(user_id, sources)
+        try:
+            results = scheduler.run()
+        finally:
+            for indexer in indexers.values():
+                indexer.close()
         
-        # Gerar embeddings em lotes
-        batch_size = 50
-        total_indexed = 0
+        print(f"{'usuário':>8}{'chunks':>10}{'chunks/s':>10}{'MB':>10}{'tempo (s)':>11}  erro")
+        for user_id, result in sorted(results.items()):
+            print(f"{user_id:>8}{result['chunks_indexed']:>10}{result['chunks_per_second']:>10}"
+                  f"{result['bytes_done'] / 1e6:>10.1f}{result['elapsed_seconds']:>11.1f}  {result['error'] or ''}")
         
-        for i in range(0, len(all_chunks), batch_size):
-            batch_chunks = all_chunks[i:i + batch_size]
-            batch_metadatas = all_metadatas[i:i + batch_size]
-            
-            print(f"Processando lote {i//batch_size + 1}/{(len(all_chunks) + batch_size - 1)//batch_size}")
-            
-            # Gerar embeddings para este lote
-            batch_embeddings = generate_embeddings(batch_chunks)
-            
-            if len(batch_embeddings) != len(batch_chunks):
-                print(f"Aviso: Gerados {len(batch_embeddings)} embeddings para {len(batch_chunks)} chunks")
-                batch_chunks = batch_chunks[:len(batch_embeddings)]
-                batch_metadatas = batch_metadatas[:len(batch_embeddings)]
-            
-            # Inserir no banco de dados
-            for chunk, embedding, metadata in zip(batch_chunks, batch_embeddings, batch_metadatas):
-                try:
-                    session.execute(text("""
-                        INSERT INTO rag_chunks (document_id, chunk_text, embedding_vector, source_url, page_number, user_id)
-                        VALUES (:document_id, :chunk_text, :embedding_vector, :source_url, :page_number, :user_id)
-                    """), {
-                        'document_id': metadata['document_id'],
-                        'chunk_text': chunk,
-                        'embedding_vector': json.dumps(embedding),
-                        'source_url': metadata['source_path'],
-                        'page_number': metadata['page_number'],
-                        'user_id': metadata['user_id']
-                    })
-                    total_indexed += 1
-                except Exception as e:
-                    print(f"Erro ao inserir chunk: {e}")
-                    continue
-            
-            session.commit()
-            print(f"Lote inserido: {len(batch_embeddings)} chunks")
+        changed = metrics.counters.get('chunks_indexed', 0) or metrics.counters.get('chunks_removed', 0)
+        if changed or not current_version(snapshot_root()):
+            with metrics.stage('snapshot'):
+                publish_search_snapshot()
         
-        session.close()
-        print(f"Indexação concluída com sucesso: {total_indexed} chunks indexados")
-        return True
+        record_run_gauges(metrics)
+        failed = [user_id for user_id, result in results.items() if result['error']]
+        summary = metrics.finish(status='error' if failed else 'ok')
+        print(f"Métricas: {summary['chunks_per_second']} chunks/s, tempo por etapa {summary['stage_seconds']}")
+        return not failed
         
     except Exception as e:
-        print(f"Erro na indexação de documentos: {str(e)}")
+        print(f"Erro na indexação das bibliotecas: {str(e)}")
+        metrics.finish(status='error')
         return False
+    finally:
+        shutdown_extraction_pool()
+
+def discover_libraries(root: str) -> Dict[int, List[Dict[str, str]]]:
+    """Lê <root>/<user_id>/..., um diretório de arquivos por usuário"""
+    libraries = {}
+    for name in sorted(os.listdir(root)):
+        directory = os.path.join(root, name)
+        if not (name.isdigit() and os.path.isdir(directory)):
+            continue
+        paths = sorted(
+            os.path.join(current, file_name)
+            for current, _, file_names in os.walk(directory) for file_name in file_names
+        )
+        if paths:
+            libraries[int(name)] = [{'type': 'file', 'path': path} for path in paths]
+    return libraries
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Indexa comentários bíblicos no PostgreSQL (rag_chunks)")
+    parser.add_argument('sources', nargs='*',
+                        help="Arquivos ou URLs a indexar (padrão: os arquivos de comentários em backend/data)")
+    parser.add_argument('--user-id', type=int, default=1, help="Usuário dono dos chunks")
+    parser.add_argument('--libraries', metavar='DIR',
+                        help="Modo em lote: indexa DIR/<user_id>/ de cada usuário em paralelo, com escalonamento justo")
+    parser.add_argument('--workers', type=int, default=4, help="Fatias indexadas ao mesmo tempo em --libraries")
+    parser.add_argument('--slice-mb', type=float, default=DEFAULT_SLICE_BYTES / 1024 / 1024,
+                        help="Tamanho aproximado das fatias de cada biblioteca em --libraries")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continua uma execução interrompida sem gerar de novo os chunks já gravados")
+    parser.add_argument('--retry-failed', action='store_true',
+                        help="Só gera de novo os embeddings dos chunks que falharam antes (rag_dead_letters)")
+    parser.add_argument('--embedding-backend', choices=BACKENDS,
+                        help="Gerador de embeddings: gemini (padrão), local (n-gramas com hash) ou record/replay "
+                             "(EMBEDDING_BACKEND)")
+    parser.add_argument('--recording-path', help="Arquivo de gravação para --embedding-backend record/replay")
+    parser.add_argument('--metrics-dir', help="Onde gravar <indexador>.jsonl e <indexador>.prom (RAG_METRICS_DIR)")
+    parser.add_argument('--profile-dir', help="Grava um dump do cProfile por etapa do pipeline (RAG_PROFILE_DIR)")
+    args = parser.parse_args()
+    if args.metrics_dir is not None:
+        os.environ['RAG_METRICS_DIR'] = args.metrics_dir
+    if args.profile_dir:
+        os.environ['RAG_PROFILE_DIR'] = args.profile_dir
+    if args.embedding_backend:
+        os.environ['EMBEDDING_BACKEND'] = args.embedding_backend
+    if args.recording_path:
+        os.environ['EMBEDDING_RECORDING_PATH'] = args.recording_path
+    
     print("Iniciando processo de indexação RAG...")
     
-    # Verificar se a chave da API do Google está configurada
-    if not os.getenv('GEMINI_API_KEY'):
-        print("Erro: Variável de ambiente GEMINI_API_KEY não configurada")
+    # Verificar se a chave da API do Gemini está configurada (só os backends que usam a API precisam dela)
+    if needs_api_key() and not api_key_from_env():
+        print(f"Erro: Variável de ambiente {API_KEY_ENV} não configurada")
         sys.exit(1)
     
-    # Criar tabela
-    create_rag_table()
+    if args.libraries:
+        # Criar tabela (no modo de um usuário, index_documents cria ao abrir o destino)
+        create_rag_table()
+        libraries = discover_libraries(args.libraries)
+        if not libraries:
+            print(f"Nenhuma biblioteca encontrada em {args.libraries}/<user_id>/")
+            sys.exit(1)
+        print(f"Indexando {len(libraries)} bibliotecas com {args.workers} workers")
+        if not index_libraries(libraries, args.workers, int(args.slice_mb * 1024 * 1024), args.resume):
+            print("Falha na indexação RAG!")
+            sys.exit(1)
+        print("Indexação RAG concluída com sucesso!")
+        sys.exit(0)
+    
+    if args.retry_failed:
+        sys.exit(0 if index_documents([], user_id=args.user_id, retry_failed=True) else 1)
     
     # Definir fontes para indexar
-    sources = [
+    sources = sources_from_args(args.sources) or [
         {'type': 'file', 'path': 'backend/data/freebiblecommentary_content.txt', 'document_id': 'freebible_commentary'},
         {'type': 'file', 'path': 'backend/data/bibliotecabiblica_content.txt', 'document_id': 'biblioteca_biblica'},
         {'type': 'file', 'path': 'backend/data/enduringword_content.txt', 'document_id': 'enduring_word'},
@@ -271,7 +341,7 @@ if __name__ == "__main__":
     ]
     
     for file_path, title in sample_files:
-        if not os.path.exists(file_path):
+        if not args.sources and not os.path.exists(file_path):
             with open(file_path, 'w', encoding='utf-8') as f:
                 f.write(f"{title}\n\n")
                 f.write("Este é um conteúdo de exemplo para demonstrar o sistema RAG.\n")
@@ -290,13 +360,15 @@ if __name__ == "__main__":
                 existing_sources.append(source)
             else:
                 print(f"Arquivo não encontrado: {source['path']}")
+        else:
+            existing_sources.append(source)
     
     if not existing_sources:
         print("Nenhuma fonte válida encontrada. Adicione arquivos de conteúdo em backend/data/")
         sys.exit(1)
     
     # Executar indexação
-    success = index_documents(existing_sources, user_id=1)
+    success = index_documents(existing_sources, user_id=args.user_id, resume=args.resume)
     
     if success:
         print("Indexação RAG concluída com sucesso!")
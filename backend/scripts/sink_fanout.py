@@ -0,0 +1,344 @@
+import queue
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from indexing_metrics import RunMetrics
+from ingest_pipeline import ChunkRecord, ChunkWriter
+from source_manifest import chunk_hash
+
+# Batches a secondary sink may fall behind the primary before writes wait for it
+DEFAULT_MAX_LAG_BATCHES = 8
+
+# Marks the end of the stream on a sink's queue
+_END = object()
+
+# The digest part of a row id (see source_manifest.chunk_row_id)
+_ROW_DIGEST = re.compile(r'[0-9a-f]{16}')
+
+
+def row_to_record(row: Dict) -> ChunkRecord:
+    """
+    Rebuild a pipeline record from a stored row ('id', 'text', 'source').
+
+    Row ids are ``<document>_chunk_<digest>``, so a chunk copied from one
+    store to another keeps its id. Rows written before ids were
+    content-addressed end in the chunk's position instead (or have no
+    ``_chunk_`` part); their digest is recomputed from the text, so they
+    get the id the pipeline would give the same chunk today. Positions are
+    not kept by every store and come back as 0.
+    """
+    document_id, separator, digest = row['id'].rpartition('_chunk_')
+    if not separator:
+        document_id = row['id']
+    if not _ROW_DIGEST.fullmatch(digest):
+        digest = chunk_hash(row['text'])
+    source = row.get('source') or ''
+    return ChunkRecord('url' if '://' in source else 'file', source, document_id, 0, digest, row['text'])
+
+
+def rows_to_records(rows: List[Dict]) -> List[ChunkRecord]:
+    """Pipeline records of stored rows (see ``row_to_record``)."""
+    return [row_to_record(row) for row in rows]
+
+
+class SnapshotSink(ChunkWriter):
+    """
+    Keeps the memory-mapped search snapshot (vector_snapshot) up to date from pipeline batches.
+
+    Written chunks are appended to a new snapshot version as they arrive;
+    ``close`` carries over the rows of the current version that were
+    neither rewritten nor deleted and publishes, so the snapshot follows
+    the run without exporting the whole store again. ``row_fields`` are
+    added to every written row (e.g. the user of a Postgres run), and only
+    rows carrying them count as this sink's (``iter_batches``): written and
+    deleted ids replace only those, never another user's rows with the same id.
+    """
+
+    def __init__(self, model: str, root: Optional[str] = None, row_fields: Optional[Dict] = None):
+        from vector_snapshot import SnapshotWriter, current_version, open_snapshot, snapshot_root
+
+        self.root = root or snapshot_root()
+        self.model = model
+        self.row_fields = dict(row_fields or {})
+        self.previous = current_version(self.root)
+        if self.previous:
+            manifest, _, _ = open_snapshot(self.root, self.previous)
+            if manifest['count'] and manifest['model'] != model:
+                raise ValueError(f"Snapshot {self.previous} holds {manifest['model']} vectors, not {model}")
+        self.writer = SnapshotWriter(self.root, model)
+        self.written = set()
+        self.deleted = set()
+
+    def write_chunks(self, records: List[ChunkRecord], embeddings: List[List[float]]) -> int:
+        rows, vectors = [], []
+        for record, embedding in zip(records, embeddings):
+            if record.row_id in self.written:
+                continue
+            self.written.add(record.row_id)
+            rows.append({'id': record.row_id, 'text': record.text, 'source': record.source_path, **self.row_fields})
+            vectors.append(embedding)
+        self.writer.append(rows, vectors)
+        return len(records)
+
+    def delete_chunks(self, row_ids: List[str]):
+        self.deleted.update(row_ids)
+
+    def iter_batches(self, batch_size: int = 1000):
+        """(rows, embeddings) pages of this sink's rows in the current version."""
+        from vector_snapshot import open_snapshot
+
+        if not self.previous:
+            return
+        _, matrix, chunks = open_snapshot(self.root, self.previous)
+        mine = [i for i, row in enumerate(chunks) if self._is_mine(row)]
+        for start in range(0, len(mine), batch_size):
+            part = mine[start:start + batch_size]
+            yield [chunks[i] for i in part], matrix[part].tolist()
+
+    def _is_mine(self, row: Dict) -> bool:
+        return all(row.get(key) == value for key, value in self.row_fields.items())
+
+    def close(self) -> str:
+        """Carry over untouched rows and publish. Returns the current version."""
+        import numpy as np
+        from vector_snapshot import open_snapshot
+
+        if not self.written and not self.deleted and self.previous:
+            self.writer.abort()
+            return self.previous
+        try:
+            if self.previous:
+                _, matrix, chunks = open_snapshot(self.root, self.previous)
+                # Row ids only depend on the source and the text, so users indexing the
+                # same source share ids: only this sink's rows are replaced or deleted
+                dropped = self.written | self.deleted
+                keep = np.array([row['id'] not in dropped or not self._is_mine(row) for row in chunks], dtype=bool)
+                for start in range(0, len(chunks), 4096):
+                    part = np.flatnonzero(keep[start:start + 4096]) + start
+                    if len(part):
+                        self.writer.append([chunks[i] for i in part], matrix[part])
+        except Exception:
+            self.writer.abort()
+            raise
+        return self.writer.publish()
+
+
+class SinkState:
+    """
+    Whether each sink of a fan-out holds what the manifest says (``rag_sink_state``).
+
+    A sink is 'ok' after a clean run, 'syncing' while a run is feeding it
+    (so a crash leaves it marked) and 'failed' after an error. A sink with
+    no row was never fed from this scope. Like ``SourceManifest`` it works
+    on Postgres or on the SQLite file beside a Chroma collection.
+    """
+
+    def __init__(self, engine, scope: str):
+        from sqlalchemy import text
+
+        self.engine = engine
+        self.scope = scope
+        with engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS rag_sink_state (
+                    scope VARCHAR(255) NOT NULL,
+                    sink VARCHAR(64) NOT NULL,
+                    status VARCHAR(16) NOT NULL,
+                    error TEXT,
+                    updated_at DOUBLE PRECISION NOT NULL,
+                    PRIMARY KEY (scope, sink)
+                )
+            """))
+
+    def get(self, sink: str) -> Optional[str]:
+        from sqlalchemy import text
+
+        with self.engine.connect() as conn:
+            return conn.execute(text("SELECT status FROM rag_sink_state WHERE scope = :scope AND sink = :sink"),
+                                {'scope': self.scope, 'sink': sink}).scalar()
+
+    def mark(self, sink: str, status: str, error: Optional[str] = None):
+        from sqlalchemy import text
+
+        params = {'scope': self.scope, 'sink': sink, 'status': status, 'error': error, 'updated_at': time.time()}
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM rag_sink_state WHERE scope = :scope AND sink = :sink"), params)
+            conn.execute(text("INSERT INTO rag_sink_state (scope, sink, status, error, updated_at) "
+                              "VALUES (:scope, :sink, :status, :error, :updated_at)"), params)
+
+
+def resync_sink(writer: ChunkWriter, source: Iterable[Tuple[List[Dict], List]],
+                target: Iterable[Tuple[List[Dict], List]]) -> Tuple[int, int]:
+    """
+    Bring a sink in line with another store without embedding anything.
+
+    Chunks of ``source`` missing from ``target`` are written with their
+    stored vectors, and chunks only ``target`` has are deleted. Ids are
+    content-addressed, so a shared id means the same text; both sides are
+    compared by the id ``row_to_record`` gives them, so legacy positional
+    ids match the rows they were copied to.
+
+    Args:
+        writer (ChunkWriter): Writer of the sink to repair
+        source: (rows, embeddings) pages of the store in sync with the manifest
+        target: (rows, embeddings) pages of the sink to repair
+
+    Returns:
+        Tuple[int, int]: Chunks written and deleted
+    """
+    # Stored id of each target chunk, by the id its record gets
+    present = {row_to_record(row).row_id: row['id'] for rows, _ in target for row in rows}
+    written = 0
+    for rows, embeddings in source:
+        records = rows_to_records(rows)
+        missing = [(record, embedding) for record, embedding in zip(records, embeddings)
+                   if record.row_id not in present]
+        for record in records:
+            present.pop(record.row_id, None)
+        if missing:
+            writer.write_chunks([record for record, _ in missing], [e for _, e in missing])
+            written += len(missing)
+    stale = sorted(present.values())
+    for start in range(0, len(stale), 1000):
+        writer.delete_chunks(stale[start:start + 1000])
+    return written, len(stale)
+
+
+class SinkWorker:
+    """A secondary sink with its own thread, bounded queue, error and lag counters."""
+
+    def __init__(self, name: str, writer: ChunkWriter, max_lag_batches: int = DEFAULT_MAX_LAG_BATCHES,
+                 metrics: Optional[RunMetrics] = None, log: Callable[[str], None] = print):
+        self.name = name
+        self.writer = writer
+        self.metrics = metrics
+        self.log = log
+        self.queue = queue.Queue(maxsize=max(1, max_lag_batches))
+        self.error: Optional[Exception] = None
+        self.rows_written = 0
+        self.batches_written = 0
+        self.lag_seconds = 0.0
+        self.thread = threading.Thread(target=self._run, name=f'sink-{name}', daemon=True)
+        self.thread.start()
+
+    def submit(self, method: str, *args):
+        """Queue a write or delete; blocks while the sink is ``max_lag_batches`` behind."""
+        if self.error is None:
+            self.queue.put((method, args, time.time()))
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _END:
+                return
+            if self.error is not None:
+                # Keep draining so the pipeline never blocks on a dead sink
+                continue
+            method, args, queued_at = item
+            started = time.perf_counter()
+            try:
+                result = getattr(self.writer, method)(*args)
+            except Exception as e:
+                self.error = e
+                self.log(f"Sink {self.name} failed, the other sinks carry on: {e}")
+                if self.metrics is not None:
+                    self.metrics.event('sink_failed', sink=self.name, error=str(e))
+                self._report()
+                continue
+            if method == 'write_chunks':
+                self.rows_written += result
+                self.batches_written += 1
+            self.lag_seconds = time.time() - queued_at
+            if self.metrics is not None:
+                self.metrics.observe(f"sink_{self.name}_write_seconds", time.perf_counter() - started)
+            self._report()
+
+    def _report(self):
+        if self.metrics is None:
+            return
+        labels = {'sink': self.name}
+        self.metrics.set_labeled_gauge('sink_batches_behind', labels, self.queue.qsize())
+        self.metrics.set_labeled_gauge('sink_lag_seconds', labels, round(self.lag_seconds, 3))
+        self.metrics.set_labeled_gauge('sink_rows_written', labels, self.rows_written)
+        self.metrics.set_labeled_gauge('sink_failed', labels, 1 if self.error else 0)
+
+    def join(self):
+        self.queue.put(_END)
+        self.thread.join()
+
+
+class FanOutChunkWriter(ChunkWriter):
+    """
+    Feeds every embedded batch to several vector stores at once.
+
+    The primary sink (the one the source manifest and checkpoint journal
+    describe) is written in the pipeline's write stage as before, and its
+    errors fail the run. Each secondary sink gets the same batches through
+    its own thread and queue, so the stores write concurrently and a
+    secondary may run up to ``max_lag_batches`` behind before the pipeline
+    waits for it. A secondary that raises is dropped for the rest of the
+    run while the others carry on; callers record it in ``SinkState`` so the
+    next run repairs it with ``resync_sink``. Per-sink lag, queue depth,
+    rows written and failures are reported to ``metrics`` as gauges
+    labelled with the sink.
+    """
+
+    def __init__(self, primary: Tuple[str, ChunkWriter], secondaries: Dict[str, ChunkWriter],
+                 max_lag_batches: int = DEFAULT_MAX_LAG_BATCHES, metrics: Optional[RunMetrics] = None,
+                 log: Callable[[str], None] = print):
+        self.primary_name, self.primary = primary
+        self.metrics = metrics
+        self.log = log
+        self.workers = {name: SinkWorker(name, writer, max_lag_batches, metrics, log)
+                        for name, writer in secondaries.items()}
+        self.primary_rows = 0
+
+    def write_chunks(self, records: List[ChunkRecord], embeddings: List[List[float]]) -> int:
+        for worker in self.workers.values():
+            worker.submit('write_chunks', records, embeddings)
+        written = self.primary.write_chunks(records, embeddings)
+        self.primary_rows += written
+        if self.metrics is not None:
+            self.metrics.set_labeled_gauge('sink_rows_written', {'sink': self.primary_name}, self.primary_rows)
+        return written
+
+    def delete_chunks(self, row_ids: List[str]):
+        for worker in self.workers.values():
+            worker.submit('delete_chunks', row_ids)
+        self.primary.delete_chunks(row_ids)
+
+    def close(self) -> Dict[str, Optional[Exception]]:
+        """
+        Wait for the secondaries to catch up and close sinks that need it (``close()``, e.g. ``SnapshotSink``).
+
+        Returns:
+            Dict[str, Optional[Exception]]: Error of each sink, None for the ones in sync
+        """
+        errors = {}
+        for name, writer in [(self.primary_name, self.primary)] + [(w.name, w.writer) for w in self.workers.values()]:
+            worker = self.workers.get(name)
+            if worker is not None:
+                worker.join()
+                if worker.error is not None:
+                    errors[name] = worker.error
+                    continue
+            try:
+                if hasattr(writer, 'close'):
+                    writer.close()
+                errors[name] = None
+            except Exception as e:
+                self.log(f"Sink {name} failed to close: {e}")
+                errors[name] = e
+            if worker is not None:
+                worker.error = errors[name]
+                worker._report()
+        return errors
+
+    def stats(self) -> Dict[str, Dict]:
+        stats = {self.primary_name: {'rows_written': self.primary_rows, 'lag_seconds': 0.0, 'error': None}}
+        for name, worker in self.workers.items():
+            stats[name] = {'rows_written': worker.rows_written, 'lag_seconds': round(worker.lag_seconds, 3),
+                           'error': str(worker.error) if worker.error else None}
+        return stats
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import sys
+from typing import Dict, List, Optional
+
+from embedding_backends import EmbeddingBackend
+from vector_snapshot import install_snapshot, iter_snapshot_batches, open_snapshot, snapshot_root, verify_snapshot
+
+# Rows per write when loading a snapshot into a store
+IMPORT_BATCH_ROWS = 1000
+
+
+def snapshot_space(manifest: Dict) -> EmbeddingBackend:
+    """The embedding space of a snapshot, in the form the stores' space checks take."""
+    space = EmbeddingBackend()
+    space.model = manifest['model']
+    space.dimension = manifest['dimension']
+    return space
+
+
+def checked_snapshot(root: str, version: Optional[str]) -> Dict:
+    """Manifest of a snapshot whose files match their checksums."""
+    problems = verify_snapshot(root, version)
+    if problems:
+        raise ValueError(f"Snapshot is not intact: {'; '.join(problems)}")
+    manifest, _, _ = open_snapshot(root, version)
+    return manifest
+
+
+def import_chroma(root: str, version: Optional[str] = None, collection_name: str = "bible_comments_rag") -> int:
+    """
+    Load a snapshot into a ChromaDB collection without embedding anything.
+
+    The collection records the snapshot's model and dimension, and one
+    holding vectors of another space is refused. Vectors are stored
+    L2-normalized, which ranks the same under cosine and L2 distance.
+
+    Returns:
+        int: Chunks written
+    """
+    from rag_indexer import ChromaChunkWriter, create_chroma_collection, ensure_collection_space
+    from sink_fanout import rows_to_records
+
+    manifest = checked_snapshot(root, version)
+    collection = create_chroma_collection(collection_name)
+    ensure_collection_space(collection, snapshot_space(manifest))
+    writer = ChromaChunkWriter(collection)
+    written = 0
+    for rows, embeddings in iter_snapshot_batches(root, manifest['version'], IMPORT_BATCH_ROWS):
+        written += writer.write_chunks(rows_to_records(rows), embeddings)
+    return written
+
+
+def import_postgres(root: str, version: Optional[str] = None, user_id: Optional[int] = None) -> int:
+    """
+    Load a snapshot into rag_chunks with COPY, without embedding anything.
+
+    Rows keep the user they were exported with (snapshots published from
+    Postgres carry it); ``user_id`` overrides it and is the default for
+    rows that have none. The table's recorded embedding space must match.
+
+    Returns:
+        int: Chunks written
+    """
+    from pg_bulk_writer import BulkChunkWriter
+    from rag_indexer_postgres import create_rag_table, ensure_table_space, ensure_user_partitions, get_engine
+    from sink_fanout import rows_to_records
+
+    manifest = checked_snapshot(root, version)
+    create_rag_table()
+    ensure_table_space(snapshot_space(manifest))
+    engine = get_engine()
+
+    writers: Dict[int, BulkChunkWriter] = {}
+    written = 0
+    for rows, embeddings in iter_snapshot_batches(root, manifest['version'], IMPORT_BATCH_ROWS):
+        by_user: Dict[int, List] = {}
+        for row, embedding in zip(rows, embeddings):
+            owner = user_id if user_id is not None else row.get('user_id', 1)
+            by_user.setdefault(owner, []).append((row, embedding))
+        for owner, items in by_user.items():
+            if owner not in writers:
+                ensure_user_partitions([owner])
+                writers[owner] = BulkChunkWriter(engine, owner)
+            written += writers[owner].write_chunks(rows_to_records([row for row, _ in items]),
+                                                   [embedding for _, embedding in items])
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect, verify, copy and bulk-load published vector snapshots")
+    parser.add_argument('--snapshot-dir', default=None, help="Snapshot root (RAG_SNAPSHOT_DIR)")
+    parser.add_argument('--version', default=None, help="Snapshot version (default: CURRENT)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('info', help="Print the manifest")
+    commands.add_parser('verify', help="Check every file against the manifest checksums")
+    install = commands.add_parser('install', help="Copy a snapshot from another root (e.g. shared storage) "
+                                                  "into --snapshot-dir, verify it and make it current")
+    install.add_argument('source', help="Snapshot root to copy from")
+    chroma = commands.add_parser('import-chroma', help="Bulk-load the snapshot into a ChromaDB collection")
+    chroma.add_argument('--collection', default="bible_comments_rag")
+    postgres = commands.add_parser('import-postgres', help="Bulk-load the snapshot into rag_chunks (DATABASE_URL)")
+    postgres.add_argument('--user-id', type=int, default=None,
+                          help="Owner of the imported rows (default: the user stored with each row, else 1)")
+    args = parser.parse_args()
+    root = args.snapshot_dir or snapshot_root()
+
+    try:
+        if args.command == 'info':
+            manifest, _, _ = open_snapshot(root, args.version)
+            print(json.dumps(manifest, indent=2))
+        elif args.command == 'verify':
+            problems = verify_snapshot(root, args.version)
+            for problem in problems:
+                print(problem)
+            if problems:
+                sys.exit(1)
+            print("Snapshot intact")
+        elif args.command == 'install':
+            print(f"Installed snapshot {install_snapshot(args.source, root, args.version)} in {root}")
+        elif args.command == 'import-chroma':
+            print(f"Imported {import_chroma(root, args.version, args.collection)} chunks into {args.collection}")
+        elif args.command == 'import-postgres':
+            print(f"Imported {import_postgres(root, args.version, args.user_id)} chunks into rag_chunks")
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
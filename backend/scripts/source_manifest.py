@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+
+def file_content_hash(file_path: str, block_size: int = 1024 * 1024) -> str:
+    """Hash a file's bytes without loading it into memory at once."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_hash(chunk: str) -> str:
+    return hashlib.sha256(chunk.encode('utf-8')).hexdigest()
+
+
+def source_document_id(source_path: str) -> str:
+    """Stable document id for a source that was not given one, derived from its path or URL."""
+    if '://' not in source_path:
+        source_path = os.path.normpath(source_path)
+    return "doc_" + hashlib.sha256(source_path.encode('utf-8')).hexdigest()[:16]
+
+
+def chunk_row_id(document_id: str, chunk_digest: str) -> str:
+    """
+    Row identifier for a chunk, following the ``<document>_chunk_<n>`` convention used by the server.
+
+    The id depends only on the source and the chunk content, so re-indexing
+    the same text produces the same ids and writers can upsert instead of
+    appending duplicates.
+    """
+    return f"{document_id}_chunk_{chunk_digest[:16]}"
+
+
+class SourceEntry:
+    """What the index currently holds for one source."""
+
+    def __init__(self, source_key: str, document_id: str, size: Optional[int], mtime: Optional[float],
+                 content_hash: str, chunker_params: Dict, chunk_hashes: List[str]):
+        self.source_key = source_key
+        self.document_id = document_id
+        self.size = size
+        self.mtime = mtime
+        self.content_hash = content_hash
+        self.chunker_params = chunker_params
+        self.chunk_hashes = chunk_hashes
+
+    def matches_stat(self, size: int, mtime: float, chunker_params: Dict) -> bool:
+        return self.size == size and self.mtime == mtime and self.chunker_params == chunker_params
+
+
+class SourceManifest:
+    """
+    Per-source manifest (path, size, mtime, content hash, chunker params and
+    chunk hashes) stored next to the index it describes.
+
+    Works on any SQLAlchemy engine: the Postgres indexer keeps it in the same
+    database as ``rag_chunks`` and the Chroma indexer in a SQLite file beside
+    the collection. ``scope`` separates independent indexes sharing one table
+    (for example one per user).
+    """
+
+    def __init__(self, engine, scope: str):
+        from sqlalchemy import text
+
+        self.engine = engine
+        self.scope = scope
+        with engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS rag_sources (
+                    scope VARCHAR(255) NOT NULL,
+                    source_key VARCHAR(1000) NOT NULL,
+                    document_id VARCHAR(255) NOT NULL,
+                    size BIGINT,
+                    mtime DOUBLE PRECISION,
+                    content_hash VARCHAR(64) NOT NULL,
+                    chunker_params TEXT NOT NULL,
+                    chunk_hashes TEXT NOT NULL,
+                    updated_at DOUBLE PRECISION NOT NULL,
+                    PRIMARY KEY (scope, source_key)
+                )
+            """))
+
+    def get(self, source_key: str) -> Optional[SourceEntry]:
+        from sqlalchemy import text
+
+        with self.engine.connect() as conn:
+            row = conn.execute(text("""
+                SELECT document_id, size, mtime, content_hash, chunker_params, chunk_hashes
+                FROM rag_sources WHERE scope = :scope AND source_key = :source_key
+            """), {'scope': self.scope, 'source_key': source_key}).fetchone()
+        if row is None:
+            return None
+        return SourceEntry(source_key, row[0], row[1], row[2], row[3],
+                           json.loads(row[4]), json.loads(row[5]))
+
+    def put(self, entry: SourceEntry):
+        from sqlalchemy import text
+
+        params = {
+            'scope': self.scope,
+            'source_key': entry.source_key,
+            'document_id': entry.document_id,
+            'size': entry.size,
+            'mtime': entry.mtime,
+            'content_hash': entry.content_hash,
+            'chunker_params': json.dumps(entry.chunker_params, sort_keys=True),
+            'chunk_hashes': json.dumps(entry.chunk_hashes),
+            'updated_at': time.time(),
+        }
+        with self.engine.begin() as conn:
+            conn.execute(text("DELETE FROM rag_sources WHERE scope = :scope AND source_key = :source_key"), params)
+            conn.execute(text("""
+                INSERT INTO rag_sources (scope, source_key, document_id, size, mtime, content_hash,
+                                         chunker_params, chunk_hashes, updated_at)
+                VALUES (:scope, :source_key, :document_id, :size, :mtime, :content_hash,
+                        :chunker_params, :chunk_hashes, :updated_at)
+            """), params)
+
+
+def stat_source(source_path: str):
+    """Return (size, mtime) for a local file."""
+    stat = os.stat(source_path)
+    return stat.st_size, stat.st_mtime
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import random
+from typing import Dict, List
+
+BOOKS = ("Gênesis", "Êxodo", "Salmos", "Provérbios", "Isaías", "Mateus", "Marcos", "Lucas", "João", "Atos",
+         "Romanos", "Gálatas", "Efésios", "Filipenses", "Hebreus", "Tiago", "Apocalipse")
+
+SUBJECTS = ("Deus", "o Senhor", "Cristo", "o Espírito Santo", "a igreja", "o apóstolo", "o profeta",
+            "o povo de Israel", "o pregador", "o crente", "a graça divina", "a palavra")
+VERBS = ("revela", "ensina", "demonstra", "confirma", "anuncia", "lembra", "exorta", "promete", "estabelece",
+         "transforma", "sustenta", "chama")
+OBJECTS = ("a fidelidade da aliança", "o perdão dos pecados", "a esperança da ressurreição", "o amor ao próximo",
+           "a soberania sobre a criação", "a santidade de vida", "a justificação pela fé", "o reino dos céus",
+           "a perseverança na tribulação", "a unidade do corpo", "a humildade do servo", "a alegria da salvação")
+CLAUSES = ("no contexto original", "segundo o texto hebraico", "conforme o grego do Novo Testamento",
+           "à luz de toda a Escritura", "para a igreja de hoje", "na vida prática", "como aplicação pastoral",
+           "em meio às provações")
+
+# Repeated on every page like the navigation and footers of scraped sites
+BOILERPLATE = "Comentário Bíblico · Estudos em português · Todos os direitos reservados."
+
+
+def reference(rng: random.Random) -> str:
+    return f"{rng.choice(BOOKS)} {rng.randint(1, 50)}:{rng.randint(1, 30)}"
+
+
+def sentence(rng: random.Random) -> str:
+    text = f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {rng.choice(OBJECTS)} {rng.choice(CLAUSES)}"
+    if rng.random() < 0.3:
+        text += f" ({reference(rng)})"
+    return text[0].upper() + text[1:] + "."
+
+
+def paragraph(rng: random.Random) -> str:
+    return " ".join(sentence(rng) for _ in range(rng.randint(3, 9)))
+
+
+def commentary_pages(size_bytes: int, seed: int = 7, paragraphs_per_page: int = 6) -> List[str]:
+    """
+    Generate commentary-like Portuguese text split into pages.
+
+    Args:
+        size_bytes (int): Approximate total UTF-8 size
+        seed (int): Random seed; the same seed always yields the same corpus
+        paragraphs_per_page (int): Paragraphs per page
+
+    Returns:
+        List[str]: Page texts, each starting with a heading and ending with boilerplate
+    """
+    rng = random.Random(seed)
+    pages = []
+    total = 0
+    while total < size_bytes:
+        lines = [f"{reference(rng)} — Comentário"]
+        lines.extend(paragraph(rng) for _ in range(paragraphs_per_page))
+        lines.append(BOILERPLATE)
+        page = "\n\n".join(lines)
+        pages.append(page)
+        total += len(page.encode('utf-8'))
+    return pages
+
+
+def write_txt(path: str, pages: List[str]):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("\n\n".join(pages))
+
+
+def write_docx(path: str, pages: List[str]):
+    from docx import Document
+
+    document = Document()
+    for page in pages:
+        for block in page.split("\n\n"):
+            document.add_paragraph(block)
+    document.save(path)
+
+
+def _pdf_string(text: str) -> bytes:
+    data = text.encode('cp1252', errors='replace')
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def _wrap(text: str, width: int) -> List[str]:
+    lines, current = [], ""
+    for word in text.split():
+        if current and len(current) + 1 + len(word) > width:
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        lines.append(current)
+    return lines
+
+
+def write_pdf(path: str, pages: List[str], line_width: int = 95):
+    """
+    Write a minimal text-only PDF, one page per item, without third-party libraries.
+
+    Text uses the built-in Helvetica font with WinAnsiEncoding, so Portuguese
+    accents survive extraction.
+    """
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page objects are numbered
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    page_ids = []
+    for page in pages:
+        lines = []
+        for block in page.split("\n\n"):
+            lines.extend(_wrap(block, line_width))
+            lines.append("")
+        content = [b"BT /F1 8 Tf 10 TL 40 800 Td"]
+        for line in lines:
+            content.append(_pdf_string(line) + b" Tj T*")
+        content.append(b"ET")
+        stream = b"\n".join(content)
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 %d] /Resources << /Font << /F1 3 0 R >> >> "
+                       b"/Contents %d 0 R >>" % (max(842, 40 + 10 * len(lines)), content_id))
+        page_ids.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids)
+
+    with open(path, 'wb') as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+WRITERS = {'txt': write_txt, 'pdf': write_pdf, 'docx': write_docx}
+
+
+def generate_corpus(directory: str, size_mb: float, formats: List[str], files_per_format: int = 1,
+                    seed: int = 7) -> Dict[str, List[str]]:
+    """
+    Write a synthetic corpus of about ``size_mb`` megabytes of text per format.
+
+    Args:
+        directory (str): Output directory
+        size_mb (float): Text size per format, split across ``files_per_format`` files
+        formats (List[str]): Any of 'txt', 'pdf', 'docx'
+        files_per_format (int): Number of files per format
+        seed (int): Base random seed
+
+    Returns:
+        Dict[str, List[str]]: Written file paths by format
+    """
+    os.makedirs(directory, exist_ok=True)
+    size_per_file = int(size_mb * 1e6 / files_per_format)
+    written = {}
+    for extension in formats:
+        if extension not in WRITERS:
+            raise ValueError(f"Unsupported corpus format: {extension}")
+        written[extension] = []
+        for index in range(files_per_format):
+            path = os.path.join(directory, f"comentario_{index:03d}.{extension}")
+            WRITERS[extension](path, commentary_pages(size_per_file, seed + index))
+            written[extension].append(path)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic Portuguese commentary corpus")
+    parser.add_argument('directory')
+    parser.add_argument('--size-mb', type=float, default=5.0, help="Text size per format")
+    parser.add_argument('--formats', default='txt,pdf,docx')
+    parser.add_argument('--files', type=int, default=1, help="Files per format")
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.directory, args.size_mb, args.formats.split(','), args.files, args.seed)
+    for extension, paths in corpus.items():
+        for path in paths:
+            print(f"{path} ({os.path.getsize(path) / 1e6:.1f} MB)")
@@ -0,0 +1,190 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from indexing_metrics import RunMetrics
+
+# Sources are handed out in slices of about this many bytes, so a large
+# library goes back in line between slices instead of holding a worker
+DEFAULT_SLICE_BYTES = 64 * 1024 * 1024
+
+
+def source_bytes(source: Dict[str, str]) -> int:
+    """Size used to share out work; sources that cannot be sized count as one byte."""
+    try:
+        return max(1, os.path.getsize(source['path']))
+    except (KeyError, OSError):
+        return 1
+
+
+def slice_sources(sources: List[Dict[str, str]], slice_bytes: int) -> List[List[Dict[str, str]]]:
+    """Cut a library into consecutive slices of at least ``slice_bytes`` (the last may be smaller)."""
+    slices, current, size = [], [], 0
+    for source in sources:
+        current.append(source)
+        size += source_bytes(source)
+        if size >= slice_bytes:
+            slices.append(current)
+            current, size = [], 0
+    if current:
+        slices.append(current)
+    return slices
+
+
+class TenantQueue:
+    """Pending slices of one tenant's library and what has been done for it so far."""
+
+    def __init__(self, tenant: int, slices: List[List[Dict[str, str]]], weight: float = 1.0, served: float = 0.0):
+        self.tenant = tenant
+        self.pending = deque(slices)
+        self.slices_total = len(slices)
+        self.weight = weight
+        # Bytes handed out divided by weight: the fair-share clock
+        self.served = served
+        self.running = False
+        self.slices_done = 0
+        self.bytes_done = 0
+        self.chunks_indexed = 0
+        self.busy_seconds = 0.0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.error: Optional[Exception] = None
+
+    @property
+    def pending_bytes(self) -> int:
+        return sum(source_bytes(source) for part in self.pending for source in part)
+
+    @property
+    def done(self) -> bool:
+        return not self.pending and not self.running
+
+    def stats(self) -> Dict:
+        elapsed = (self.finished_at or time.time()) - self.started_at if self.started_at else 0.0
+        return {
+            'slices_done': self.slices_done,
+            'slices_queued': len(self.pending),
+            'bytes_done': self.bytes_done,
+            'bytes_queued': self.pending_bytes,
+            'chunks_indexed': self.chunks_indexed,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'chunks_per_second': round(self.chunks_indexed / self.busy_seconds, 2) if self.busy_seconds else 0.0,
+            'elapsed_seconds': round(elapsed, 3),
+            'error': str(self.error) if self.error else None,
+        }
+
+
+class FairScheduler:
+    """
+    Indexes many tenants' libraries on a fixed pool of workers without letting one starve the others.
+
+    Each library is cut into slices of about ``slice_bytes``. A tenant has at
+    most one slice in flight, since its manifest and checkpoint journal have a
+    single writer, and a free worker takes the next slice of the waiting
+    tenant that has been served least so far (bytes handed out divided by
+    its weight, as in start-time fair queuing). A small library is finished
+    after a slice or two even while a large one is being indexed, and the
+    large one still advances every round.
+
+    ``run_slice(tenant, sources)`` does the work and returns the pipeline
+    counters. A tenant whose slice raises is stopped, the others carry on.
+    Per-tenant throughput and queue depth are logged after every slice and
+    reported to ``metrics`` as gauges labelled with the user.
+    """
+
+    def __init__(self, run_slice: Callable[[int, List[Dict[str, str]]], Dict[str, int]], workers: int = 4,
+                 slice_bytes: int = DEFAULT_SLICE_BYTES, metrics: Optional[RunMetrics] = None,
+                 log: Callable[[str], None] = print):
+        self.run_slice = run_slice
+        self.workers = max(1, workers)
+        self.slice_bytes = slice_bytes
+        self.metrics = metrics
+        self.log = log
+        self.tenants: Dict[int, TenantQueue] = {}
+        self._condition = threading.Condition()
+
+    def add(self, tenant: int, sources: List[Dict[str, str]], weight: float = 1.0):
+        """Queue a tenant's library; a tenant joining late starts level with the least-served one."""
+        with self._condition:
+            active = [queue.served for queue in self.tenants.values() if not queue.done]
+            self.tenants[tenant] = TenantQueue(tenant, slice_sources(sources, self.slice_bytes), weight,
+                                               served=min(active) if active else 0.0)
+            self._report(self.tenants[tenant])
+            self._condition.notify_all()
+
+    def _next(self) -> Optional[TenantQueue]:
+        waiting = [queue for queue in self.tenants.values() if queue.pending and not queue.running]
+        return min(waiting, key=lambda queue: queue.served) if waiting else None
+
+    def _report(self, queue: TenantQueue):
+        if self.metrics is None:
+            return
+        labels = {'user': str(queue.tenant)}
+        stats = queue.stats()
+        for name in ('slices_queued', 'bytes_queued', 'bytes_done', 'chunks_indexed', 'chunks_per_second'):
+            self.metrics.set_labeled_gauge(f"tenant_{name}", labels, stats[name])
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while True:
+                    queue = self._next()
+                    if queue is not None:
+                        break
+                    if all(tenant.done for tenant in self.tenants.values()):
+                        return
+                    self._condition.wait()
+                part = queue.pending.popleft()
+                size = sum(source_bytes(source) for source in part)
+                queue.running = True
+                queue.served += size / queue.weight
+                if queue.started_at is None:
+                    queue.started_at = time.time()
+
+            started = time.perf_counter()
+            stats, error = {}, None
+            try:
+                stats = self.run_slice(queue.tenant, part)
+            except Exception as e:
+                error = e
+
+            with self._condition:
+                queue.running = False
+                queue.busy_seconds += time.perf_counter() - started
+                if error is None:
+                    queue.slices_done += 1
+                    queue.bytes_done += size
+                    queue.chunks_indexed += stats.get('chunks_indexed', 0)
+                else:
+                    queue.error = error
+                    queue.pending.clear()
+                if queue.done:
+                    queue.finished_at = time.time()
+                self._report(queue)
+                summary = queue.stats()
+                self._condition.notify_all()
+
+            if error is None:
+                self.log(f"User {queue.tenant}: slice {summary['slices_done']}/{queue.slices_total} done, "
+                         f"{summary['chunks_indexed']} chunks at {summary['chunks_per_second']} chunks/s, "
+                         f"{summary['slices_queued']} slices ({summary['bytes_queued'] / 1e6:.1f} MB) queued")
+            else:
+                self.log(f"User {queue.tenant}: stopped after an error: {error}")
+            if self.metrics is not None:
+                self.metrics.event('tenant_slice_done', user=queue.tenant, **summary)
+
+    def run(self) -> Dict[int, Dict]:
+        """
+        Index every queued library.
+
+        Returns:
+            Dict[int, Dict]: Per tenant stats (see ``TenantQueue.stats``)
+        """
+        threads = [threading.Thread(target=self._worker, name=f'tenant-worker-{i}', daemon=True)
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return {tenant: queue.stats() for tenant, queue in self.tenants.items()}
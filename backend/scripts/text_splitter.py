@@ -0,0 +1,105 @@
+from collections import deque
+from typing import List, Sequence
+
+DEFAULT_SEPARATORS = ("\n\n", "\n", ". ", " ", "")
+
+
+def _split_keeping_separator(text: str, separator: str) -> List[str]:
+    """Split on a literal separator, gluing each separator to the piece that follows it."""
+    if not separator:
+        return list(text)
+    parts = text.split(separator)
+    pieces = [parts[0]]
+    pieces.extend(separator + part for part in parts[1:])
+    return [piece for piece in pieces if piece]
+
+
+class RecursiveTextSplitter:
+    """
+    Dependency-free equivalent of langchain's ``RecursiveCharacterTextSplitter``.
+
+    Produces the same chunks as langchain with ``keep_separator=True``,
+    ``strip_whitespace=True``, ``length_function=len`` and literal (non-regex)
+    separators: text is split on the first separator it contains, pieces
+    that are still too long are split recursively with the remaining
+    separators, and the short pieces are merged greedily into chunks of at
+    most ``chunk_size`` characters that overlap by up to ``chunk_overlap``.
+
+    The merge keeps a running window in a deque with a running length, so
+    each piece is added and dropped once and splitting stays linear in the
+    size of the text.
+    """
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200,
+                 separators: Sequence[str] = DEFAULT_SEPARATORS):
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"Chunk overlap ({chunk_overlap}) is larger than chunk size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = list(separators)
+
+    def split_text(self, text: str) -> List[str]:
+        """
+        Split text into chunks.
+
+        Args:
+            text (str): Text to split
+
+        Returns:
+            List[str]: Chunks in document order
+        """
+        chunks = []
+        self._split(text, 0, chunks)
+        return chunks
+
+    def _split(self, text: str, level: int, chunks: List[str]):
+        separators = self.separators
+        separator = separators[-1]
+        next_level = len(separators)
+        for i in range(level, len(separators)):
+            if separators[i] == "":
+                separator = ""
+                break
+            if separators[i] in text:
+                separator = separators[i]
+                next_level = i + 1
+                break
+
+        good = []
+        for piece in _split_keeping_separator(text, separator):
+            if len(piece) < self.chunk_size:
+                good.append(piece)
+                continue
+            if good:
+                self._merge(good, chunks)
+                good = []
+            if next_level >= len(separators):
+                chunks.append(piece)
+            else:
+                self._split(piece, next_level, chunks)
+        if good:
+            self._merge(good, chunks)
+
+    def _merge(self, pieces: List[str], chunks: List[str]):
+        # Separators are kept on the pieces, so they are joined with ""
+        window = deque()
+        total = 0
+        for piece in pieces:
+            length = len(piece)
+            if total + length > self.chunk_size and window:
+                chunk = "".join(window).strip()
+                if chunk:
+                    chunks.append(chunk)
+                while window and (total > self.chunk_overlap or total + length > self.chunk_size):
+                    total -= len(window.popleft())
+            window.append(piece)
+            total += length
+        chunk = "".join(window).strip()
+        if chunk:
+            chunks.append(chunk)
+
+
+def split_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 200,
+               separators: Sequence[str] = DEFAULT_SEPARATORS) -> List[str]:
+    """Split text with a ``RecursiveTextSplitter`` built from the given parameters."""
+    return RecursiveTextSplitter(chunk_size, chunk_overlap, separators).split_text(text)
@@ -0,0 +1,132 @@
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+# Rows of int8 codes widened to float32 at a time while scanning; small
+# enough for the widened block to stay in cache between conversion and BLAS
+SCAN_BLOCK_ROWS = 4096
+
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def quantize_int8(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-row scalar quantization.
+
+    Each row is divided by ``max(|x|) / 127`` and rounded, so a row costs
+    ``dimension`` bytes plus one float32 scale instead of ``4 * dimension``
+    bytes, and ``codes * scale`` reconstructs it to within half a step.
+
+    Args:
+        matrix (np.ndarray): (n, dimension) float vectors
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (n, dimension) int8 codes and (n,) float32 scales
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    scales = np.abs(matrix).max(axis=-1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(matrix / scales[..., None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize_int8(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return codes.astype(np.float32) * scales[..., None]
+
+
+def bit_code_bytes(dimension: int) -> int:
+    """Bytes per packed sign code, padded to whole 64-bit words for the popcount scan."""
+    return (dimension + 63) // 64 * 8
+
+
+def sign_bits(matrix: np.ndarray) -> np.ndarray:
+    """
+    1-bit sign codes: bit i is set when component i is positive.
+
+    Returns:
+        np.ndarray: (n, bit_code_bytes(dimension)) uint8, zero-padded
+    """
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    packed = np.packbits(matrix > 0, axis=1)
+    width = bit_code_bytes(matrix.shape[1])
+    if packed.shape[1] < width:
+        packed = np.pad(packed, ((0, 0), (0, width - packed.shape[1])))
+    return packed
+
+
+def hamming_distances(codes: np.ndarray, query_bits: np.ndarray) -> np.ndarray:
+    """
+    Hamming distance from one packed query code to every row of ``codes``.
+
+    Args:
+        codes (np.ndarray): (n, bytes) uint8 codes from ``sign_bits``
+        query_bits (np.ndarray): (bytes,) uint8 query code
+
+    Returns:
+        np.ndarray: (n,) distances
+    """
+    if codes.shape[1] % 8 == 0:
+        # XOR and popcount over 64-bit words
+        diff = codes.view(np.uint64) ^ query_bits.view(np.uint64)
+    else:
+        diff = codes ^ query_bits
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(diff).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT[diff.view(np.uint8)].sum(axis=1, dtype=np.int32)
+
+
+def int8_scores(codes: np.ndarray, scales: np.ndarray, query: np.ndarray,
+                block_rows: int = SCAN_BLOCK_ROWS) -> np.ndarray:
+    """
+    Approximate dot products of a float query with int8-coded rows.
+
+    Codes are widened to float32 one block at a time, so only
+    ``block_rows * dimension`` floats exist at once however large the index.
+    """
+    scores = np.empty(codes.shape[0], dtype=np.float32)
+    query = np.asarray(query, dtype=np.float32)
+    for start in range(0, codes.shape[0], block_rows):
+        block = codes[start:start + block_rows]
+        scores[start:start + len(block)] = (block.astype(np.float32) @ query) * scales[start:start + len(block)]
+    return scores
+
+
+def top_k(scores: np.ndarray, k: int, largest: bool = True) -> np.ndarray:
+    """Indices of the k best scores, best first."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    keyed = -scores if largest else scores
+    top = np.argpartition(keyed, k - 1)[:k]
+    return top[np.argsort(keyed[top], kind='stable')]
+
+
+def recall_at_k(approximate: Sequence[Sequence[int]], exact: Sequence[Sequence[int]]) -> float:
+    """Mean fraction of each exact top-k found in the approximate top-k."""
+    if not exact:
+        return 1.0
+    found = [len(set(a) & set(e)) / len(e) for a, e in zip(approximate, exact) if len(e)]
+    return float(np.mean(found)) if found else 1.0
+
+
+def postgres_code_columns(embeddings: Sequence[Sequence[float]]) -> List[Tuple[str, float, str]]:
+    """
+    Codes of a batch of embeddings in Postgres text input form.
+
+    Returns:
+        List[Tuple[str, float, str]]: Per embedding, the int8 codes as a
+        ``\\x`` bytea hex literal, their scale, and the sign code as a
+        ``bit(N)`` literal
+    """
+    matrix = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+    codes, scales = quantize_int8(matrix)
+    # b'0' / b'1' per component
+    bits = (matrix > 0).astype(np.uint8) + ord('0')
+    return [('\\x' + code.tobytes().hex(), float(scale), row.tobytes().decode('ascii'))
+            for code, scale, row in zip(codes, scales, bits)]
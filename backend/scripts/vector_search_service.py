@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from embedding_backends import api_key_from_env, needs_api_key
+from lexical_index import fuse_scores
+from vector_quantization import hamming_distances, int8_scores, recall_at_k, sign_bits, top_k
+from vector_snapshot import current_version, open_quantized, open_snapshot, snapshot_root
+
+SEARCH_MODES = ('exact', 'int8', 'binary')
+
+# Shortlist size per result re-ranked with the float vectors, by coarse mode
+DEFAULT_RERANK = {'int8': 4, 'binary': 40}
+
+# Candidates per result taken from each side of a hybrid query before fusion
+HYBRID_DEPTH = 10
+
+
+class VectorIndex:
+    """
+    Warm top-k search over a published snapshot.
+
+    The snapshot matrix is memory-mapped read-only, so every worker process
+    serving the same version shares one copy in the page cache. Rows are
+    stored pre-normalized, which makes cosine similarity a single
+    matrix-vector product followed by ``argpartition``.
+
+    The ``int8`` and ``binary`` modes scan the snapshot's quantized codes
+    instead (int8 dot products or Hamming distances of sign bits) and re-rank
+    a shortlist of ``k * rerank`` rows with the exact float vectors, so only
+    the codes and the shortlisted rows are read from the mapped files.
+
+    Snapshots published from Postgres hold every user's chunks, each row
+    carrying its ``user_id``. Searching one of them requires a ``user_id``,
+    and every mode scans only that user's rows, so no tenant ever sees
+    another's chunks.
+    """
+
+    def __init__(self, root: str, version: Optional[str] = None):
+        self.root = root
+        self.manifest, self.matrix, self.chunks = open_snapshot(root, version)
+        self.version = self.manifest['version']
+        self.quantized = open_quantized(root, self.manifest)
+        self._rows = None
+        self._user_rows = None
+
+    @property
+    def modes(self) -> List[str]:
+        return ['exact'] + [mode for mode in SEARCH_MODES if mode in self.quantized]
+
+    @property
+    def dimension(self) -> int:
+        return self.manifest['dimension']
+
+    def _normalize(self, queries: np.ndarray) -> np.ndarray:
+        if queries.shape[-1] != self.dimension:
+            raise ValueError(f"Query dimension {queries.shape[-1]} does not match index dimension {self.dimension}")
+        norms = np.linalg.norm(queries, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return queries / norms
+
+    @property
+    def multi_tenant(self) -> bool:
+        """Whether rows carry the user they belong to (snapshots published from Postgres)."""
+        return bool(self.chunks) and 'user_id' in self.chunks[0]
+
+    def user_rows(self, user_id: Optional[int]) -> Optional[np.ndarray]:
+        """
+        Sorted row indices a user may search; None for every row of a single-tenant snapshot.
+
+        Raises:
+            ValueError: If the snapshot is multi-tenant and no user is given
+        """
+        if not self.multi_tenant:
+            return None
+        if user_id is None:
+            raise ValueError("This snapshot holds several users' chunks; give user_id")
+        if self._user_rows is None:
+            by_user = {}
+            for i, chunk in enumerate(self.chunks):
+                by_user.setdefault(chunk.get('user_id'), []).append(i)
+            self._user_rows = {user: np.asarray(rows, dtype=np.int64) for user, rows in by_user.items()}
+        return self._user_rows.get(int(user_id), np.empty(0, dtype=np.int64))
+
+    def _top_k(self, scores: np.ndarray, k: int, rows: Optional[np.ndarray] = None) -> List[Dict]:
+        best = top_k(scores, k)
+        return [dict(self.chunks[i if rows is None else rows[i]], score=float(scores[i])) for i in best]
+
+    def _shortlist(self, query: np.ndarray, size: int, mode: str, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        if mode == 'int8':
+            codes, scales = self.quantized['int8']
+            if rows is not None:
+                return rows[top_k(int8_scores(codes[rows], scales[rows], query), size)]
+            return top_k(int8_scores(codes, scales, query), size)
+        bits, = self.quantized['binary']
+        if rows is not None:
+            return rows[top_k(hamming_distances(bits[rows], sign_bits(query)[0]), size, largest=False)]
+        return top_k(hamming_distances(bits, sign_bits(query)[0]), size, largest=False)
+
+    def nearest(self, query: np.ndarray, k: int, mode: str = 'exact', rerank: Optional[int] = None,
+                rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Row indices of the k nearest rows to a normalized query, best first.
+
+        Args:
+            query (np.ndarray): Normalized query vector
+            k (int): Number of results
+            mode (str): 'exact', or 'int8' / 'binary' for a coarse scan plus re-ranking
+            rerank (Optional[int]): Shortlist size as a multiple of k (default per mode)
+            rows (Optional[np.ndarray]): Only consider these rows (see ``user_rows``)
+
+        Returns:
+            np.ndarray: Row indices
+        """
+        if rows is not None and not len(rows):
+            return rows
+        if mode == 'exact':
+            if rows is not None:
+                return rows[top_k(self.matrix[rows] @ query, k)]
+            return top_k(self.matrix @ query, k)
+        if mode not in self.quantized:
+            raise ValueError(f"Search mode {mode!r} not available; snapshot has {', '.join(self.modes)}")
+        candidates = np.sort(self._shortlist(query, k * (rerank or DEFAULT_RERANK[mode]), mode, rows))
+        # Exact scores for the shortlist only; sorted rows read the mapping in order
+        return candidates[top_k(self.matrix[candidates] @ query, k)]
+
+    def _results(self, query: np.ndarray, k: int, mode: str, rerank: Optional[int],
+                 rows: Optional[np.ndarray] = None) -> List[Dict]:
+        rows = self.nearest(query, k, mode, rerank, rows)
+        scores = self.matrix[rows] @ query if len(rows) else []
+        return [dict(self.chunks[i], score=float(score)) for i, score in zip(rows, scores)]
+
+    def search(self, embedding: List[float], k: int = 5, mode: str = 'exact',
+               rerank: Optional[int] = None, user_id: Optional[int] = None) -> List[Dict]:
+        """
+        Return the k most similar chunks for one query embedding.
+
+        Args:
+            embedding (List[float]): Query vector
+            k (int): Number of results
+            mode (str): 'exact', 'int8' or 'binary' (see ``nearest``)
+            rerank (Optional[int]): Shortlist multiple for the coarse modes
+            user_id (Optional[int]): Whose chunks to search; required for multi-tenant snapshots
+
+        Returns:
+            List[Dict]: Chunk metadata with a cosine ``score``, best first
+        """
+        query = self._normalize(np.asarray(embedding, dtype=np.float32))
+        rows = self.user_rows(user_id)
+        if mode == 'exact' and rows is None:
+            return self._top_k(self.matrix @ query, k)
+        return self._results(query, k, mode, rerank, rows)
+
+    def search_batch(self, embeddings: List[List[float]], k: int = 5, mode: str = 'exact',
+                     rerank: Optional[int] = None, user_id: Optional[int] = None) -> List[List[Dict]]:
+        """Answer many queries; exact mode uses one matrix-matrix product."""
+        if not embeddings:
+            return []
+        queries = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        rows = self.user_rows(user_id)
+        if mode != 'exact':
+            return [self._results(query, k, mode, rerank, rows) for query in queries]
+        scores = queries @ (self.matrix if rows is None else self.matrix[rows]).T
+        return [self._top_k(row, k, rows) for row in scores]
+
+    @property
+    def rows(self) -> Dict[str, int]:
+        """Row number of each chunk id, built on first use."""
+        if self._rows is None:
+            self._rows = {chunk['id']: i for i, chunk in enumerate(self.chunks)}
+        return self._rows
+
+    def owned_hits(self, hits: List[Tuple[str, float]], user_id: Optional[int]) -> List[Tuple[str, float]]:
+        """Keep (chunk id, score) hits that are in the snapshot and, if it is multi-tenant, belong to the user."""
+        rows = self.rows
+        if not self.multi_tenant:
+            return [(chunk_id, score) for chunk_id, score in hits if chunk_id in rows]
+        if user_id is None:
+            raise ValueError("This snapshot holds several users' chunks; give user_id")
+        return [(chunk_id, score) for chunk_id, score in hits
+                if chunk_id in rows and self.chunks[rows[chunk_id]].get('user_id') == int(user_id)]
+
+    def hybrid_search(self, embedding: List[float], lexical_hits: List[Tuple[str, float]], k: int = 5,
+                      alpha: float = 0.5, prefilter: bool = False, mode: str = 'exact',
+                      rerank: Optional[int] = None, user_id: Optional[int] = None) -> List[Dict]:
+        """
+        Fuse dense similarity with BM25 scores (see ``lexical_index.fuse_scores``).
+
+        Args:
+            embedding (List[float]): Query vector
+            lexical_hits (List[Tuple[str, float]]): (chunk id, BM25 score) from ``LexicalIndex.search``
+            k (int): Number of results
+            alpha (float): Weight of the dense score, 1 - alpha goes to BM25
+            prefilter (bool): Score only the lexical hits against the query
+                vector instead of also running a dense scan; falls back to
+                dense search when nothing matches lexically
+            mode (str): Dense search mode when not prefiltering
+            rerank (Optional[int]): Shortlist multiple for the coarse modes
+            user_id (Optional[int]): Whose chunks to search; required for multi-tenant snapshots
+
+        Returns:
+            List[Dict]: Chunk metadata with fused ``score``, ``dense_score`` and ``lexical_score``
+        """
+        query = self._normalize(np.asarray(embedding, dtype=np.float32))
+        lexical = dict(self.owned_hits(lexical_hits, user_id))
+        lexical_rows = [self.rows[chunk_id] for chunk_id in lexical]
+        if prefilter and lexical:
+            candidates = np.unique(lexical_rows)
+        else:
+            candidates = np.union1d(self.nearest(query, k * HYBRID_DEPTH, mode, rerank, self.user_rows(user_id)),
+                                    np.asarray(lexical_rows, dtype=np.int64))
+        scores = self.matrix[candidates] @ query if len(candidates) else []
+        dense = {self.chunks[i]['id']: float(score) for i, score in zip(candidates, scores)}
+        return [dict(self.chunks[self.rows[chunk_id]], score=score, dense_score=dense[chunk_id],
+                     lexical_score=lexical.get(chunk_id, 0.0))
+                for chunk_id, score in fuse_scores(dense, lexical, alpha)[:k]]
+
+    def storage_bytes(self) -> Dict[str, int]:
+        """Bytes scanned per mode: the float matrix, or the codes (plus scales)."""
+        sizes = {'exact': self.matrix.nbytes}
+        for mode, arrays in self.quantized.items():
+            sizes[mode] = sum(array.nbytes for array in arrays)
+        return sizes
+
+
+def evaluate_modes(index: VectorIndex, queries: np.ndarray, k: int = 10,
+                   rerank: Optional[int] = None) -> Dict[str, Dict]:
+    """
+    Recall@k of each search mode against exact search, with latency and scanned bytes.
+
+    Args:
+        index (VectorIndex): Index to evaluate
+        queries (np.ndarray): (n, dimension) query vectors
+        k (int): Results per query
+        rerank (Optional[int]): Shortlist multiple for the coarse modes
+
+    Returns:
+        Dict[str, Dict]: Per mode: recall_at_k, ms_per_query, bytes
+    """
+    queries = index._normalize(np.asarray(queries, dtype=np.float32))
+    storage = index.storage_bytes()
+    report, exact = {}, None
+    for mode in index.modes:
+        started = time.perf_counter()
+        results = [index.nearest(query, k, mode, rerank).tolist() for query in queries]
+        elapsed = time.perf_counter() - started
+        if exact is None:
+            exact = results
+        report[mode] = {
+            'recall_at_k': round(recall_at_k(results, exact), 4),
+            'ms_per_query': round(elapsed / max(1, len(queries)) * 1000, 3),
+            'bytes': storage[mode],
+        }
+    return report
+
+
+def request_user(body: Dict) -> Optional[int]:
+    return int(body['user_id']) if body.get('user_id') is not None else None
+
+
+class SearchService:
+    """Holds the current ``VectorIndex`` and swaps it when a new snapshot is published."""
+
+    def __init__(self, root: str, embedder=None, reload_interval: float = 5.0, mode: str = 'exact',
+                 lexical=None, verses=None):
+        self.root = root
+        self.embedder = embedder
+        self.mode = mode
+        self.lexical = lexical
+        self.verses = verses
+        self._user_indexes = {}
+        self.reload_interval = reload_interval
+        self.index = VectorIndex(root)
+        print(f"Loaded snapshot {self.index.version} ({self.index.manifest['count']} chunks)")
+
+    def watch(self):
+        """Poll ``CURRENT`` and hot-swap the index; in-flight queries keep the old one."""
+        while True:
+            time.sleep(self.reload_interval)
+            try:
+                version = current_version(self.root)
+                if version and version != self.index.version:
+                    self.index = VectorIndex(self.root, version)
+                    print(f"Reloaded snapshot {version} ({self.index.manifest['count']} chunks)")
+            except Exception as e:
+                print(f"Error reloading snapshot: {str(e)}")
+
+    def indexes_for(self, user_id: Optional[int]):
+        """The lexical and verse indexes to query: the user's own (scope ``user:<id>``) when one is given."""
+        if user_id is None or self.lexical is None:
+            return self.lexical, self.verses
+        if user_id not in self._user_indexes:
+            from bible_references import VerseIndex
+            from lexical_index import LexicalIndex
+
+            scope = f"user:{user_id}"
+            self._user_indexes[user_id] = (LexicalIndex(self.lexical.engine, scope),
+                                           VerseIndex(self.lexical.engine, scope))
+        return self._user_indexes[user_id]
+
+    def hybrid(self, index: VectorIndex, body: Dict) -> List[Dict]:
+        user_id = request_user(body)
+        lexical, _ = self.indexes_for(user_id)
+        if lexical is None:
+            raise ValueError("Hybrid search needs a lexical index (--lexical-db)")
+        k = int(body.get('k', 5))
+        embedding = body.get('embedding') or self.embed_queries([body['query']])[0]
+        hits = lexical.search(body['query'], limit=k * HYBRID_DEPTH)
+        return index.hybrid_search(embedding, hits, k, float(body.get('alpha', 0.5)), bool(body.get('prefilter')),
+                                   body.get('mode', self.mode), int(body['rerank']) if body.get('rerank') else None,
+                                   user_id)
+
+    def passage(self, index: VectorIndex, body: Dict) -> List[Dict]:
+        """
+        Chunks citing a passage, from the verse index alone; with a query or
+        embedding the verse hits instead boost a dense search, fused like
+        BM25 hits in ``hybrid``.
+        """
+        user_id = request_user(body)
+        _, verses = self.indexes_for(user_id)
+        if verses is None:
+            raise ValueError("Passage search needs a verse index (--lexical-db)")
+        k = int(body.get('k', 5))
+        hits = verses.lookup(body['passage'], limit=k * HYBRID_DEPTH)
+        if not (body.get('query') or body.get('embedding')):
+            rows = index.rows
+            return [dict(index.chunks[rows[chunk_id]], score=score)
+                    for chunk_id, score in index.owned_hits(hits, user_id)][:k]
+        embedding = body.get('embedding') or self.embed_queries([body['query']])[0]
+        return index.hybrid_search(embedding, hits, k, float(body.get('alpha', 0.5)), bool(body.get('prefilter')),
+                                   body.get('mode', self.mode), int(body['rerank']) if body.get('rerank') else None,
+                                   user_id)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        if self.embedder is None:
+            raise ValueError("Text queries need an embedding API key; send embeddings instead")
+        if self.embedder.model != self.index.manifest.get('model'):
+            raise ValueError(f"Query embedder {self.embedder.model} does not match the snapshot model "
+                             f"{self.index.manifest.get('model')}; send embeddings instead")
+        embeddings = self.embedder.embed(texts)
+        if any(embedding is None for embedding in embeddings):
+            raise ValueError("Could not embed query")
+        return embeddings
+
+
+class SearchHandler(BaseHTTPRequestHandler):
+    """
+    Every request on a snapshot published from Postgres must carry "user_id"; results are that user's chunks.
+
+    POST /search        {"embedding": [...] | "query": "...", "k": 5, "mode": "exact|int8|binary", "rerank": 4}
+    POST /search/batch  {"embeddings": [[...], ...] | "queries": ["...", ...], "k": 5, "mode": ..., "rerank": ...}
+    POST /search/hybrid {"query": "...", "embedding": [...]?, "k": 5, "alpha": 0.5, "prefilter": false}
+    POST /search/passage {"passage": "Rm 8:28-30", "query": "..."?, "embedding": [...]?, "k": 5, "alpha": 0.5}
+    GET  /health
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != '/health':
+            self._send_json(404, {'error': 'Not found'})
+            return
+        index = self.server.service.index
+        self._send_json(200, {'version': index.version, 'count': index.manifest['count'],
+                              'dimension': index.dimension, 'model': index.manifest.get('model'),
+                              'modes': index.modes})
+
+    def do_POST(self):
+        service = self.server.service
+        # Pin one index for the whole request so a reload cannot mix versions
+        index = service.index
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+            k = int(body.get('k', 5))
+            mode = body.get('mode', service.mode)
+            rerank = int(body['rerank']) if body.get('rerank') else None
+            user_id = request_user(body)
+
+            if self.path == '/search':
+                embedding = body.get('embedding') or service.embed_queries([body['query']])[0]
+                self._send_json(200, {'version': index.version,
+                                      'results': index.search(embedding, k, mode, rerank, user_id)})
+            elif self.path == '/search/batch':
+                embeddings = body.get('embeddings') or service.embed_queries(body['queries'])
+                self._send_json(200, {'version': index.version,
+                                      'results': index.search_batch(embeddings, k, mode, rerank, user_id)})
+            elif self.path == '/search/hybrid':
+                self._send_json(200, {'version': index.version, 'results': service.hybrid(index, body)})
+            elif self.path == '/search/passage':
+                self._send_json(200, {'version': index.version, 'results': service.passage(index, body)})
+            else:
+                self._send_json(404, {'error': 'Not found'})
+        except (KeyError, ValueError) as e:
+            self._send_json(400, {'error': str(e)})
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+
+
+def serve(service: SearchService, server: ThreadingHTTPServer):
+    server.service = service
+    threading.Thread(target=service.watch, daemon=True).start()
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm vector search over the latest indexer snapshot")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--snapshot-dir', default=snapshot_root())
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Worker processes sharing the listening socket and the mapped snapshot")
+    parser.add_argument('--reload-interval', type=float, default=5.0)
+    parser.add_argument('--mode', choices=SEARCH_MODES, default='exact',
+                        help="Default search mode: exact, or an int8 / binary scan re-ranked with float vectors")
+    parser.add_argument('--evaluate', type=int, metavar='QUERIES',
+                        help="Report recall@k, latency and scanned bytes per mode on this many perturbed "
+                             "snapshot rows, then exit")
+    parser.add_argument('--lexical-db', default=os.getenv('RAG_LEXICAL_DB'),
+                        help="SQLAlchemy URL of the BM25 and verse indexes for /search/hybrid and "
+                             "/search/passage, e.g. "
+                             "sqlite:///backend/data/chromadb/source_manifest.sqlite3 or DATABASE_URL (RAG_LEXICAL_DB)")
+    parser.add_argument('--lexical-scope', default='bible_comments_rag',
+                        help="Scope of the lexical and verse indexes: the Chroma collection name or user:<id>")
+    parser.add_argument('--k', type=int, default=10, help="k for --evaluate")
+    parser.add_argument('--rerank', type=int, help="Shortlist multiple for --evaluate (default per mode)")
+    args = parser.parse_args()
+
+    if args.evaluate:
+        index = VectorIndex(args.snapshot_dir)
+        rng = np.random.default_rng(0)
+        rows = rng.choice(index.manifest['count'], size=min(args.evaluate, index.manifest['count']), replace=False)
+        queries = index.matrix[np.sort(rows)] + rng.normal(0, 0.02, (len(rows), index.dimension))
+        report = evaluate_modes(index, queries, args.k, args.rerank)
+        print(f"{'mode':<8}{'recall@' + str(args.k):>12}{'ms/query':>12}{'MB scanned':>12}")
+        for mode, result in report.items():
+            print(f"{mode:<8}{result['recall_at_k']:>12.4f}{result['ms_per_query']:>12.3f}"
+                  f"{result['bytes'] / 1e6:>12.2f}")
+        sys.exit(0)
+
+    embedder = None
+    api_key = api_key_from_env()
+    if api_key or not needs_api_key():
+        from embedding_backends import embedder_from_env
+        embedder = embedder_from_env(api_key, task_type="retrieval_query")
+
+    lexical = verses = None
+    if args.lexical_db:
+        from bible_references import VerseIndex
+        from lexical_index import LexicalIndex
+        from sqlalchemy import create_engine
+        engine = create_engine(args.lexical_db)
+        lexical = LexicalIndex(engine, args.lexical_scope)
+        verses = VerseIndex(engine, args.lexical_scope)
+
+    server = ThreadingHTTPServer((args.host, args.port), SearchHandler)
+    server.daemon_threads = True
+    print(f"Vector search service listening on http://{args.host}:{args.port}")
+
+    # Pre-fork: children inherit the bound socket and each maps the snapshot itself
+    for _ in range(args.workers - 1):
+        if os.fork() == 0:
+            break
+
+    try:
+        serve(SearchService(args.snapshot_dir, embedder, args.reload_interval, args.mode, lexical, verses),
+              server)
+    except FileNotFoundError as e:
+        print(str(e))
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,397 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from vector_quantization import bit_code_bytes, quantize_int8, sign_bits
+
+DEFAULT_SNAPSHOT_ROOT = "backend/data/snapshots"
+
+EMBEDDINGS_FILE = "embeddings.f32"
+INT8_FILE = "embeddings.i8"
+INT8_SCALES_FILE = "scales.f32"
+BITS_FILE = "embeddings.bits"
+CHUNKS_FILE = "chunks.jsonl"
+CHUNKS_PARQUET_FILE = "chunks.parquet"
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+
+# 2 added per-file checksums and Parquet chunk metadata
+SNAPSHOT_FORMAT = 2
+
+# Typed columns of chunks.parquet; any other row field goes in its JSON 'metadata' column
+PARQUET_COLUMNS = (('id', 'string'), ('text', 'string'), ('source', 'string'), ('user_id', 'int64'))
+
+# Rows per Parquet row group
+PARQUET_BATCH_ROWS = 50000
+
+# Older snapshots kept around for processes that still have them mapped
+KEEP_SNAPSHOTS = 3
+
+
+def snapshot_root() -> str:
+    return os.getenv('RAG_SNAPSHOT_DIR', DEFAULT_SNAPSHOT_ROOT)
+
+
+class SnapshotWriter:
+    """
+    Writes an immutable snapshot of the index for ``vector_search_service``.
+
+    Embeddings are L2-normalized and appended as a contiguous row-major
+    float32 matrix, chunk metadata goes to a JSON-lines file with one line per
+    row (converted to Parquet on publish when pyarrow is installed). Next to
+    the float matrix go int8 codes with per-row scales (4x smaller) and
+    packed sign bits (32x smaller) for the coarse search modes (see
+    vector_quantization). Nothing is visible to readers until ``publish``
+    atomically points ``CURRENT`` at the new version.
+    """
+
+    def __init__(self, root: str, model: str):
+        self.root = root
+        self.model = model
+        # Versions sort chronologically and are never reused: overwriting a
+        # file another process has mapped would crash that process
+        now = time.time()
+        self.version = time.strftime('%Y%m%dT%H%M%S', time.gmtime(now)) + f".{int(now % 1 * 1e6):06d}-{os.getpid()}"
+        self.path = os.path.join(root, self.version)
+        os.makedirs(root, exist_ok=True)
+        os.makedirs(self.path)
+        self.dimension = None
+        self.count = 0
+        # Checksums are computed as the files are written, not by reading them back
+        self._files = {name: open(os.path.join(self.path, name), 'wb')
+                       for name in (EMBEDDINGS_FILE, INT8_FILE, INT8_SCALES_FILE, BITS_FILE, CHUNKS_FILE)}
+        self._hashes = {name: hashlib.sha256() for name in self._files}
+
+    def _write(self, name: str, data: bytes):
+        self._files[name].write(data)
+        self._hashes[name].update(data)
+
+    def append(self, rows: List[Dict], embeddings: List[List[float]]):
+        """
+        Append a batch of chunks.
+
+        Args:
+            rows (List[Dict]): Chunk metadata, at least 'id' and 'text'
+            embeddings (List[List[float]]): Matching embedding vectors
+        """
+        if not rows:
+            return
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if self.dimension is None:
+            self.dimension = matrix.shape[1]
+        elif matrix.shape[1] != self.dimension:
+            raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match {self.dimension}")
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix = np.ascontiguousarray(matrix / norms)
+        self._write(EMBEDDINGS_FILE, matrix.tobytes())
+        codes, scales = quantize_int8(matrix)
+        self._write(INT8_FILE, codes.tobytes())
+        self._write(INT8_SCALES_FILE, scales.tobytes())
+        self._write(BITS_FILE, sign_bits(matrix).tobytes())
+        self._write(CHUNKS_FILE, ''.join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode('utf-8'))
+        self.count += len(rows)
+
+    def _close(self):
+        for f in self._files.values():
+            f.close()
+
+    def _convert_chunks(self) -> str:
+        # Parquet when pyarrow is installed (RAG_SNAPSHOT_CHUNKS=jsonl opts out), JSON lines otherwise
+        if os.getenv('RAG_SNAPSHOT_CHUNKS', 'parquet') != 'parquet':
+            return CHUNKS_FILE
+        try:
+            write_chunks_parquet(os.path.join(self.path, CHUNKS_FILE), os.path.join(self.path, CHUNKS_PARQUET_FILE))
+        except ImportError:
+            return CHUNKS_FILE
+        os.remove(os.path.join(self.path, CHUNKS_FILE))
+        del self._hashes[CHUNKS_FILE]
+        self._hashes[CHUNKS_PARQUET_FILE] = file_sha256(os.path.join(self.path, CHUNKS_PARQUET_FILE))
+        return CHUNKS_PARQUET_FILE
+
+    def abort(self):
+        """Discard an unfinished snapshot."""
+        self._close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def publish(self) -> str:
+        """
+        Finish the snapshot, make it current and prune old versions.
+
+        The manifest records the model and dimension, the shape and dtype
+        of every array file (all raw, little-endian and starting at offset
+        0, so they map page-aligned with no copy) and the size and sha256
+        of every file, for ``verify_snapshot``.
+
+        Returns:
+            str: The published version
+        """
+        self._close()
+        chunks_file = self._convert_chunks()
+        dimension = self.dimension or 0
+        arrays = {
+            EMBEDDINGS_FILE: ('float32', [self.count, dimension]),
+            INT8_FILE: ('int8', [self.count, dimension]),
+            INT8_SCALES_FILE: ('float32', [self.count]),
+            BITS_FILE: ('uint8', [self.count, bit_code_bytes(dimension)]),
+        }
+        files = {}
+        for name, digest in self._hashes.items():
+            files[name] = {'bytes': os.path.getsize(os.path.join(self.path, name)), 'sha256': digest.hexdigest()}
+            if name in arrays:
+                files[name].update(dtype=arrays[name][0], shape=arrays[name][1], offset=0)
+        with open(os.path.join(self.path, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': self.version,
+                'format': SNAPSHOT_FORMAT,
+                'model': self.model,
+                'dimension': dimension,
+                'count': self.count,
+                'quantization': ['int8', 'binary'],
+                'chunks_file': chunks_file,
+                'files': files,
+                'created_at': time.time(),
+            }, f, indent=2)
+
+        set_current(self.root, self.version)
+        return self.version
+
+
+def set_current(root: str, version: str):
+    """Atomically point ``CURRENT`` at a version and prune all but the last ``KEEP_SNAPSHOTS``."""
+    current_tmp = os.path.join(root, CURRENT_FILE + '.tmp')
+    with open(current_tmp, 'w') as f:
+        f.write(version)
+    os.replace(current_tmp, os.path.join(root, CURRENT_FILE))
+
+    versions = sorted(
+        name for name in os.listdir(root)
+        if os.path.isfile(os.path.join(root, name, MANIFEST_FILE))
+    )
+    for old in versions[:-KEEP_SNAPSHOTS]:
+        if old != version:
+            shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+
+
+def file_sha256(path: str, block_size: int = 1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest
+
+
+def write_chunks_parquet(jsonl_path: str, parquet_path: str):
+    """
+    Convert chunk metadata from JSON lines to Parquet, one row group per ``PARQUET_BATCH_ROWS`` rows.
+
+    Raises:
+        ImportError: When pyarrow is not installed
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(name, getattr(pa, kind)()) for name, kind in PARQUET_COLUMNS] + [('metadata', pa.string())])
+    known = [name for name, _ in PARQUET_COLUMNS]
+
+    def flush(rows: List[Dict]):
+        columns = {name: [row.get(name) for row in rows] for name in known}
+        columns['metadata'] = [
+            json.dumps(extra, ensure_ascii=False) if extra else None
+            for extra in ({key: value for key, value in row.items() if key not in known} for row in rows)
+        ]
+        writer.write_table(pa.table(columns, schema=schema))
+
+    with pq.ParquetWriter(parquet_path, schema) as writer, open(jsonl_path, encoding='utf-8') as f:
+        rows = []
+        for line in f:
+            rows.append(json.loads(line))
+            if len(rows) >= PARQUET_BATCH_ROWS:
+                flush(rows)
+                rows = []
+        if rows:
+            flush(rows)
+
+
+def read_chunks(path: str, chunks_file: str = CHUNKS_FILE) -> List[Dict]:
+    """Chunk metadata of a snapshot directory, from Parquet or JSON lines; absent fields are left out."""
+    if not chunks_file.endswith('.parquet'):
+        with open(os.path.join(path, chunks_file), encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(os.path.join(path, chunks_file))
+    names = [name for name, _ in PARQUET_COLUMNS]
+    columns = [table.column(name).to_pylist() for name in names]
+    chunks = []
+    for values, metadata in zip(zip(*columns), table.column('metadata').to_pylist()):
+        row = {name: value for name, value in zip(names, values) if value is not None}
+        if metadata:
+            row.update(json.loads(metadata))
+        chunks.append(row)
+    return chunks
+
+
+def current_version(root: str) -> Optional[str]:
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def open_snapshot(root: str, version: Optional[str] = None) -> Tuple[Dict, np.ndarray, List[Dict]]:
+    """
+    Map a published snapshot.
+
+    Args:
+        root (str): Snapshot root directory
+        version (Optional[str]): Version to open, defaults to ``CURRENT``
+
+    Returns:
+        Tuple[Dict, np.ndarray, List[Dict]]: manifest, read-only memory-mapped
+        (count, dimension) float32 matrix and per-row chunk metadata
+    """
+    version = version or current_version(root)
+    if version is None:
+        raise FileNotFoundError(f"No published snapshot in {root}")
+    path = os.path.join(root, version)
+    with open(os.path.join(path, MANIFEST_FILE), encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    if manifest['count']:
+        matrix = np.memmap(os.path.join(path, EMBEDDINGS_FILE), dtype=np.float32, mode='r',
+                           shape=(manifest['count'], manifest['dimension']))
+    else:
+        matrix = np.zeros((0, manifest['dimension']), dtype=np.float32)
+
+    chunks = read_chunks(path, manifest.get('chunks_file', CHUNKS_FILE))
+    return manifest, matrix, chunks
+
+
+def verify_snapshot(root: str, version: Optional[str] = None) -> List[str]:
+    """
+    Check a snapshot's files against the sizes and checksums in its manifest.
+
+    Returns:
+        List[str]: Problems found; empty when every file matches. Snapshots
+        written before checksums were recorded report that they have none.
+    """
+    version = version or current_version(root)
+    if version is None:
+        raise FileNotFoundError(f"No published snapshot in {root}")
+    path = os.path.join(root, version)
+    with open(os.path.join(path, MANIFEST_FILE), encoding='utf-8') as f:
+        manifest = json.load(f)
+    if 'files' not in manifest:
+        return [f"Snapshot {version} has no checksums (format {manifest.get('format', 1)})"]
+    problems = []
+    for name, expected in manifest['files'].items():
+        file_path = os.path.join(path, name)
+        if not os.path.isfile(file_path):
+            problems.append(f"{name}: missing")
+        elif os.path.getsize(file_path) != expected['bytes']:
+            problems.append(f"{name}: {os.path.getsize(file_path)} bytes, expected {expected['bytes']}")
+        elif file_sha256(file_path).hexdigest() != expected['sha256']:
+            problems.append(f"{name}: checksum mismatch")
+    return problems
+
+
+def iter_snapshot_batches(root: str, version: Optional[str] = None, batch_size: int = 1000):
+    """
+    Page through a snapshot as (rows, embeddings), like the stores' batch iterators.
+
+    Embeddings come back L2-normalized, as they are stored.
+    """
+    manifest, matrix, chunks = open_snapshot(root, version)
+    for start in range(0, manifest['count'], batch_size):
+        yield chunks[start:start + batch_size], matrix[start:start + batch_size].tolist()
+
+
+def install_snapshot(source_root: str, target_root: str, version: Optional[str] = None) -> str:
+    """
+    Copy a published snapshot into another root, verify it there and make it current.
+
+    The copy goes to a temporary directory that is renamed into place once
+    its checksums match, so readers of ``target_root`` never see a partial
+    version. This is how a new search replica gets its index without
+    re-embedding anything.
+
+    Returns:
+        str: The installed version
+
+    Raises:
+        ValueError: If the copy does not match the manifest
+    """
+    version = version or current_version(source_root)
+    if version is None:
+        raise FileNotFoundError(f"No published snapshot in {source_root}")
+    os.makedirs(target_root, exist_ok=True)
+    target = os.path.join(target_root, version)
+    if not os.path.isdir(target):
+        tmp = os.path.join(target_root, f".{version}.tmp-{os.getpid()}")
+        shutil.rmtree(tmp, ignore_errors=True)
+        shutil.copytree(os.path.join(source_root, version), tmp)
+        problems = verify_snapshot(target_root, os.path.basename(tmp))
+        if problems:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise ValueError(f"Copy of snapshot {version} is corrupt: {'; '.join(problems)}")
+        os.replace(tmp, target)
+    set_current(target_root, version)
+    return version
+
+
+def open_quantized(root: str, manifest: Dict) -> Dict[str, Tuple[np.ndarray, ...]]:
+    """
+    Map the quantized codes of a snapshot.
+
+    Args:
+        root (str): Snapshot root directory
+        manifest (Dict): Manifest returned by ``open_snapshot``
+
+    Returns:
+        Dict[str, Tuple[np.ndarray, ...]]: ``{'int8': (codes, scales), 'binary': (bits,)}``
+        for the codes the snapshot has; snapshots written before
+        quantization have none
+    """
+    path = os.path.join(root, manifest['version'])
+    count, dimension = manifest['count'], manifest['dimension']
+    available = manifest.get('quantization', [])
+    quantized = {}
+    if 'int8' in available:
+        quantized['int8'] = (
+            np.memmap(os.path.join(path, INT8_FILE), dtype=np.int8, mode='r', shape=(count, dimension))
+            if count else np.zeros((0, dimension), dtype=np.int8),
+            np.fromfile(os.path.join(path, INT8_SCALES_FILE), dtype=np.float32),
+        )
+    if 'binary' in available:
+        width = bit_code_bytes(dimension)
+        quantized['binary'] = (
+            np.memmap(os.path.join(path, BITS_FILE), dtype=np.uint8, mode='r', shape=(count, width))
+            if count else np.zeros((0, width), dtype=np.uint8),
+        )
+    return quantized
+
+
+def publish_snapshot(batches: Iterable[Tuple[List[Dict], List[List[float]]]], model: str,
+                     root: Optional[str] = None) -> str:
+    """
+    Write and publish a snapshot from batches of (rows, embeddings).
+
+    Returns:
+        str: The published version
+    """
+    writer = SnapshotWriter(root or snapshot_root(), model)
+    try:
+        for rows, embeddings in batches:
+            writer.append(rows, embeddings)
+    except Exception:
+        writer.abort()
+        raise
+    return writer.publish()
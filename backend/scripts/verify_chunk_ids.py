@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+import json
+import os
+import sys
+import uuid
+from typing import List
+
+from ingest_pipeline import ChunkRecord
+from source_manifest import chunk_hash, chunk_row_id
+
+DIMENSION = 768
+
+# What the indexer wrote before chunk ids were content-addressed: every chunk
+# of a source under the source's document_id (with repeats from reruns), and
+# the server's positional <document>_chunk_<n> ids
+LEGACY_ROWS = [
+    (1, 'freebible_commentary', "No princípio era o Verbo."),
+    (1, 'freebible_commentary', "E o Verbo estava com Deus."),
+    (1, 'freebible_commentary', "No princípio era o Verbo."),
+    (1, 'freebible_commentary', "E o Verbo era Deus."),
+    (1, 'freebible_commentary', "E o Verbo estava com Deus."),
+    (2, 'freebible_commentary', "No princípio era o Verbo."),
+    (1, 'doc_upload_chunk_0', "Bem-aventurados os pobres de espírito."),
+    (1, 'doc_upload_chunk_1', "Bem-aventurados os que choram."),
+]
+
+
+def embedding(seed: int) -> List[float]:
+    return [((seed + i) % 7 - 3) / 3.0 for i in range(DIMENSION)]
+
+
+def expected_ids():
+    """(user_id, row id) the legacy rows should end up with, one per distinct chunk."""
+    return sorted({(user_id, chunk_row_id(document_id.rpartition('_chunk_')[0] or document_id, chunk_hash(text)))
+                   for user_id, document_id, text in LEGACY_ROWS})
+
+
+def verify(database_url: str) -> bool:
+    """
+    Build a table as the old indexer left it in a scratch schema, run
+    create_rag_table over it and check the ids, the unique index and that
+    re-indexing the same chunks upserts instead of adding rows.
+    """
+    from sqlalchemy import create_engine, text
+
+    import rag_indexer_postgres
+    from pg_bulk_writer import BulkChunkWriter, has_chunk_id_index
+
+    schema = f"verify_chunk_ids_{uuid.uuid4().hex[:8]}"
+    admin = create_engine(database_url)
+    with admin.begin() as conn:
+        conn.execute(text(f"CREATE SCHEMA {schema}"))
+    engine = create_engine(database_url, connect_args={'options': f"-csearch_path={schema},public"})
+    ok = True
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE rag_chunks (
+                    id SERIAL PRIMARY KEY,
+                    document_id VARCHAR(255) NOT NULL,
+                    chunk_text TEXT NOT NULL,
+                    embedding_vector TEXT NOT NULL,
+                    source_url VARCHAR(500),
+                    page_number INTEGER,
+                    user_id INTEGER NOT NULL DEFAULT 1,
+                    created_at TIMESTAMP DEFAULT NOW()
+                )
+            """))
+            conn.execute(text("""
+                INSERT INTO rag_chunks (document_id, chunk_text, embedding_vector, user_id)
+                VALUES (:document_id, :chunk_text, :embedding_vector, :user_id)
+            """), [{'user_id': user_id, 'document_id': document_id, 'chunk_text': chunk,
+                    'embedding_vector': json.dumps(embedding(i))}
+                   for i, (user_id, document_id, chunk) in enumerate(LEGACY_ROWS)])
+
+        rag_indexer_postgres._engine = engine
+        rag_indexer_postgres.create_rag_table()
+
+        with engine.connect() as conn:
+            indexed = has_chunk_id_index(conn)
+            ids = sorted(tuple(row) for row in conn.execute(text("SELECT user_id, document_id FROM rag_chunks")))
+        print(f"unique chunk id index: {'OK' if indexed else 'MISSING'}")
+        print(f"legacy ids content-addressed, duplicates dropped: {'OK' if ids == expected_ids() else ids}")
+        ok = indexed and ids == expected_ids()
+
+        # What the pipeline writes for the same source today
+        writer = BulkChunkWriter(engine, 1)
+        chunks = sorted({chunk for user_id, _, chunk in LEGACY_ROWS[:5]})
+        records = [ChunkRecord('file', 'freebible.txt', 'freebible_commentary', position, chunk_hash(chunk), chunk)
+                   for position, chunk in enumerate(chunks)]
+        writer.write_chunks(records, [embedding(i) for i in range(len(records))])
+        with engine.connect() as conn:
+            count = conn.execute(text("SELECT COUNT(*) FROM rag_chunks")).scalar()
+        upserted = writer.upsert and count == len(expected_ids())
+        print(f"re-indexing upserts onto the migrated rows: {'OK' if upserted else f'{count} rows'}")
+        return ok and upserted
+    finally:
+        engine.dispose()
+        with admin.begin() as conn:
+            conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        admin.dispose()
+
+
+if __name__ == "__main__":
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        print("DATABASE_URL is not set; the check runs in a scratch schema of that database")
+        sys.exit(1)
+    sys.exit(0 if verify(database_url) else 1)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+import shutil
+import sys
+import tempfile
+from typing import Dict, List, Tuple
+
+from ingest_pipeline import ChunkRecord
+from sink_fanout import SnapshotSink
+from source_manifest import chunk_hash
+
+MODEL = 'verify-model'
+DIMENSION = 8
+
+# One library source indexed by two users; user 1 then reindexes a revised version
+SOURCE = ["No princípio era o Verbo.", "E o Verbo estava com Deus."]
+REVISED = ["No princípio era o Verbo.", "E o Verbo era Deus."]
+
+
+def records(chunks: List[str]) -> List[ChunkRecord]:
+    return [ChunkRecord('file', 'commentary.txt', 'commentary', position, chunk_hash(chunk), chunk)
+            for position, chunk in enumerate(chunks)]
+
+
+def user_vector(user_id: int) -> List[float]:
+    """A vector that tells which user wrote a row (snapshots store vectors normalized)."""
+    return [1.0 if i == user_id else 0.0 for i in range(DIMENSION)]
+
+
+def index(root: str, user_id: int, chunks: List[str], deleted: List[str] = ()) -> str:
+    sink = SnapshotSink(MODEL, root, row_fields={'user_id': user_id})
+    batch = records(chunks)
+    sink.write_chunks(batch, [user_vector(user_id) for _ in batch])
+    sink.delete_chunks(list(deleted))
+    return sink.close()
+
+
+def snapshot_rows(root: str, version: str) -> Dict[Tuple[int, str], int]:
+    from vector_snapshot import open_snapshot
+
+    _, matrix, chunks = open_snapshot(root, version)
+    return {(row['user_id'], row['text']): int(matrix[i].argmax()) for i, row in enumerate(chunks)}
+
+
+def verify() -> bool:
+    """Check that one user's reindex of a shared source leaves the other user's snapshot rows alone."""
+    root = tempfile.mkdtemp(prefix='verify-snapshot-')
+    try:
+        index(root, 1, SOURCE)
+        index(root, 2, SOURCE)
+        stale = [record.row_id for record in records(SOURCE) if record.text not in REVISED]
+        rows = snapshot_rows(root, index(root, 1, REVISED, stale))
+    finally:
+        shutil.rmtree(root)
+
+    expected = {(1, chunk) for chunk in REVISED} | {(2, chunk) for chunk in SOURCE}
+    ok = set(rows) == expected and all(writer == user_id for (user_id, _), writer in rows.items())
+    print(f"two users, one source: {'OK' if ok else sorted(rows)}")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if verify() else 1)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import random
+import sys
+import time
+from typing import Dict, List
+
+from text_splitter import split_text
+
+# (chunk_size, chunk_overlap) combinations checked on the golden corpus
+PARAMETERS = [(1000, 200), (500, 30), (200, 0), (50, 10)]
+
+# sha256 of the langchain output for each parameter set on golden_corpus(),
+# so the check also runs where langchain is not installed
+GOLDEN_DIGESTS = {
+    "1000/200": "d5f0cd14001876c77ce46d596a10ea779789d2c4378b68a488d2cc963908bb7a",
+    "500/30": "8eb82d19f18afb7586e917a3b1909d07f9f67af5e822079cbecad597197877dd",
+    "200/0": "ba8be47c7b1044eace9d8b309c3a810f0021963af4bfeaf6761b6a16b7656e66",
+    "50/10": "fda240cca0059a588c9082766943a990ed7879150d0163633ef1e4ac155e49fe",
+}
+
+WORDS = ("Deus", "graça", "fé", "salvação", "Jesus", "Cristo", "evangelho", "igreja", "pregação", "sermão",
+         "coração", "palavra", "Espírito", "amor", "esperança", "perdão", "reino", "céus", "terra", "povo",
+         "e", "de", "o", "a", "que", "em", "para", "com", "não", "uma", "os", "no", "se", "na", "por")
+
+
+def golden_corpus(seed: int = 20240601, paragraphs: int = 400) -> str:
+    """
+    Deterministic commentary-like text exercising every separator level.
+
+    Besides ordinary sentences and paragraphs it contains single line breaks,
+    runs of blank lines, overlong unbroken tokens and verse references, which
+    force the splitter down to the word and character separators.
+    """
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(paragraphs):
+        sentences = []
+        for _ in range(rng.randint(1, 12)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(3, 40))]
+            if rng.random() < 0.05:
+                words.append("x" * rng.randint(50, 1500))
+            if rng.random() < 0.1:
+                words.append(f"(Jo {rng.randint(1, 21)}:{rng.randint(1, 40)})")
+            sentences.append(" ".join(words).capitalize())
+        separator = ". \n" if rng.random() < 0.2 else ". "
+        parts.append(separator.join(sentences) + ".")
+        parts.append(rng.choice(["\n\n", "\n\n", "\n", "\n\n\n\n", "  \n\n"]))
+    return "".join(parts)
+
+
+def langchain_split(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
+    try:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+    except ImportError:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        separators=["\n\n", "\n", ". ", " ", ""]
+    ).split_text(text)
+
+
+def chunks_digest(chunks: List[str]) -> str:
+    return hashlib.sha256(json.dumps(chunks, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def throughput(function, text: str, repeat: int = 3) -> float:
+    """Best-of-``repeat`` splitting speed in MB/s of UTF-8 input."""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(text)
+        best = min(best, time.perf_counter() - started)
+    return len(text.encode('utf-8')) / best / 1e6
+
+
+def verify(use_langchain: bool) -> Dict[str, bool]:
+    text = golden_corpus()
+    results = {}
+    for chunk_size, chunk_overlap in PARAMETERS:
+        key = f"{chunk_size}/{chunk_overlap}"
+        ours = split_text(text, chunk_size, chunk_overlap)
+        if use_langchain:
+            expected = langchain_split(text, chunk_size, chunk_overlap)
+            ok = ours == expected
+            if not ok:
+                for i, (a, b) in enumerate(zip(ours, expected)):
+                    if a != b:
+                        print(f"  {key}: first difference at chunk {i}:\n    ours:      {a[:80]!r}\n"
+                              f"    langchain: {b[:80]!r}")
+                        break
+                else:
+                    print(f"  {key}: {len(ours)} chunks vs {len(expected)} from langchain")
+        else:
+            ok = chunks_digest(ours) == GOLDEN_DIGESTS[key]
+        print(f"{key}: {len(ours)} chunks {'OK' if ok else 'MISMATCH'}")
+        results[key] = ok
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check text_splitter against langchain and measure chunking speed")
+    parser.add_argument('--print-digests', action='store_true',
+                        help="Print langchain digests for GOLDEN_DIGESTS and exit")
+    parser.add_argument('--benchmark-mb', type=float, default=20.0,
+                        help="Size of the corpus used for the throughput measurement")
+    args = parser.parse_args()
+
+    try:
+        langchain_split("", 10, 0)
+        has_langchain = True
+    except ImportError:
+        has_langchain = False
+
+    if args.print_digests:
+        if not has_langchain:
+            print("langchain is not installed")
+            sys.exit(1)
+        text = golden_corpus()
+        print(json.dumps({f"{size}/{overlap}": chunks_digest(langchain_split(text, size, overlap))
+                          for size, overlap in PARAMETERS}, indent=4))
+        sys.exit(0)
+
+    print(f"Comparing against {'langchain' if has_langchain else 'stored langchain digests'}")
+    results = verify(has_langchain)
+
+    corpus = golden_corpus()
+    text = corpus * max(1, int(args.benchmark_mb * 1e6 / len(corpus.encode('utf-8'))))
+    print(f"text_splitter: {throughput(split_text, text):.1f} MB/s")
+    if has_langchain:
+        print(f"langchain:     {throughput(lambda t: langchain_split(t, 1000, 200), text):.1f} MB/s")
+
+    sys.exit(0 if all(results.values()) else 1)
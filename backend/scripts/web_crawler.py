@@ -0,0 +1,384 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional
+from urllib.parse import urldefrag, urljoin, urlparse
+from urllib.robotparser import RobotFileParser
+
+DEFAULT_CACHE_DIR = "backend/data/http_cache"
+
+DEFAULT_USER_AGENT = "SermaoAI-Indexer/1.0"
+
+# Requests in flight per host, and minimum seconds between two of them
+# (raised to the host's robots.txt Crawl-delay)
+DEFAULT_PER_HOST = 2
+DEFAULT_DELAY = 1.0
+
+# Bump when extraction changes, so cached pages are downloaded and extracted again
+EXTRACTOR_VERSION = 1
+
+# Containers that hold the article on the commentary sites, tried in order
+MAIN_CONTENT_SELECTORS = ('article', 'main', '[role=main]', '.post-body', '.entry-content', '.post-content',
+                          '#content', '.content')
+
+BOILERPLATE_TAGS = ('script', 'style', 'noscript', 'template', 'nav', 'header', 'footer', 'aside', 'form',
+                    'iframe', 'svg', 'button')
+
+# Links to these are not followed
+SKIPPED_EXTENSIONS = re.compile(r"\.(jpe?g|png|gif|webp|svg|ico|css|js|zip|rar|mp3|mp4|m4a|avi|pdf|docx?|xml)$",
+                                re.IGNORECASE)
+
+
+def normalize_url(url: str) -> str:
+    """Drop the fragment, so anchors within a page do not count as pages."""
+    return urldefrag(url)[0]
+
+
+def extract_main_content(html: str, url: str = '') -> Dict:
+    """
+    Extract the readable text of an HTML page.
+
+    Scripts, navigation, headers, footers, sidebars and forms are removed,
+    then the first main-content container (``MAIN_CONTENT_SELECTORS``) is
+    used, or the whole body when the page has none. Block elements become
+    line breaks, so the splitter can cut on paragraphs.
+
+    Args:
+        html (str): Page source
+        url (str): Page address, to resolve links
+
+    Returns:
+        Dict: 'title', 'text' and 'links' (absolute, without fragments, in page order)
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    links = []
+    for anchor in soup.find_all('a', href=True):
+        link = normalize_url(urljoin(url, anchor['href'].strip()))
+        if urlparse(link).scheme in ('http', 'https') and link not in links:
+            links.append(link)
+    title = soup.title.get_text(strip=True) if soup.title else ''
+
+    for tag in soup(BOILERPLATE_TAGS):
+        tag.decompose()
+    root = next((found for found in (soup.select_one(selector) for selector in MAIN_CONTENT_SELECTORS) if found),
+                None) or soup.body or soup
+    lines = (re.sub(r"\s+", ' ', line).strip() for line in root.get_text('\n').splitlines())
+    text = '\n'.join(line for line in lines if line)
+    return {'title': title, 'text': text, 'links': links}
+
+
+class HttpCache:
+    """
+    On-disk cache of crawled pages: validators plus the extracted text and links.
+
+    One JSON file per URL. The ETag and Last-Modified of the response are
+    sent back as ``If-None-Match``/``If-Modified-Since``, and a 304 is
+    answered from here, so an unchanged page costs a request but no
+    download, no extraction and (its text hashing the same) no embedding.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "HttpCache":
+        return cls(os.getenv('RAG_HTTP_CACHE_DIR', DEFAULT_CACHE_DIR))
+
+    def _path(self, url: str) -> str:
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def get(self, url: str) -> Optional[Dict]:
+        try:
+            with open(self._path(url), encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get('extractor') == EXTRACTOR_VERSION else None
+
+    def put(self, url: str, entry: Dict):
+        path = self._path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({**entry, 'url': url, 'extractor': EXTRACTOR_VERSION}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+
+class FetchResult:
+    """Outcome of fetching one page: 'fetched', 'not_modified', 'disallowed' or 'error'."""
+
+    def __init__(self, url: str, status: str, text: str = '', title: str = '', links: Optional[List[str]] = None,
+                 error: Optional[str] = None):
+        self.url = url
+        self.status = status
+        self.text = text
+        self.title = title
+        self.links = links or []
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.status in ('fetched', 'not_modified')
+
+
+class _Host:
+    """Connection pool, robots rules and politeness clock of one host."""
+
+    def __init__(self, session, per_host: int):
+        self.session = session
+        self.per_host = per_host
+        self.robots: Optional[RobotFileParser] = None
+        self.delay = 0.0
+        self.next_at = 0.0
+        self.loop = None
+        self.semaphore = None
+        self.lock = None
+
+    def bind(self):
+        # asyncio primitives belong to one event loop; each crawl runs its own
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop = loop
+            self.semaphore = asyncio.Semaphore(self.per_host)
+            self.lock = asyncio.Lock()
+
+
+class WebCrawler:
+    """
+    Concurrent, polite and cache-aware fetcher for ``url`` sources.
+
+    Requests run on asyncio, with the blocking ``requests`` calls handed to
+    worker threads; each host has its own pooled ``requests.Session`` (kept
+    alive between requests), at most ``per_host`` requests in flight and at
+    least ``delay`` seconds (or its robots.txt Crawl-delay) between request
+    starts, so many hosts are crawled in parallel while each one sees a
+    slow, steady client. robots.txt is honoured, 429/503 answers push the
+    host's next request back by their Retry-After, and pages are revalidated
+    through ``HttpCache`` with conditional GETs.
+
+    Pages fetched by ``crawl`` are remembered for the rest of the process,
+    so the ingestion pipeline loading them afterwards (``load``) reads them
+    from the cache instead of asking the server again.
+    """
+
+    def __init__(self, cache: Optional[HttpCache] = None, user_agent: str = DEFAULT_USER_AGENT,
+                 per_host: int = DEFAULT_PER_HOST, delay: float = DEFAULT_DELAY, timeout: float = 30.0,
+                 concurrency: int = 16, log: Callable[[str], None] = print):
+        self.cache = cache or HttpCache.from_env()
+        self.user_agent = user_agent
+        self.per_host = max(1, per_host)
+        self.delay = delay
+        self.timeout = timeout
+        self.concurrency = max(1, concurrency)
+        self.log = log
+        self._hosts: Dict[str, _Host] = {}
+        self._fetched = set()
+        self.counts = {'fetched': 0, 'not_modified': 0, 'disallowed': 0, 'error': 0, 'bytes': 0}
+
+    @classmethod
+    def from_env(cls) -> "WebCrawler":
+        """Crawler configured by RAG_CRAWL_PER_HOST, RAG_CRAWL_DELAY and RAG_CRAWL_USER_AGENT."""
+        return cls(per_host=int(os.getenv('RAG_CRAWL_PER_HOST', DEFAULT_PER_HOST)),
+                   delay=float(os.getenv('RAG_CRAWL_DELAY', DEFAULT_DELAY)),
+                   user_agent=os.getenv('RAG_CRAWL_USER_AGENT', DEFAULT_USER_AGENT))
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.counts)
+
+    def _host(self, url: str) -> _Host:
+        netloc = urlparse(url).netloc
+        host = self._hosts.get(netloc)
+        if host is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            session.headers['User-Agent'] = self.user_agent
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.per_host)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            host = self._hosts[netloc] = _Host(session, self.per_host)
+        host.bind()
+        return host
+
+    async def _wait_turn(self, host: _Host):
+        async with host.lock:
+            now = time.monotonic()
+            if host.next_at > now:
+                await asyncio.sleep(host.next_at - now)
+            host.next_at = time.monotonic() + max(self.delay, host.delay)
+
+    async def _robots(self, url: str, host: _Host) -> RobotFileParser:
+        if host.robots is not None:
+            return host.robots
+        async with host.lock:
+            if host.robots is None:
+                parsed = urlparse(url)
+                robots = RobotFileParser(f"{parsed.scheme}://{parsed.netloc}/robots.txt")
+                try:
+                    response = await asyncio.to_thread(host.session.get, robots.url, timeout=self.timeout)
+                    if response.status_code in (401, 403):
+                        robots.disallow_all = True
+                    elif response.status_code >= 400:
+                        robots.allow_all = True
+                    else:
+                        robots.parse(response.text.splitlines())
+                except Exception as e:
+                    self.log(f"Could not read {robots.url}, crawling without it: {e}")
+                    robots.allow_all = True
+                host.delay = float(robots.crawl_delay(self.user_agent) or 0)
+                host.robots = robots
+        return host.robots
+
+    async def fetch(self, url: str) -> FetchResult:
+        """
+        Fetch one page, revalidating the cached copy if there is one.
+
+        Returns:
+            FetchResult: Page text and links; on errors, the cached copy if any
+        """
+        url = normalize_url(url)
+        host = self._host(url)
+        robots = await self._robots(url, host)
+        if not robots.can_fetch(self.user_agent, url):
+            self.counts['disallowed'] += 1
+            return FetchResult(url, 'disallowed')
+
+        cached = self.cache.get(url)
+        headers = {}
+        if cached and cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached and cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+        async with host.semaphore:
+            await self._wait_turn(host)
+            try:
+                response = await asyncio.to_thread(host.session.get, url, headers=headers, timeout=self.timeout)
+                if response.status_code in (429, 503):
+                    retry_after = response.headers.get('Retry-After', '')
+                    host.next_at = max(host.next_at, time.monotonic()
+                                       + (float(retry_after) if retry_after.isdigit() else 10 * max(self.delay, 1)))
+                if response.status_code == 304 and cached:
+                    self.counts['not_modified'] += 1
+                    self._fetched.add(url)
+                    return FetchResult(url, 'not_modified', cached['text'], cached.get('title', ''),
+                                       cached.get('links'))
+                response.raise_for_status()
+            except Exception as e:
+                self.counts['error'] += 1
+                if cached:
+                    return FetchResult(url, 'error', cached['text'], cached.get('title', ''), cached.get('links'),
+                                       error=str(e))
+                return FetchResult(url, 'error', error=str(e))
+
+        self.counts['fetched'] += 1
+        self.counts['bytes'] += len(response.content)
+        content_type = response.headers.get('Content-Type', 'text/html')
+        if 'html' in content_type:
+            page = await asyncio.to_thread(extract_main_content, response.text, url)
+        else:
+            page = {'title': '', 'text': response.text.strip(), 'links': []}
+        self.cache.put(url, {'etag': response.headers.get('ETag'),
+                             'last_modified': response.headers.get('Last-Modified'),
+                             'fetched_at': time.time(), **page})
+        self._fetched.add(url)
+        return FetchResult(url, 'fetched', page['text'], page['title'], page['links'])
+
+    async def crawl(self, seeds: Iterable[str], max_pages: int = 1000,
+                    in_scope: Optional[Callable[[str], bool]] = None) -> List[FetchResult]:
+        """
+        Fetch the seeds and follow their links breadth-first.
+
+        By default a link is followed when it lies under the directory of
+        one of the seeds, so crawling ``https://host/biblia/`` stays in that
+        section of that site. Links of unchanged pages come from the cache,
+        so a recrawl walks the whole site without downloading unchanged
+        pages.
+
+        Args:
+            seeds (Iterable[str]): Start pages
+            max_pages (int): Stop queueing new pages after this many
+            in_scope (Callable[[str], bool]): Overrides which links are followed
+
+        Returns:
+            List[FetchResult]: One result per page visited, in completion order
+        """
+        seeds = [normalize_url(seed) for seed in seeds]
+        if in_scope is None:
+            prefixes = tuple(seed[:seed.rfind('/') + 1] if urlparse(seed).path else seed + '/' for seed in seeds)
+            in_scope = lambda link: link.startswith(prefixes) and not SKIPPED_EXTENSIONS.search(urlparse(link).path)
+
+        pending = deque(seeds)
+        seen = set(seeds)
+        results: List[FetchResult] = []
+        ready = asyncio.Condition()
+        active = 0
+
+        async def worker():
+            nonlocal active
+            while True:
+                async with ready:
+                    while not pending and active:
+                        await ready.wait()
+                    if not pending:
+                        ready.notify_all()
+                        return
+                    url = pending.popleft()
+                    active += 1
+                result = FetchResult(url, 'error', error='crawl interrupted')
+                try:
+                    result = await self.fetch(url)
+                finally:
+                    # A page counts as active until its links are queued, so
+                    # idle workers do not stop while more work may arrive
+                    async with ready:
+                        results.append(result)
+                        for link in result.links:
+                            if len(seen) >= max_pages:
+                                break
+                            if link not in seen and in_scope(link):
+                                seen.add(link)
+                                pending.append(link)
+                        active -= 1
+                        ready.notify_all()
+                if result.status == 'error':
+                    self.log(f"Error crawling {url}: {result.error}")
+                if len(results) % 100 == 0:
+                    self.log(f"Crawled {len(results)} pages, {len(pending)} queued: {self.stats()}")
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        return results
+
+    def crawl_sync(self, seeds: Iterable[str], max_pages: int = 1000) -> List[FetchResult]:
+        return asyncio.run(self.crawl(seeds, max_pages))
+
+    def load(self, url: str) -> str:
+        """
+        Text of a page for the ingestion pipeline.
+
+        Pages already fetched by this crawler are read from the cache;
+        others are fetched (conditionally) now.
+
+        Raises:
+            RuntimeError: If the page cannot be fetched and is not cached
+        """
+        url = normalize_url(url)
+        if url in self._fetched:
+            cached = self.cache.get(url)
+            if cached:
+                return cached['text']
+        result = asyncio.run(self.fetch(url))
+        if result.status == 'disallowed':
+            raise RuntimeError(f"{url} is disallowed by robots.txt")
+        if result.status == 'error' and not result.text:
+            raise RuntimeError(f"Could not fetch {url}: {result.error}")
+        return result.text
@@ -0,0 +1,17 @@
+-- Native pgvector storage for RAG embeddings
+CREATE EXTENSION IF NOT EXISTS vector;
+
+ALTER TABLE rag_chunks ADD COLUMN IF NOT EXISTS embedding vector(768);
+
+-- The HNSW index (rag_chunks_embedding_idx) is not created here: migrations run
+-- in a transaction, where CREATE INDEX CONCURRENTLY is not allowed, and building
+-- it before the backfill would maintain it row by row. backend/scripts/migrate_pgvector.py
+-- copies the existing JSON rows in batches (skipping malformed JSON) and then
+-- builds the index with CREATE INDEX CONCURRENTLY; rag_indexer_postgres.py does
+-- the same on first use.
+--
+-- shared/schema.ts still declares the index, so `drizzle-kit push` keeps it (an
+-- index missing from the schema would be dropped). Push builds a missing index
+-- in its transaction, without CONCURRENTLY, locking writes on rag_chunks for the
+-- whole build: on a database with chunks, run migrate_pgvector.py before pushing
+-- so the index already exists and push leaves it alone.
@@ -0,0 +1,17 @@
+-- Unique chunk ids per user, so re-indexing upserts instead of duplicating rows.
+-- Rows written before ids were content-addressed (every chunk of a source under
+-- one document_id, or <document>_chunk_<position>) get the id the indexer gives
+-- the same chunk today, <document>_chunk_<first 16 hex of sha256(chunk_text)>;
+-- the exact duplicates this reveals are dropped. backend/scripts/pg_bulk_writer.py
+-- (ensure_chunk_id_index) runs the same statements.
+UPDATE rag_chunks
+SET document_id = regexp_replace(document_id, '^(.*)_chunk_.*$', '\1') || '_chunk_'
+                  || left(encode(sha256(convert_to(chunk_text, 'UTF8')), 'hex'), 16)
+WHERE document_id !~ '_chunk_[0-9a-f]{16}$';
+
+DELETE FROM rag_chunks a USING rag_chunks b
+WHERE a.user_id = b.user_id AND a.document_id = b.document_id
+  AND a.chunk_text = b.chunk_text AND a.id > b.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS rag_chunks_user_document_idx
+  ON rag_chunks (user_id, document_id);
@@ -0,0 +1,8 @@
+-- Compact codes for the coarse search path: int8 scalar quantization with a
+-- per-row scale (4x smaller than float32) and 1-bit sign codes (32x smaller)
+ALTER TABLE rag_chunks
+  ADD COLUMN IF NOT EXISTS embedding_int8 BYTEA,
+  ADD COLUMN IF NOT EXISTS embedding_scale REAL,
+  ADD COLUMN IF NOT EXISTS embedding_bits BIT(768);
+
+-- Existing rows are filled by backend/scripts/migrate_pgvector.py --quantized
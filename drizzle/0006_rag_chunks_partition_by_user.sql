@@ -0,0 +1,56 @@
+-- One LIST partition of rag_chunks per user, plus a default partition, so a
+-- user's reindex, deletes and searches never scan other users' rows. The
+-- primary key must contain the partition key, so it becomes (user_id, id).
+-- backend/scripts/migrate_pgvector.py --partition runs the same statement.
+DO $$
+DECLARE
+  tenant integer;
+  id_sequence text;
+  had_user_fk boolean;
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'rag_chunks'::regclass) THEN
+    RETURN;
+  END IF;
+  id_sequence := pg_get_serial_sequence('rag_chunks', 'id');
+  had_user_fk := EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'rag_chunks_user_id_users_id_fk');
+
+  ALTER TABLE rag_chunks RENAME TO rag_chunks_unpartitioned;
+  ALTER TABLE rag_chunks_unpartitioned DROP CONSTRAINT IF EXISTS rag_chunks_pkey;
+  ALTER TABLE rag_chunks_unpartitioned DROP CONSTRAINT IF EXISTS rag_chunks_user_id_users_id_fk;
+  DROP INDEX IF EXISTS rag_chunks_embedding_idx;
+  DROP INDEX IF EXISTS rag_chunks_user_document_idx;
+
+  CREATE TABLE rag_chunks (
+    LIKE rag_chunks_unpartitioned INCLUDING DEFAULTS,
+    PRIMARY KEY (user_id, id)
+  ) PARTITION BY LIST (user_id);
+  CREATE TABLE rag_chunks_default PARTITION OF rag_chunks DEFAULT;
+  FOR tenant IN SELECT DISTINCT user_id FROM rag_chunks_unpartitioned LOOP
+    EXECUTE format('CREATE TABLE %I PARTITION OF rag_chunks FOR VALUES IN (%s)', 'rag_chunks_u' || tenant, tenant);
+  END LOOP;
+  INSERT INTO rag_chunks SELECT * FROM rag_chunks_unpartitioned;
+  IF id_sequence IS NOT NULL THEN
+    EXECUTE format('ALTER SEQUENCE %s OWNED BY rag_chunks.id', id_sequence);
+  END IF;
+  DROP TABLE rag_chunks_unpartitioned;
+
+  -- Legacy ids are content-addressed and exact duplicates dropped first, as in 0004
+  UPDATE rag_chunks
+  SET document_id = regexp_replace(document_id, '^(.*)_chunk_.*$', '\1') || '_chunk_'
+                    || left(encode(sha256(convert_to(chunk_text, 'UTF8')), 'hex'), 16)
+  WHERE document_id !~ '_chunk_[0-9a-f]{16}$';
+  DELETE FROM rag_chunks a USING rag_chunks b
+  WHERE a.user_id = b.user_id AND a.document_id = b.document_id
+    AND a.chunk_text = b.chunk_text AND a.id > b.id;
+
+  -- Indexes on the parent are created on every partition, present and future
+  CREATE UNIQUE INDEX rag_chunks_user_document_idx ON rag_chunks (user_id, document_id);
+  IF EXISTS (SELECT 1 FROM information_schema.columns
+             WHERE table_name = 'rag_chunks' AND column_name = 'embedding') THEN
+    CREATE INDEX rag_chunks_embedding_idx ON rag_chunks USING hnsw (embedding vector_cosine_ops);
+  END IF;
+  IF had_user_fk THEN
+    ALTER TABLE rag_chunks ADD CONSTRAINT rag_chunks_user_id_users_id_fk
+      FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE;
+  END IF;
+END $$;
@@ -0,0 +1,33 @@
+-- Queue of uploaded documents for backend/scripts/ingest_worker.py. The
+-- server inserts a row and returns; the insert trigger NOTIFYs idle workers,
+-- which claim jobs with SELECT ... FOR UPDATE SKIP LOCKED.
+CREATE TABLE IF NOT EXISTS rag_ingest_jobs (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    document_id VARCHAR(255) NOT NULL,
+    file_name VARCHAR(500) NOT NULL,
+    source_url VARCHAR(500),
+    payload BYTEA,
+    payload_bytes INTEGER NOT NULL DEFAULT 0,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    chunks_indexed INTEGER NOT NULL DEFAULT 0,
+    chunks_failed INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    worker VARCHAR(255),
+    created_at TIMESTAMP DEFAULT NOW(),
+    started_at TIMESTAMP,
+    heartbeat_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS rag_ingest_jobs_status_idx ON rag_ingest_jobs (status, id);
+CREATE INDEX IF NOT EXISTS rag_ingest_jobs_user_idx ON rag_ingest_jobs (user_id, created_at);
+CREATE OR REPLACE FUNCTION rag_ingest_jobs_notify() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('rag_ingest_jobs', NEW.id::text);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS rag_ingest_jobs_notify ON rag_ingest_jobs;
+CREATE TRIGGER rag_ingest_jobs_notify AFTER INSERT ON rag_ingest_jobs
+    FOR EACH ROW EXECUTE FUNCTION rag_ingest_jobs_notify();
@@ -0,0 +1,13 @@
+-- Top-k chunks of the canonical sermon themes and passages, precomputed by
+-- backend/scripts/query_neighbors.py after indexing. The server looks a
+-- request up by its normalized text before embedding it.
+CREATE TABLE IF NOT EXISTS rag_query_neighbors (
+    query_key VARCHAR(500) PRIMARY KEY,
+    query_text TEXT NOT NULL,
+    kind VARCHAR(20) NOT NULL,
+    model VARCHAR(255) NOT NULL,
+    query_embedding TEXT NOT NULL,
+    neighbors JSONB NOT NULL,
+    snapshot_version VARCHAR(64) NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
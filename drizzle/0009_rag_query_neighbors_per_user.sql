@@ -0,0 +1,17 @@
+-- Precomputed neighbours are per user: a user's catalog themes must only
+-- ever return that user's chunks. The table holds derived data only, so it
+-- is rebuilt keyed by (user_id, query_key); backend/scripts/query_neighbors.py
+-- refills it on its next run.
+DROP TABLE IF EXISTS rag_query_neighbors;
+CREATE TABLE rag_query_neighbors (
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    query_key VARCHAR(500) NOT NULL,
+    query_text TEXT NOT NULL,
+    kind VARCHAR(20) NOT NULL,
+    model VARCHAR(255) NOT NULL,
+    query_embedding TEXT NOT NULL,
+    neighbors JSONB NOT NULL,
+    snapshot_version VARCHAR(64) NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, query_key)
+);
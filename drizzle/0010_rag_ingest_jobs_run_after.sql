@@ -0,0 +1,4 @@
+-- A failed ingest job is requeued with a backoff instead of being claimed
+-- again at once: backend/scripts/ingest_worker.py sets run_after and only
+-- claims queued jobs whose run_after has passed.
+ALTER TABLE rag_ingest_jobs ADD COLUMN IF NOT EXISTS run_after TIMESTAMP DEFAULT NOW();
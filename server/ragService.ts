@@ -1,7 +1,7 @@
 import { GoogleGenerativeAI } from '@google/generative-ai';
 import { db } from './db';
-import { ragChunks } from '@shared/schema';
-import { eq } from 'drizzle-orm';
+import { ragChunks, ragIngestJobs, ragQueryNeighbors } from '@shared/schema';
+import { and, eq, cosineDistance, desc, sql } from 'drizzle-orm';
 
 const genAI = new GoogleGenerativeAI(process.env.GEMINI_API_KEY!);
 
@@ -11,6 +11,24 @@ interface SearchResult {
   sourceUrl?: string;
 }
 
+interface PrecomputedNeighbor {
+  id: string;
+  text: string;
+  source?: string | null;
+  score: number;
+}
+
+// Same key as normalize_query_key in backend/scripts/query_neighbors.py
+export function normalizeQueryKey(query: string): string {
+  return query
+    .normalize('NFKD')
+    .replace(/[\u0300-\u036f]/g, '')
+    .toLowerCase()
+    .replace(/[^a-z0-9]+/g, ' ')
+    .trim()
+    .substring(0, 500);
+}
+
 class RagService {
   private async generateEmbedding(text: string): Promise<number[]> {
     try {
@@ -139,6 +157,7 @@ class RagService {
             documentId: `${documentId}_chunk_${i}`,
             chunkText: chunk,
             embeddingVector: JSON.stringify(embedding),
+            embedding: embedding,
             sourceUrl: sourceUrl || null,
             pageNumber: i + 1,
             userId: userId
@@ -187,36 +206,24 @@ class RagService {
     }
   }
 
-  async searchSimilarChunks(query: string, limit: number = 5): Promise<SearchResult[]> {
+  // Only the given user's chunks are searched
+  async searchSimilarChunks(userId: number, query: string, limit: number = 5): Promise<SearchResult[]> {
     try {
-      console.log(`[RAG] Searching for: "${query}" with limit: ${limit}`);
+      console.log(`[RAG] Searching for: "${query}" with limit: ${limit} for user: ${userId}`);
       const queryEmbedding = await this.generateEmbedding(query);
 
-      // Get more chunks for better search results
-      const allChunks = await db.select().from(ragChunks).limit(500);
-      console.log(`[RAG] Found ${allChunks.length} chunks in database`);
-
-      const results: SearchResult[] = [];
-
-      for (const chunk of allChunks) {
-        try {
-          const chunkEmbedding = JSON.parse(chunk.embeddingVector);
-          const similarity = this.cosineSimilarity(queryEmbedding, chunkEmbedding);
-
-          // Only include chunks with reasonable similarity
-          if (similarity > 0.3) {
-            results.push({
-              chunkText: chunk.chunkText,
-              similarity: similarity,
-              sourceUrl: chunk.sourceUrl || undefined
-            });
-          }
-        } catch (error) {
-          console.error('[RAG] Error processing chunk:', error);
-        }
+      let candidates: SearchResult[];
+      try {
+        candidates = await this.searchByVectorIndex(userId, queryEmbedding, limit);
+      } catch (error: any) {
+        // Databases without the pgvector column still work, just slowly
+        console.error('[RAG] pgvector search unavailable, falling back to JSON scan:', error.message);
+        candidates = await this.searchByJsonScan(userId, queryEmbedding);
       }
 
-      const sortedResults = results
+      // Only include chunks with reasonable similarity
+      const sortedResults = candidates
+        .filter(result => result.similarity > 0.3)
         .sort((a, b) => b.similarity - a.similarity)
         .slice(0, limit);
       
@@ -228,6 +235,49 @@ class RagService {
     }
   }
 
+  // Top-k runs inside Postgres on the HNSW index, within the user's partition
+  private async searchByVectorIndex(userId: number, queryEmbedding: number[], limit: number): Promise<SearchResult[]> {
+    const distance = cosineDistance(ragChunks.embedding, queryEmbedding);
+    const rows = await db.select({
+      chunkText: ragChunks.chunkText,
+      sourceUrl: ragChunks.sourceUrl,
+      similarity: sql<number>`1 - (${distance})`,
+    })
+      .from(ragChunks)
+      .where(eq(ragChunks.userId, userId))
+      .orderBy(distance)
+      .limit(limit);
+
+    return rows.map(row => ({
+      chunkText: row.chunkText,
+      similarity: Number(row.similarity),
+      sourceUrl: row.sourceUrl || undefined
+    }));
+  }
+
+  private async searchByJsonScan(userId: number, queryEmbedding: number[]): Promise<SearchResult[]> {
+    // Get more chunks for better search results
+    const allChunks = await db.select().from(ragChunks).where(eq(ragChunks.userId, userId)).limit(500);
+    console.log(`[RAG] Found ${allChunks.length} chunks in database`);
+
+    const results: SearchResult[] = [];
+
+    for (const chunk of allChunks) {
+      try {
+        const chunkEmbedding = JSON.parse(chunk.embeddingVector);
+        results.push({
+          chunkText: chunk.chunkText,
+          similarity: this.cosineSimilarity(queryEmbedding, chunkEmbedding),
+          sourceUrl: chunk.sourceUrl || undefined
+        });
+      } catch (error) {
+        console.error('[RAG] Error processing chunk:', error);
+      }
+    }
+
+    return results;
+  }
+
   private cosineSimilarity(a: number[], b: number[]): number {
     if (a.length !== b.length) return 0;
     
@@ -244,13 +294,45 @@ class RagService {
     return dotProduct / (Math.sqrt(normA) * Math.sqrt(normB));
   }
 
+  // The user's neighbours precomputed for a catalog theme or passage: one
+  // primary-key lookup instead of an embedding call and a similarity scan
+  async lookupPrecomputed(userId: number, query: string, limit: number = 5): Promise<SearchResult[] | null> {
+    const key = normalizeQueryKey(query);
+    if (!key) return null;
+    try {
+      const [row] = await db.select({ neighbors: ragQueryNeighbors.neighbors })
+        .from(ragQueryNeighbors)
+        .where(and(eq(ragQueryNeighbors.userId, userId), eq(ragQueryNeighbors.queryKey, key)))
+        .limit(1);
+      if (!row) return null;
+      return (row.neighbors as PrecomputedNeighbor[])
+        .filter(neighbor => neighbor.score > 0.3)
+        .slice(0, limit)
+        .map(neighbor => ({
+          chunkText: neighbor.text,
+          similarity: neighbor.score,
+          sourceUrl: neighbor.source || undefined
+        }));
+    } catch (error: any) {
+      // The table only exists once query_neighbors.py has run
+      console.error('[RAG] Precomputed neighbours unavailable:', error.message);
+      return null;
+    }
+  }
+
   async getEnhancedContext(userId: number, theme: string, additionalContext: string): Promise<string> {
     try {
       console.log(`[RAG] Getting enhanced context for user ${userId}, theme: ${theme}`);
       
       // Search for relevant content using the theme and additional context
       const searchQuery = `${theme} ${additionalContext}`.trim();
-      const relevantChunks = await this.searchSimilarChunks(searchQuery, 8);
+      // Requests that are exactly a catalog theme or passage are answered from the
+      // precomputed table; any additional context changes the key and goes to search
+      const precomputed = await this.lookupPrecomputed(userId, searchQuery, 8);
+      if (precomputed) {
+        console.log(`[RAG] Using precomputed neighbours (${precomputed.length}) for: "${searchQuery}"`);
+      }
+      const relevantChunks = precomputed ?? await this.searchSimilarChunks(userId, searchQuery, 8);
       
       if (relevantChunks.length === 0) {
         console.log('[RAG] No relevant chunks found');
@@ -272,6 +354,42 @@ class RagService {
     }
   }
 
+  // Queues a document for backend/scripts/ingest_worker.py, which extracts,
+  // chunks and embeds it in the background; returns the job id at once
+  async enqueueDocument(userId: number, documentId: string, fileName: string, content: Buffer, sourceUrl?: string): Promise<number> {
+    const [job] = await db.insert(ragIngestJobs).values({
+      userId,
+      documentId,
+      fileName,
+      sourceUrl: sourceUrl || null,
+      payload: content,
+      payloadBytes: content.length,
+    }).returning({ id: ragIngestJobs.id });
+    console.log(`[RAG] Queued ${fileName} (${content.length} bytes) as job ${job.id} for user: ${userId}`);
+    return job.id;
+  }
+
+  async getUserJobs(userId: number, limit: number = 50) {
+    return db.select({
+      id: ragIngestJobs.id,
+      documentId: ragIngestJobs.documentId,
+      fileName: ragIngestJobs.fileName,
+      payloadBytes: ragIngestJobs.payloadBytes,
+      status: ragIngestJobs.status,
+      attempts: ragIngestJobs.attempts,
+      chunksIndexed: ragIngestJobs.chunksIndexed,
+      chunksFailed: ragIngestJobs.chunksFailed,
+      error: ragIngestJobs.error,
+      createdAt: ragIngestJobs.createdAt,
+      startedAt: ragIngestJobs.startedAt,
+      finishedAt: ragIngestJobs.finishedAt,
+    })
+      .from(ragIngestJobs)
+      .where(eq(ragIngestJobs.userId, userId))
+      .orderBy(desc(ragIngestJobs.id))
+      .limit(limit);
+  }
+
   async getUserDocumentStats(userId: number): Promise<{ documentCount: number; chunkCount: number }> {
     try {
       const chunks = await db.select().from(ragChunks).where(eq(ragChunks.userId, userId));
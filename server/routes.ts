@@ -420,10 +420,10 @@ Retorne APENAS o JSON, sem texto adicional antes ou depois.`;
 };
 
 // RAG helper function
-const retrieve_relevant_chunks = async (query_text: string, num_results: number = 3): Promise<string[]> => {
+const retrieve_relevant_chunks = async (userId: number, query_text: string, num_results: number = 3): Promise<string[]> => {
   try {
     // Use the RAG service instead of direct ChromaDB access
-    const chunks = await ragService.searchSimilarChunks(query_text, num_results);
+    const chunks = await ragService.searchSimilarChunks(userId, query_text, num_results);
     return chunks.map(chunk => chunk.chunkText);
   } catch (error) {
     console.error('Error retrieving chunks:', error);
@@ -1096,27 +1096,27 @@ export async function registerRoutes(app: Express): Promise<Server> {
         return res.status(400).json({ message: 'Nenhum documento foi enviado' });
       }
 
-      let documentsProcessed = 0;
+      const jobs: { jobId: number; fileName: string }[] = [];
       const errors: string[] = [];
 
+      // Documents are indexed in the background by backend/scripts/ingest_worker.py,
+      // so the request returns at once whatever the file size
       for (const file of files) {
         try {
           const documentId = `doc_${userId}_${Date.now()}_${Math.random().toString(36).substr(2, 9)}`;
-          const text = file.buffer.toString('utf-8');
           
           // Save document to Object Storage first (backup)
           try {
             const backupKey = `rag-backup/${userId}/${documentId}-${file.originalname}`;
-            await objectStorage.client.uploadFromText(backupKey, text);
+            await objectStorage.client.uploadFromText(backupKey, file.buffer.toString('utf-8'));
             console.log(`RAG document backed up to Object Storage: ${backupKey}`);
           } catch (storageError) {
             console.error('Object Storage backup failed:', storageError);
             // Continue - backup failure shouldn't stop RAG indexing
           }
           
-          // Store document in RAG service (unchanged)
-          await ragService.storeDocument(userId, documentId, text, file.originalname);
-          documentsProcessed++;
+          const jobId = await ragService.enqueueDocument(userId, documentId, file.originalname, file.buffer, file.originalname);
+          jobs.push({ jobId, fileName: file.originalname });
         } catch (error: any) {
           errors.push(`Erro ao processar ${file.originalname}: ${error.message}`);
         }
@@ -1124,9 +1124,10 @@ export async function registerRoutes(app: Express): Promise<Server> {
 
       const stats = await ragService.getUserDocumentStats(userId);
       
-      res.json({
-        message: `${documentsProcessed} documento(s) processado(s) com sucesso`,
-        documentsProcessed,
+      res.status(202).json({
+        message: `${jobs.length} documento(s) na fila para indexação`,
+        documentsQueued: jobs.length,
+        jobs,
         errors: errors.length > 0 ? errors : undefined,
         stats
       });
@@ -1136,6 +1137,18 @@ export async function registerRoutes(app: Express): Promise<Server> {
     }
   });
 
+  // RAG ingestion job status route
+  app.get('/api/rag/jobs', authenticateToken, async (req: AuthRequest, res) => {
+    try {
+      const userId = req.user!.id;
+      const jobs = await ragService.getUserJobs(userId);
+      res.json({ jobs });
+    } catch (error: any) {
+      console.error('Erro ao buscar tarefas de indexação RAG:', error);
+      res.status(500).json({ message: 'Falha ao recuperar tarefas de indexação' });
+    }
+  });
+
   // RAG document statistics route
   app.get('/api/rag/stats', authenticateToken, async (req: AuthRequest, res) => {
     try {
@@ -1379,22 +1392,10 @@ export async function registerRoutes(app: Express): Promise<Server> {
       }
 
       const results = [];
-      const maxFileSize = 5 * 1024 * 1024; // 5MB limit per file
 
       for (const file of files) {
         console.log(`[BulkIndex] Processing file: ${file.originalname} (${file.size} bytes, ${file.mimetype})`);
         try {
-          // Check file size limit
-          if (file.size > maxFileSize) {
-            console.log(`[BulkIndex] File too large: ${file.size} bytes`);
-            results.push({
-              success: false,
-              fileName: file.originalname,
-              message: `Arquivo muito grande (${Math.round(file.size / 1024 / 1024)}MB). Limite: 5MB`
-            });
-            continue;
-          }
-
           // Validate file type
           const allowedTypes = ['.txt', '.pdf', '.docx', '.md'];
           const fileExt = file.originalname.toLowerCase().substring(file.originalname.lastIndexOf('.'));
@@ -1411,114 +1412,51 @@ export async function registerRoutes(app: Express): Promise<Server> {
             continue;
           }
 
-          // Extract text content based on file type
-          let fileContent: string;
-          
-          try {
-            if (fileExt === '.txt' || fileExt === '.md') {
-              fileContent = file.buffer.toString('utf-8');
-            } else if (fileExt === '.pdf') {
-              // Para PDFs, tentar extrair texto limpo removendo caracteres de controle
-              const rawText = file.buffer.toString('latin1'); // Use latin1 para preservar bytes
-              // Remove caracteres nulos e de controle que causam problemas no PostgreSQL
-              fileContent = rawText
-                .replace(/\x00/g, '') // Remove null bytes
-                .replace(/[\x01-\x08\x0B\x0C\x0E-\x1F\x7F]/g, ' ') // Remove outros caracteres de controle
-                .replace(/\s+/g, ' ') // Normaliza espaços
-                .trim();
-              
-              // Verificar se conseguimos extrair texto útil
-              if (fileContent.length < 100 || fileContent.split(' ').length < 10) {
-                results.push({
-                  success: false,
-                  fileName: file.originalname,
-                  message: 'PDF não contém texto extraível ou está corrompido. Use um arquivo de texto.'
-                });
-                continue;
-              }
-            } else if (fileExt === '.docx') {
-              // Para DOCX, usar latin1 e limpar
-              const rawText = file.buffer.toString('latin1');
-              fileContent = rawText
-                .replace(/\x00/g, '')
-                .replace(/[\x01-\x08\x0B\x0C\x0E-\x1F\x7F]/g, ' ')
-                .replace(/\s+/g, ' ')
-                .trim();
-            } else {
-              fileContent = file.buffer.toString('utf-8');
-            }
-          } catch (encodingError) {
-            console.error(`[BulkIndex] Encoding error for ${file.originalname}:`, encodingError);
-            results.push({
-              success: false,
-              fileName: file.originalname,
-              message: 'Erro de codificação. Para PDFs, converta para TXT primeiro.'
-            });
-            continue;
-          }
-
-          // Validate content
-          if (!fileContent.trim() || fileContent.trim().length < 50) {
+          if (file.size === 0) {
             results.push({
               success: false,
               fileName: file.originalname,
-              message: 'Conteúdo do arquivo muito pequeno ou vazio'
+              message: 'Arquivo vazio'
             });
             continue;
           }
 
           const documentId = `admin_bulk_${file.originalname.replace(/[^a-zA-Z0-9]/g, '_')}_${Date.now()}`;
           
-          console.log(`[BulkIndex] Storing document: ${documentId} (${fileContent.trim().length} characters)`);
-          
-          // Add timeout wrapper for document storage - aumentado para 3 minutos
-          const storeWithTimeout = new Promise((resolve, reject) => {
-            const timeout = setTimeout(() => {
-              reject(new Error('Timeout: Processamento demorou mais que 3 minutos. Arquivo muito grande ou complexo.'));
-            }, 180000); // 3 minute timeout para arquivos grandes
-
-            ragService.storeDocument(
-              adminUserId, 
-              documentId, 
-              fileContent.trim(), 
-              `bulk-upload:${file.originalname}`
-            ).then(resolve).catch(reject).finally(() => clearTimeout(timeout));
-          });
-
-          await storeWithTimeout;
-
-          console.log(`[BulkIndex] Successfully indexed: ${file.originalname}`);
+          // The worker (backend/scripts/ingest_worker.py) extracts PDF and DOCX text
+          // itself and has no time limit, so the raw file is queued as is
+          const jobId = await ragService.enqueueDocument(
+            adminUserId,
+            documentId,
+            file.originalname,
+            file.buffer,
+            `bulk-upload:${file.originalname}`
+          );
+
+          console.log(`[BulkIndex] Queued ${file.originalname} as job ${jobId}`);
           results.push({
             success: true,
             fileName: file.originalname,
-            message: 'Indexado com sucesso'
+            jobId,
+            message: 'Na fila para indexação'
           });
 
         } catch (fileError: any) {
-          console.error(`[BulkIndex] Error processing file ${file.originalname}:`, {
+          console.error(`[BulkIndex] Error queueing file ${file.originalname}:`, {
             error: fileError.message,
             stack: fileError.stack?.substring(0, 200)
           });
           
-          let errorMessage = 'Erro durante indexação';
-          if (fileError.message.includes('heap out of memory')) {
-            errorMessage = 'Arquivo muito grande para processamento. Tente um arquivo menor.';
-          } else if (fileError.message.includes('Timeout')) {
-            errorMessage = 'Processamento demorou muito. Tente um arquivo menor.';
-          } else if (fileError.message) {
-            errorMessage = fileError.message;
-          }
-          
           results.push({
             success: false,
             fileName: file.originalname,
-            message: errorMessage
+            message: fileError.message || 'Erro ao enfileirar o arquivo'
           });
         }
       }
 
       const successCount = results.filter(r => r.success).length;
-      console.log(`[BulkIndex] Bulk indexing completed. Successful: ${successCount}/${results.length}`);
+      console.log(`[BulkIndex] Bulk upload completed. Queued: ${successCount}/${results.length}`);
 
       res.json({
         message: 'Processamento de lote concluído',
@@ -1,5 +1,5 @@
 
-import { pgTable, text, serial, integer, boolean, timestamp, jsonb, varchar, index } from "drizzle-orm/pg-core";
+import { pgTable, text, serial, integer, boolean, timestamp, jsonb, varchar, index, uniqueIndex, primaryKey, vector, bit, real, customType } from "drizzle-orm/pg-core";
 import { createInsertSchema } from "drizzle-zod";
 import { z } from "zod";
 
@@ -65,17 +65,79 @@ export const passwordResetTokens = pgTable("password_reset_tokens", {
   createdAt: timestamp("created_at").defaultNow(),
 });
 
+const bytea = customType<{ data: Buffer }>({
+  dataType() {
+    return "bytea";
+  },
+});
+
 // RAG chunks table for storing document embeddings
+// LIST-partitioned by user_id (drizzle/0006), one partition per user
 export const ragChunks = pgTable("rag_chunks", {
-  id: serial("id").primaryKey(),
+  id: serial("id").notNull(),
   documentId: varchar("document_id", { length: 255 }).notNull(),
   chunkText: text("chunk_text").notNull(),
   embeddingVector: text("embedding_vector").notNull(), // JSON string of float array
+  embedding: vector("embedding", { dimensions: 768 }), // pgvector copy used for top-k search
+  embeddingInt8: bytea("embedding_int8"), // int8 codes of the normalized vector
+  embeddingScale: real("embedding_scale"), // multiply the int8 codes by this to get the vector back
+  embeddingBits: bit("embedding_bits", { dimensions: 768 }), // sign bits for Hamming pre-filtering
   sourceUrl: varchar("source_url", { length: 500 }),
   pageNumber: integer("page_number"),
   userId: integer("user_id").notNull().references(() => users.id, { onDelete: "cascade" }),
   createdAt: timestamp("created_at").defaultNow(),
-});
+}, (table) => [
+  // A partitioned table's primary key has to include the partition key
+  primaryKey({ name: "rag_chunks_pkey", columns: [table.userId, table.id] }),
+  // Declared so drizzle-kit push does not drop it. Push would build it without CONCURRENTLY,
+  // locking writes: on a table with chunks, build it first with backend/scripts/migrate_pgvector.py
+  // (see drizzle/0003)
+  index("rag_chunks_embedding_idx").using("hnsw", table.embedding.op("vector_cosine_ops")),
+  // Chunk ids are content-addressed, so the Python indexer can upsert on them. Tables
+  // written by the old indexer need the id backfill in drizzle/0004 (or pg_bulk_writer's
+  // ensure_chunk_id_index) before this index can be created
+  uniqueIndex("rag_chunks_user_document_idx").on(table.userId, table.documentId),
+]);
+
+// Uploaded documents waiting for (or being indexed by) backend/scripts/ingest_worker.py
+export const ragIngestJobs = pgTable("rag_ingest_jobs", {
+  id: serial("id").primaryKey(),
+  userId: integer("user_id").notNull().references(() => users.id, { onDelete: "cascade" }),
+  documentId: varchar("document_id", { length: 255 }).notNull(),
+  fileName: varchar("file_name", { length: 500 }).notNull(),
+  sourceUrl: varchar("source_url", { length: 500 }),
+  payload: bytea("payload"), // the uploaded file, cleared once indexed
+  payloadBytes: integer("payload_bytes").notNull().default(0),
+  status: varchar("status", { length: 20 }).notNull().default("queued"), // queued | running | done | failed
+  attempts: integer("attempts").notNull().default(0),
+  chunksIndexed: integer("chunks_indexed").notNull().default(0),
+  chunksFailed: integer("chunks_failed").notNull().default(0),
+  error: text("error"),
+  worker: varchar("worker", { length: 255 }),
+  createdAt: timestamp("created_at").defaultNow(),
+  startedAt: timestamp("started_at"),
+  heartbeatAt: timestamp("heartbeat_at"),
+  finishedAt: timestamp("finished_at"),
+  runAfter: timestamp("run_after").defaultNow(), // not claimable before this; pushed back after each failed attempt
+}, (table) => [
+  index("rag_ingest_jobs_status_idx").on(table.status, table.id),
+  index("rag_ingest_jobs_user_idx").on(table.userId, table.createdAt),
+]);
+
+// Each user's neighbours of catalog themes and passages, precomputed by backend/scripts/query_neighbors.py
+export const ragQueryNeighbors = pgTable("rag_query_neighbors", {
+  userId: integer("user_id").notNull().references(() => users.id, { onDelete: "cascade" }),
+  queryKey: varchar("query_key", { length: 500 }).notNull(), // accent-folded, lower-case, single spaces
+  queryText: text("query_text").notNull(),
+  kind: varchar("kind", { length: 20 }).notNull(), // theme | passage
+  model: varchar("model", { length: 255 }).notNull(),
+  queryEmbedding: text("query_embedding").notNull(),
+  neighbors: jsonb("neighbors").notNull(), // [{ id, text, source, score }], best first
+  snapshotVersion: varchar("snapshot_version", { length: 64 }).notNull(),
+  updatedAt: timestamp("updated_at").defaultNow(),
+}, (table) => [
+  primaryKey({ name: "rag_query_neighbors_pkey", columns: [table.userId, table.queryKey] }),
+]);
 
 // Insert schemas with password validation
 export const insertUserSchema = createInsertSchema(users).omit({
@@ -167,6 +229,8 @@ export type PasswordResetToken = typeof passwordResetTokens.$inferSelect;
 export type InsertPasswordResetToken = z.infer<typeof insertPasswordResetTokenSchema>;
 export type RagChunk = typeof ragChunks.$inferSelect;
 export type InsertRagChunk = z.infer<typeof insertRagChunkSchema>;
+export type RagIngestJob = typeof ragIngestJobs.$inferSelect;
+export type RagQueryNeighbors = typeof ragQueryNeighbors.$inferSelect;
 
 export type LoginRequest = z.infer<typeof loginSchema>;
 export type PasswordResetRequest = z.infer<typeof passwordResetRequestSchema>;